@@ -1,6 +1,7 @@
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uvicorn
@@ -8,7 +9,9 @@ import json
 import asyncio
 from datetime import datetime, timedelta
 import uuid
+import hashlib
 import logging
+import os
 from contextlib import asynccontextmanager
 
 
@@ -19,29 +22,121 @@ from app.models.peer_support import PeerMatch, SupportGroup, Message
 from app.services.ai_service import AIService
 from app.services.auth_service import AuthService
 from app.services.emotion_service import EmotionService
+from app.services.emotion_repository import SQLAlchemyEmotionRepository, ColumnarEmotionRepository
 from app.services.peer_service import PeerSupportService
+from app.services.anonymized_export import FORMATS, DATA_TYPES
+from app.services.history_sync import decode_position
 from app.utils.websocket_manager import WebSocketManager
+from app.utils.message_bus import RedisMessageBus
+from app.utils.wal import WriteAheadLog
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Global instances
-ai_service = AIService()
-auth_service = AuthService()
-emotion_service = EmotionService()
-peer_service = PeerSupportService()
-websocket_manager = WebSocketManager()
+# Set WAL_DIR to make the in-memory stores survive restarts (write-ahead log
+# plus snapshots in that directory). Those stores belong to one process, so
+# WAL_DIR requires a single worker: startup fails when WEB_CONCURRENCY (the
+# worker count uvicorn and gunicorn read) is above 1, and the directory lock
+# stops any second process given the same directory.
+wal_dir = os.getenv("WAL_DIR")
+if wal_dir and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+    raise Exception("WAL_DIR needs a single worker process; unset it or run with one worker")
+wal = WriteAheadLog(wal_dir) if wal_dir else None
+# SENTIMENT_BACKEND is "keyword" (inline) or "sklearn"; SENTIMENT_WORKERS > 0
+# runs it in that many worker processes, and SENTIMENT_MODEL_PATH points the
+# sklearn backend at a trained model instead of the bootstrap one
+sentiment_model_path = os.getenv("SENTIMENT_MODEL_PATH")
+ai_service = AIService(
+    inference_backend=os.getenv("SENTIMENT_BACKEND", "keyword"),
+    inference_workers=int(os.getenv("SENTIMENT_WORKERS", "0")),
+    backend_options={"model_path": sentiment_model_path} if sentiment_model_path else None
+)
+auth_service = AuthService(
+    wal=wal,
+    # Deleted and deactivated users stop being offered as peer matches
+    on_user_removed=lambda user_id: peer_service.remove_user(user_id)
+)
+
+async def deliver_to_user(user_id: str, message: Dict[str, Any]) -> bool:
+    # Peer messages and their acks are pushed over the user's WebSocket
+    return await websocket_manager.send_to_user(user_id, {**message, "timestamp": datetime.utcnow().isoformat()})
+
+# PEER_MATCH_NPROBE trades peer matching recall for latency once the ANN index is built
+peer_service = PeerSupportService(
+    wal=wal,
+    user_lookup=auth_service.lookup_user,
+    match_nprobe=int(os.getenv("PEER_MATCH_NPROBE", "16")),
+    deliver=deliver_to_user,
+    wait_for_room=lambda user_id, slots: websocket_manager.wait_for_room(user_id, slots),
+    deliver_to_group=lambda member_ids, online_ids, message: websocket_manager.send_to_group(
+        member_ids, online_ids, {**message, "timestamp": datetime.utcnow().isoformat()}
+    )
+)
+# Set DATABASE_URL (e.g. postgresql+asyncpg://... or sqlite+aiosqlite:///./mindfulcampus.db)
+# to persist emotion data in a database instead
+database_url = os.getenv("DATABASE_URL")
+
+async def notify_hotspot(hotspot: Dict[str, Any]):
+    # Counselors get new hotspots as they are detected instead of on poll
+    await websocket_manager.broadcast_to_counselors({
+        "type": "hotspot_alert",
+        "data": hotspot,
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+# With several uvicorn workers (which rules out WAL_DIR), set REDIS_URL so
+# WebSocket delivery reaches sockets held by other workers and every worker's
+# campus counters, hotspots, insights and peer vectors see all analyses
+redis_url = os.getenv("REDIS_URL")
+if not redis_url and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+    raise Exception("Several worker processes need REDIS_URL to share deliveries and aggregates")
+emotion_service = EmotionService(
+    ai_service,
+    repository=SQLAlchemyEmotionRepository(database_url) if database_url else ColumnarEmotionRepository(wal),
+    major_lookup=auth_service.get_user_major,
+    on_hotspot=notify_hotspot,
+    # Keeps peer matching vectors current
+    on_analysis=peer_service.record_analysis,
+    # Shares what this worker ingests with the others (no-op without REDIS_URL)
+    on_observed=lambda kind, items: websocket_manager.publish_event(kind, items)
+)
+websocket_manager = WebSocketManager(
+    message_bus=RedisMessageBus(redis_url) if redis_url else None,
+    # Keeps group online counts (active_now) and fan-out targets live
+    on_presence=peer_service.set_presence,
+    # Analyses, alerts and interventions ingested by other workers
+    on_event=emotion_service.observe_remote
+)
+
+# Upper bound on texts accepted by /emotions/analyze-batch
+MAX_ANALYSIS_BATCH_SIZE = 100
+# Upper bound on records per /emotions/history page or delta
+MAX_HISTORY_PAGE_SIZE = 500
+# Upper bound on messages per peer or group conversation page
+MAX_MESSAGE_PAGE_SIZE = 200
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting MindfulCampus API...")
+    if wal:
+        await wal.open()
     await ai_service.initialize()
     logger.info("AI models loaded successfully")
+    await emotion_service.initialize()
+    peer_service.start()
+    await websocket_manager.start()
     yield
     # Shutdown
     logger.info("Shutting down MindfulCampus API...")
+    await websocket_manager.stop()
+    await peer_service.stop()
+    await emotion_service.close()
+    if wal:
+        await wal.close()
+    await ai_service.shutdown()
 
 app = FastAPI(
     title="MindfulCampus API",
@@ -113,13 +208,15 @@ async def refresh_token(refresh_token: str):
 async def analyze_emotion(
     text: str,
     platform: str = "general",
+    bypass_cache: bool = False,
     current_user: User = Depends(get_current_user)
 ):
     try:
         analysis = await emotion_service.analyze_text_emotion(
             user_id=current_user.id,
             text=text,
-            platform=platform
+            platform=platform,
+            bypass_cache=bypass_cache
         )
         
         # Trigger intervention if needed
@@ -141,12 +238,103 @@ async def analyze_emotion(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/emotions/analyze-batch")
+async def analyze_emotion_batch(
+    texts: List[str],
+    platform: str = "general",
+    bypass_cache: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    if len(texts) > MAX_ANALYSIS_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch size must be at most {MAX_ANALYSIS_BATCH_SIZE}")
+    
+    try:
+        analyses = await emotion_service.analyze_text_emotion_batch(
+            user_id=current_user.id,
+            texts=texts,
+            platform=platform,
+            bypass_cache=bypass_cache
+        )
+        
+        # Coalesce intervention decisions: at most one intervention and one
+        # WebSocket push per batch, driven by the most confident flagged text
+        flagged = [analysis for analysis in analyses if analysis.requires_intervention]
+        if flagged:
+            intervention = await emotion_service.trigger_intervention(
+                user_id=current_user.id,
+                emotion_analysis=max(flagged, key=lambda analysis: analysis.confidence)
+            )
+            await websocket_manager.send_to_user(
+                current_user.id,
+                {
+                    "type": "intervention",
+                    "data": intervention.dict()
+                }
+            )
+        
+        return analyses
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _conditional_json(request: Request, body: Dict[str, Any], version: str) -> Response:
+    """JSON response tagged with `version`, a short string that changes whenever the body
+    would; 304 when If-None-Match already has it, without serializing the body"""
+    etag = f'"{hashlib.sha256(version.encode()).hexdigest()[:32]}"'
+    # Weak comparison: W/"x" matches "x"
+    tags = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if etag in tags or "*" in tags:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(body, headers={"ETag": etag})
+
 @app.get("/emotions/history")
 async def get_emotion_history(
+    request: Request,
     days: int = 30,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    resolution: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
+    if limit is not None and not 0 < limit <= MAX_HISTORY_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_HISTORY_PAGE_SIZE}")
+    for token in (since, cursor):
+        if token:
+            try:
+                decode_position(token)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
+    
     try:
+        # Downsampled mood buckets for charts
+        if resolution:
+            return await emotion_service.get_user_mood_buckets(current_user.id, days=days, resolution=resolution)
+        
+        # Delta sync: only what was added after the client's last sync token
+        if since:
+            changes = await emotion_service.get_user_emotion_changes(
+                current_user.id,
+                since,
+                limit=limit or MAX_HISTORY_PAGE_SIZE
+            )
+            # Tokens pin the synced range, so these fields determine the items
+            return _conditional_json(request, changes, ":".join(map(str, (
+                current_user.id, since, changes['sync_token'], len(changes['items']),
+                changes['has_more'], changes.get('resync_from')
+            ))))
+        
+        # Keyset pagination, newest first
+        if limit is not None or cursor:
+            page = await emotion_service.get_user_emotion_page(
+                current_user.id,
+                days=days,
+                limit=limit or MAX_HISTORY_PAGE_SIZE,
+                cursor=cursor
+            )
+            return _conditional_json(request, page, ":".join(map(str, (
+                current_user.id, cursor, days, page['next_cursor'], page.get('sync_token'), len(page['items'])
+            ))))
+        
         history = await emotion_service.get_user_emotion_history(
             user_id=current_user.id,
             days=days
@@ -190,6 +378,7 @@ async def connect_with_peer(
     current_user: User = Depends(get_current_user)
 ):
     try:
+        # peer_id is the `id` of a card from /peer-support/matches (an opaque handle)
         connection = await peer_service.create_peer_connection(
             current_user.id,
             peer_id
@@ -221,18 +410,81 @@ async def join_support_group(
 async def get_peer_messages(
     peer_id: str,
     limit: int = 50,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
+    if limit < 1 or limit > MAX_MESSAGE_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_MESSAGE_PAGE_SIZE}")
     try:
         messages = await peer_service.get_peer_messages(
             current_user.id,
             peer_id,
-            limit
+            limit,
+            cursor
         )
         return messages
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/peer-support/messages/{peer_id}/read")
+async def mark_peer_messages_read(
+    peer_id: str,
+    seq: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        result = await peer_service.mark_peer_messages_read(current_user.id, peer_id, seq)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/peer-support/groups/{group_id}/messages")
+async def get_group_messages(
+    group_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if limit < 1 or limit > MAX_MESSAGE_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_MESSAGE_PAGE_SIZE}")
+    try:
+        messages = await peer_service.get_group_messages(current_user.id, group_id, limit, cursor)
+        return messages
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/peer-support/groups/{group_id}/messages")
+async def send_group_message(
+    group_id: str,
+    content: str,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        message = await peer_service.send_group_message(current_user.id, group_id, content)
+        return message
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/peer-support/groups/{group_id}/messages/read")
+async def mark_group_messages_read(
+    group_id: str,
+    seq: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        result = await peer_service.mark_group_messages_read(current_user.id, group_id, seq)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/peer-support/unread")
+async def get_unread_counts(current_user: User = Depends(get_current_user)):
+    try:
+        counts = await peer_service.get_unread_counts(current_user.id)
+        return counts
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Campus insights endpoints (for counselors/administrators)
 @app.get("/campus/insights")
 async def get_campus_insights(
@@ -265,28 +517,75 @@ async def get_risk_alerts(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 # WebSocket endpoints for real-time features
+def _socket_field(message_data: Dict[str, Any], name: str) -> str:
+    value = message_data.get(name)
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{name} is required")
+    return value
+
+def _socket_seq(message_data: Dict[str, Any], required: bool = True) -> Optional[int]:
+    seq = message_data.get("seq")
+    if seq is None and not required:
+        return None
+    if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+        raise ValueError("seq must be a non-negative integer")
+    return seq
+
+async def handle_socket_message(user_id: str, message_data: Dict[str, Any]):
+    """Handle one client message; raises ValueError for malformed ones"""
+    message_type = message_data.get("type")
+    if message_type == "ping":
+        await websocket_manager.send_to_user(user_id, {"type": "pong"})
+    elif message_type == "peer_message":
+        # Handle peer-to-peer messaging; stored, then pushed to the recipient
+        await peer_service.send_peer_message(
+            sender_id=user_id,
+            recipient_id=_socket_field(message_data, "recipient_id"),
+            content=_socket_field(message_data, "content"),
+            client_id=message_data.get("client_id")
+        )
+    elif message_type == "peer_message_ack":
+        # Client received messages from peer_id up to seq
+        await peer_service.acknowledge_peer_messages(user_id, _socket_field(message_data, "peer_id"), _socket_seq(message_data))
+    elif message_type == "peer_message_read":
+        await peer_service.mark_peer_messages_read(
+            user_id, _socket_field(message_data, "peer_id"), _socket_seq(message_data, required=False)
+        )
+
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str):
+async def websocket_endpoint(websocket: WebSocket, user_id: str, token: Optional[str] = None):
+    # Browsers can't set headers on a WebSocket handshake, so the access token comes as ?token=
+    try:
+        user = await auth_service.verify_token(token) if token else None
+    except Exception:
+        user = None
+    if user is None or user.id != user_id:
+        await websocket.close(code=1008)
+        return
+    
     await websocket_manager.connect(websocket, user_id)
     try:
+        # Catch up on peer messages sent while this user was offline
+        await peer_service.replay_peer_messages(user_id)
         while True:
             # Keep connection alive and handle incoming messages
             data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            # Handle different message types
-            if message_data.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
-            elif message_data.get("type") == "peer_message":
-                # Handle peer-to-peer messaging
-                await peer_service.send_peer_message(
-                    sender_id=user_id,
-                    recipient_id=message_data.get("recipient_id"),
-                    content=message_data.get("content")
-                )
-            
+            try:
+                message_data = json.loads(data)
+                if not isinstance(message_data, dict):
+                    raise ValueError("Message must be a JSON object")
+                await handle_socket_message(user_id, message_data)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                # Bad frames and service errors (e.g. messaging a blocked user) fail
+                # only that frame, not the connection
+                await websocket_manager.send_to_user(user_id, {"type": "error", "detail": str(e)})
     except WebSocketDisconnect:
-        await websocket_manager.disconnect(user_id)
+        pass
+    finally:
+        # Also runs when a handler fails, so no stale connection or presence is left behind
+        await websocket_manager.disconnect(user_id, websocket)
 
 # Intervention endpoints
 @app.get("/interventions/active")
@@ -381,8 +680,8 @@ async def get_social_media_impact(
 # Crisis intervention endpoints
 @app.post("/crisis/alert")
 async def trigger_crisis_alert(
-    severity: str = Field(..., regex="^(low|medium|high|critical)$"),
     description: str,
+    severity: str = Field(..., regex="^(low|medium|high|critical)$"),
     location: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
@@ -430,6 +729,7 @@ async def analyze_social_media_content(
     content: str,
     platform: str,
     interaction_time: float,
+    bypass_cache: bool = False,
     current_user: User = Depends(get_current_user)
 ):
     try:
@@ -437,7 +737,8 @@ async def analyze_social_media_content(
             url=url,
             content=content,
             platform=platform,
-            interaction_time=interaction_time
+            interaction_time=interaction_time,
+            bypass_cache=bypass_cache
         )
         
         # Store the analysis for the user
@@ -490,7 +791,14 @@ async def get_system_health(current_user: User = Depends(get_current_user)):
             "intervention_success_rate": await emotion_service.get_intervention_success_rate(),
             "system_load": await ai_service.get_system_load(),
             "database_status": "healthy",  # Would check actual DB status
-            "ai_model_status": ai_service.get_model_status()
+            "ai_model_status": ai_service.get_model_status(),
+            "sentiment_cache": ai_service.get_cache_stats(),
+            "auth_token_cache": auth_service.get_token_cache_stats(),
+            "emotion_write_buffer": emotion_service.get_write_buffer_stats(),
+            "hotspot_detector": emotion_service.get_hotspot_stats(),
+            "peer_matching": peer_service.get_matching_stats(),
+            "peer_messages": peer_service.get_message_stats(),
+            "write_ahead_log": wal.get_stats() if wal else None
         }
         
         return health_data
@@ -512,7 +820,11 @@ async def send_bulk_notification(
             target_group=target_group
         )
         
-        return {"sent_to": result["count"], "message": "Notification sent successfully"}
+        return {
+            "sent_to": result["count"],
+            "dropped": result["dropped"],
+            "message": "Notification sent successfully"
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -522,19 +834,36 @@ async def export_anonymized_data(
     start_date: datetime,
     end_date: datetime,
     data_type: str = "mood_trends",
+    format: str = "json",
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
+    if not current_user.is_admin and not current_user.is_researcher:
+        raise HTTPException(status_code=403, detail="Research access required")
+    if format != "json" and format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be json or one of {', '.join(FORMATS)}")
+    if data_type not in DATA_TYPES:
+        raise HTTPException(status_code=400, detail=f"data_type must be one of {', '.join(DATA_TYPES)}")
+    
     try:
-        if not current_user.is_admin and not current_user.is_researcher:
-            raise HTTPException(status_code=403, detail="Research access required")
+        if format == "json":
+            anonymized_data = await emotion_service.export_anonymized_data(
+                start_date=start_date,
+                end_date=end_date,
+                data_type=data_type
+            )
+            return anonymized_data
         
-        anonymized_data = await emotion_service.export_anonymized_data(
+        # ndjson/csv/columnar are streamed with chunked transfer; pass the
+        # last cursor seen to resume an interrupted export
+        chunks = await emotion_service.stream_anonymized_data(
             start_date=start_date,
             end_date=end_date,
-            data_type=data_type
+            data_type=data_type,
+            output_format=format,
+            cursor=cursor
         )
-        
-        return anonymized_data
+        return StreamingResponse(chunks, media_type=FORMATS[format])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
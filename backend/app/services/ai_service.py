@@ -1,66 +1,81 @@
-import asyncio
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import logging
 import random
 from datetime import datetime
+from app.services.inference import InferencePool
+from app.services.result_cache import ResultCache, text_cache_key
 
 logger = logging.getLogger(__name__)
 
 class AIService:
-    def __init__(self):
+    def __init__(self, inference_backend: str = "keyword", inference_workers: int = 0, backend_options: Optional[Dict[str, Any]] = None):
         self.models_loaded = False
         self.emotion_keywords = {
             'positive': ['happy', 'excited', 'grateful', 'amazing', 'wonderful', 'love', 'blessed', 'fantastic', 'awesome', 'great'],
-            'negative': ['sad', 'depressed', 'anxious', 'worried', 'stressed', 'hate', 'terrible', 'awful', 'horrible', 'devastated'],
-            'stress': ['overwhelmed', 'pressure', 'deadline', 'exam', 'finals', 'study', 'homework', 'project', 'assignment', 'busy']
+            'negative': ['sad', 'depressed', 'anxious', 'worried', 'stressed', 'hate', 'terrible', 'awful', 'horrible', 'devastated',
+                         "can't sleep", 'fed up', 'falling apart'],
+            'stress': ['overwhelmed', 'pressure', 'deadline', 'exam', 'finals', 'study', 'homework', 'project', 'assignment', 'busy',
+                       'due tomorrow', 'all-nighter', 'falling behind']
         }
+        # Sentiment models run behind a micro-batching queue; the keyword scorer
+        # is cheap enough to run inline, heavier backends need worker processes
+        self.inference_pool = InferencePool(
+            backend=inference_backend,
+            keywords=self.emotion_keywords,
+            backend_options=backend_options,
+            workers=inference_workers
+        )
+        # Sentiment results keyed by a hash of the normalized text, since
+        # extension users keep scoring the same feed posts
+        self.sentiment_cache = ResultCache()
 
     async def initialize(self):
-        """Initialize AI models (simulated for demo)"""
+        """Load the sentiment backend and start the inference pool"""
         logger.info("Initializing AI models...")
-        # Simulate model loading time
-        await asyncio.sleep(2)
+        await self.inference_pool.start()
         self.models_loaded = True
         logger.info("AI models loaded successfully")
 
+    async def shutdown(self):
+        """Stop the inference pool and its worker processes"""
+        self.models_loaded = False
+        await self.inference_pool.stop()
+
     def is_ready(self) -> bool:
         return self.models_loaded
 
-    async def analyze_sentiment(self, text: str) -> Dict[str, Any]:
+    async def analyze_sentiment(self, text: str, bypass_cache: bool = False) -> Dict[str, Any]:
         """Analyze sentiment of text"""
         if not self.models_loaded:
             raise Exception("AI models not loaded")
 
-        # Simple keyword-based analysis for demo
-        words = text.lower().split()
-        
-        positive_score = sum(1 for word in words if word in self.emotion_keywords['positive'])
-        negative_score = sum(1 for word in words if word in self.emotion_keywords['negative'])
-        stress_score = sum(1 for word in words if word in self.emotion_keywords['stress'])
-        
-        # Determine sentiment
-        if stress_score > 0 and stress_score >= positive_score:
-            label = 'stressed'
-            confidence = min(0.7 + stress_score * 0.1, 0.95)
-        elif negative_score > positive_score:
-            label = 'negative'
-            confidence = min(0.6 + negative_score * 0.1, 0.95)
-        elif positive_score > negative_score:
-            label = 'positive'
-            confidence = min(0.6 + positive_score * 0.1, 0.95)
-        else:
-            label = 'neutral'
-            confidence = 0.5
+        cache_key = text_cache_key(text)
+        if not bypass_cache:
+            cached = self.sentiment_cache.get(cache_key)
+            if cached is not None:
+                return cached
 
-        return {
-            'label': label,
-            'confidence': confidence,
-            'scores': {
-                'positive': positive_score,
-                'negative': negative_score,
-                'stress': stress_score
-            }
-        }
+        result = await self.inference_pool.predict(text)
+        self.sentiment_cache.set(cache_key, result)
+        return result
+
+    async def analyze_sentiment_batch(self, texts: List[str], bypass_cache: bool = False) -> List[Dict[str, Any]]:
+        """Analyze sentiment of several texts in one batch"""
+        if not self.models_loaded:
+            raise Exception("AI models not loaded")
+
+        cache_keys = [text_cache_key(text) for text in texts]
+        results = [None if bypass_cache else self.sentiment_cache.get(key) for key in cache_keys]
+
+        # Only send cache misses to the model
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            predictions = await self.inference_pool.predict_many([texts[index] for index in missing])
+            for index, prediction in zip(missing, predictions):
+                results[index] = prediction
+                self.sentiment_cache.set(cache_keys[index], prediction)
+
+        return results
 
     async def analyze_typing_patterns(self, keystroke_data: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Analyze typing patterns for emotional indicators"""
@@ -94,9 +109,9 @@ class AIService:
             }
         }
 
-    async def analyze_social_media_content(self, url: str, content: str, platform: str, interaction_time: float) -> Dict[str, Any]:
+    async def analyze_social_media_content(self, url: str, content: str, platform: str, interaction_time: float, bypass_cache: bool = False) -> Dict[str, Any]:
         """Analyze social media content for emotional impact"""
-        sentiment = await self.analyze_sentiment(content)
+        sentiment = await self.analyze_sentiment(content, bypass_cache=bypass_cache)
         
         # Simulate content impact analysis
         impact_score = random.uniform(0.3, 0.9)
@@ -162,13 +177,19 @@ class AIService:
 
     async def get_system_load(self) -> Dict[str, Any]:
         """Get current system load metrics"""
+        inference_stats = self.inference_pool.get_stats()
         return {
             'cpu_usage': random.uniform(20, 80),
             'memory_usage': random.uniform(30, 70),
-            'active_analyses': random.randint(50, 200),
-            'queue_length': random.randint(0, 10)
+            'active_analyses': inference_stats['active_batches'],
+            'queue_length': inference_stats['queue_length'],
+            'inference': inference_stats
         }
 
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get sentiment result cache counters"""
+        return self.sentiment_cache.get_stats()
+
     def get_model_status(self) -> Dict[str, str]:
         """Get status of AI models"""
         return {
@@ -0,0 +1,225 @@
+import io
+import csv
+import json
+import base64
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+from app.models.emotion import EmotionAnalysis, MoodType
+from app.services.campus_aggregates import MOOD_SCORES
+from app.services.columnar_store import to_epoch_us, from_epoch_us
+
+# Records per output batch (and per resume checkpoint)
+EXPORT_BATCH_ROWS = 1000
+MOODS = [mood.value for mood in MoodType]
+
+# data_type -> output fields
+DATA_TYPES = {
+    "raw": ["mood", "confidence", "platform", "timestamp", "requires_intervention"],
+    "mood_trends": ["date", "analyses", *MOODS, "average_mood_score"],
+    "intervention_rates": ["date", "analyses", "requires_intervention", "intervention_rate"],
+    "platform_usage": ["platform", "analyses", *MOODS, "intervention_rate"]
+}
+# format -> media type
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "columnar": "application/x-ndjson"
+}
+
+# A batch of output rows and the cursor to resume after them (None when the
+# rows can't be resumed from, e.g. the single platform_usage batch)
+RowBatch = Tuple[List[Dict[str, Any]], Optional[str]]
+
+
+def encode_cursor(data_type: str, timestamp: datetime, skip: int) -> str:
+    """Resume point: the first analysis at or after `timestamp`, skipping `skip` at exactly `timestamp`"""
+    return base64.urlsafe_b64encode(f"{data_type}:{to_epoch_us(timestamp)}:{skip}".encode()).decode()
+
+
+def decode_cursor(cursor: str, data_type: str) -> Tuple[datetime, int]:
+    try:
+        cursor_type, timestamp, skip = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        position = from_epoch_us(int(timestamp)), int(skip)
+    except ValueError:
+        raise Exception("Invalid export cursor")
+    if cursor_type != data_type:
+        raise Exception(f"Cursor belongs to a {cursor_type} export")
+    return position
+
+
+def anonymize(analysis: EmotionAnalysis) -> Dict[str, Any]:
+    # Note: user_id and text are NOT included for privacy
+    return {
+        'mood': analysis.mood.value,
+        'confidence': analysis.confidence,
+        'platform': analysis.platform,
+        'timestamp': analysis.timestamp.isoformat(),
+        'requires_intervention': analysis.requires_intervention
+    }
+
+
+async def _resume(batches: AsyncIterator[List[EmotionAnalysis]], timestamp: datetime,
+                  skip: int) -> AsyncIterator[List[EmotionAnalysis]]:
+    """Drop the first `skip` analyses at exactly `timestamp` (already exported)"""
+    async for batch in batches:
+        if skip:
+            position = 0
+            while position < len(batch) and position < skip and batch[position].timestamp == timestamp:
+                position += 1
+            # Keep skipping in the next batch only if this one ran out first
+            skip = skip - position if position == len(batch) else 0
+            batch = batch[position:]
+        if batch:
+            yield batch
+
+
+async def _records(batches: AsyncIterator[List[EmotionAnalysis]], data_type: str, timestamp: datetime,
+                   skip: int) -> AsyncIterator[RowBatch]:
+    """Anonymized records in EXPORT_BATCH_ROWS batches, each with its resume cursor"""
+    # Position after the last exported analysis: its timestamp and how many
+    # analyses with that timestamp have been exported
+    last_timestamp, at_last = timestamp, skip
+    async for batch in batches:
+        for offset in range(0, len(batch), EXPORT_BATCH_ROWS):
+            part = batch[offset:offset + EXPORT_BATCH_ROWS]
+            for analysis in part:
+                if analysis.timestamp == last_timestamp:
+                    at_last += 1
+                else:
+                    last_timestamp, at_last = analysis.timestamp, 1
+            yield [anonymize(analysis) for analysis in part], encode_cursor(data_type, last_timestamp, at_last)
+
+
+class _Totals:
+    __slots__ = ("analyses", "moods", "score_sum", "interventions")
+
+    def __init__(self):
+        self.analyses = 0
+        self.moods = dict.fromkeys(MOODS, 0)
+        self.score_sum = 0.0
+        self.interventions = 0
+
+    def add(self, analysis: EmotionAnalysis):
+        self.analyses += 1
+        self.moods[analysis.mood.value] += 1
+        self.score_sum += MOOD_SCORES[analysis.mood]
+        self.interventions += analysis.requires_intervention
+
+    @property
+    def intervention_rate(self) -> float:
+        return round(self.interventions / self.analyses, 4) if self.analyses else 0.0
+
+
+def _daily_row(data_type: str, day, totals: _Totals) -> Dict[str, Any]:
+    if data_type == "mood_trends":
+        return {
+            'date': day.isoformat(),
+            'analyses': totals.analyses,
+            **totals.moods,
+            'average_mood_score': round(totals.score_sum / totals.analyses, 2)
+        }
+    return {
+        'date': day.isoformat(),
+        'analyses': totals.analyses,
+        'requires_intervention': totals.interventions,
+        'intervention_rate': totals.intervention_rate
+    }
+
+
+async def _daily(batches: AsyncIterator[List[EmotionAnalysis]], data_type: str) -> AsyncIterator[RowBatch]:
+    """One row per day, emitted as soon as the day is complete"""
+    day, totals = None, _Totals()
+    async for batch in batches:
+        for analysis in batch:
+            analysis_day = analysis.timestamp.date()
+            if analysis_day != day:
+                if day is not None:
+                    # Resuming from the start of the new day repeats nothing
+                    next_day = datetime.combine(analysis_day, datetime.min.time())
+                    yield [_daily_row(data_type, day, totals)], encode_cursor(data_type, next_day, 0)
+                day, totals = analysis_day, _Totals()
+            totals.add(analysis)
+    if day is not None:
+        yield [_daily_row(data_type, day, totals)], None
+
+
+async def _platforms(batches: AsyncIterator[List[EmotionAnalysis]]) -> AsyncIterator[RowBatch]:
+    """One row per platform, after the whole range"""
+    platforms: Dict[str, _Totals] = {}
+    async for batch in batches:
+        for analysis in batch:
+            totals = platforms.get(analysis.platform)
+            if totals is None:
+                platforms[analysis.platform] = totals = _Totals()
+            totals.add(analysis)
+    yield [
+        {'platform': platform, 'analyses': totals.analyses, **totals.moods, 'intervention_rate': totals.intervention_rate}
+        for platform, totals in sorted(platforms.items(), key=lambda item: str(item[0]))
+    ], None
+
+
+def export_rows(batches: AsyncIterator[List[EmotionAnalysis]], data_type: str,
+                start: datetime, skip: int = 0) -> AsyncIterator[RowBatch]:
+    """Row batches for `data_type` from analyses streamed in timestamp order starting at `start`"""
+    batches = _resume(batches, start, skip)
+    if data_type == "raw":
+        return _records(batches, data_type, start, skip)
+    if data_type in ("mood_trends", "intervention_rates"):
+        return _daily(batches, data_type)
+    return _platforms(batches)
+
+
+async def ndjson_lines(rows: AsyncIterator[RowBatch]) -> AsyncIterator[str]:
+    """One JSON object per row, a {"_cursor": ...} line after each batch and an {"_end": ...} trailer"""
+    total = 0
+    async for batch, cursor in rows:
+        lines = [json.dumps(row) for row in batch]
+        if cursor:
+            lines.append(json.dumps({'_cursor': cursor}))
+        total += len(batch)
+        yield "\n".join(lines) + "\n"
+    yield json.dumps({'_end': True, 'total_records': total}) + "\n"
+
+
+async def csv_lines(rows: AsyncIterator[RowBatch], fields: List[str]) -> AsyncIterator[str]:
+    """CSV with a header row and a trailing `cursor` column.
+
+    CSV has no comment syntax, so the resume cursor is a column, set on the
+    last row of each batch (empty elsewhere): resume from the last non-empty
+    one. There is no trailer row; a cut-off export shows up as an incomplete
+    chunked response.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=[*fields, "cursor"], lineterminator="\n")
+    writer.writeheader()
+    async for batch, cursor in rows:
+        if batch and cursor:
+            batch = [*batch[:-1], {**batch[-1], "cursor": cursor}]
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def column_batches(rows: AsyncIterator[RowBatch], fields: List[str]) -> AsyncIterator[str]:
+    """Record batches as column arrays, one JSON object per line after a schema line"""
+    yield json.dumps({'schema': fields}) + "\n"
+    total = 0
+    async for batch, cursor in rows:
+        if not batch:
+            continue
+        columns = {field: [row[field] for row in batch] for field in fields}
+        total += len(batch)
+        yield json.dumps({'rows': len(batch), 'columns': columns, 'cursor': cursor}) + "\n"
+    yield json.dumps({'end': True, 'total_records': total}) + "\n"
+
+
+def format_stream(rows: AsyncIterator[RowBatch], data_type: str, output_format: str) -> AsyncIterator[str]:
+    fields = DATA_TYPES[data_type]
+    if output_format == "csv":
+        return csv_lines(rows, fields)
+    if output_format == "columnar":
+        return column_batches(rows, fields)
+    return ndjson_lines(rows)
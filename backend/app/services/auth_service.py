@@ -1,12 +1,21 @@
 import uuid
+import hmac
+import time
+import asyncio
 import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, Set, Callable
 import jwt
+from passlib.context import CryptContext
 from app.models.user import User, UserCreate, UserResponse
+from app.utils.wal import WriteAheadLog
 
 class AuthService:
-    def __init__(self):
+    def __init__(self, password_hash_workers: int = 2, token_cache_size: int = 50000,
+                 wal: Optional[WriteAheadLog] = None,
+                 on_user_removed: Optional[Callable[[str], None]] = None):
         self.secret_key = "mindfulcampus-secret-key-change-in-production"
         self.algorithm = "HS256"
         self.access_token_expire_minutes = 30
@@ -14,14 +23,113 @@ class AuthService:
         
         # Mock user storage (in production, use database)
         self.users_db = {}
+        # Unique lookup indexes: normalized email / student ID -> user_id
+        self.email_index: Dict[str, str] = {}
+        self.student_id_index: Dict[str, str] = {}
+        
+        # bcrypt is deliberately slow (~100+ ms), so hashing runs on a small
+        # dedicated thread pool. Its size caps how much CPU a login storm can
+        # take from the event loop; extra logins wait their turn.
+        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.password_executor = ThreadPoolExecutor(
+            max_workers=password_hash_workers,
+            thread_name_prefix="password-hash"
+        )
+        # Verified against when the email is unknown, so response time doesn't
+        # reveal which accounts exist (created on first use)
+        self._dummy_password_hash: Optional[str] = None
+        
+        # Recently verified access tokens: sha256(token) -> (exp, user), in LRU
+        # order, so repeat requests skip JWT decoding and the user lookup.
+        # token_digests_by_user lets deactivation/deletion drop a user's entries.
+        self.token_cache_size = token_cache_size
+        self.token_cache: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        self.token_digests_by_user: Dict[str, Set[str]] = {}
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
+        
+        # Optional durability for users_db; the indexes are rebuilt after replay
+        # and the token cache is never persisted
+        self.wal = wal
+        if wal:
+            wal.register("auth.users", self.users_db, on_replay=self._rebuild_indexes)
+        # Called with the id of a deleted or deactivated user (e.g. to stop matching them)
+        self.on_user_removed = on_user_removed
+
+    def _rebuild_indexes(self) -> None:
+        self.email_index.clear()
+        self.student_id_index.clear()
+        for user_data in self.users_db.values():
+            self._index_user(user_data["user"])
+
+    async def _log_user(self, user_id: str, commit: bool = True) -> None:
+        """Log the user's current record (or its deletion) to the WAL"""
+        if not self.wal:
+            return
+        if user_id in self.users_db:
+            self.wal.log_set("auth.users", user_id, self.users_db[user_id])
+        else:
+            self.wal.log_delete("auth.users", user_id)
+        if commit:
+            await self.wal.commit()
+
+    @staticmethod
+    def _normalize_email(email: str) -> str:
+        return email.strip().lower()
+
+    @staticmethod
+    def _normalize_student_id(student_id: str) -> str:
+        return student_id.strip().lower()
+
+    def _index_user(self, user: User) -> None:
+        """Add user to the email and student ID indexes"""
+        self.email_index[self._normalize_email(user.email)] = user.id
+        if user.student_id:
+            self.student_id_index[self._normalize_student_id(user.student_id)] = user.id
+
+    def _unindex_user(self, user: User) -> None:
+        """Remove user from the email and student ID indexes"""
+        self.email_index.pop(self._normalize_email(user.email), None)
+        if user.student_id:
+            self.student_id_index.pop(self._normalize_student_id(user.student_id), None)
+
+    def _check_unique(self, email: Optional[str], student_id: Optional[str], user_id: Optional[str] = None) -> None:
+        """Raise if email or student ID already belongs to another user"""
+        if email is not None and self.email_index.get(self._normalize_email(email), user_id) != user_id:
+            raise Exception("User with this email already exists")
+        if student_id and self.student_id_index.get(self._normalize_student_id(student_id), user_id) != user_id:
+            raise Exception("User with this student ID already exists")
 
-    def _hash_password(self, password: str) -> str:
-        """Hash password using SHA256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+    async def _run_password_job(self, func, *args):
+        """Run a password hashing function on the password thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.password_executor, func, *args)
 
-    def _verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        """Verify password against hash"""
-        return self._hash_password(plain_password) == hashed_password
+    async def _hash_password(self, password: str) -> str:
+        """Hash password with bcrypt"""
+        return await self._run_password_job(self.pwd_context.hash, password)
+
+    @staticmethod
+    def _is_legacy_hash(hashed_password: str) -> bool:
+        """Legacy hashes are unsalted SHA256 hex digests"""
+        return len(hashed_password) == 64 and all(c in "0123456789abcdef" for c in hashed_password)
+
+    async def _verify_password(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify password against hash.
+        
+        Returns whether it matched and, when the stored hash is a legacy
+        SHA256 digest or uses outdated bcrypt settings, a replacement hash.
+        """
+        if self._is_legacy_hash(hashed_password):
+            legacy_hash = hashlib.sha256(plain_password.encode()).hexdigest()
+            if not hmac.compare_digest(legacy_hash, hashed_password):
+                return False, None
+            return True, await self._hash_password(plain_password)
+        
+        valid, new_hash = await self._run_password_job(
+            self.pwd_context.verify_and_update, plain_password, hashed_password
+        )
+        return valid, new_hash
 
     def _create_access_token(self, data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
         """Create JWT access token"""
@@ -46,8 +154,7 @@ class AuthService:
     async def create_user(self, user_data: UserCreate) -> UserResponse:
         """Create a new user"""
         # Check if user already exists
-        if any(user.email == user_data.email for user in self.users_db.values()):
-            raise Exception("User with this email already exists")
+        self._check_unique(user_data.email, user_data.student_id)
 
         # Generate user ID
         user_id = str(uuid.uuid4())
@@ -66,10 +173,15 @@ class AuthService:
         )
         
         # Store user with hashed password
+        password_hash = await self._hash_password(user_data.password)
+        # Re-check: another registration may have taken the email while hashing
+        self._check_unique(user_data.email, user_data.student_id)
         self.users_db[user_id] = {
             "user": user,
-            "password_hash": self._hash_password(user_data.password)
+            "password_hash": password_hash
         }
+        self._index_user(user)
+        await self._log_user(user_id)
         
         return UserResponse(
             id=user.id,
@@ -86,20 +198,27 @@ class AuthService:
     async def authenticate_user(self, email: str, password: str) -> Dict[str, Any]:
         """Authenticate user and return tokens"""
         # Find user by email
-        user_data = None
-        user_id = None
+        user_id = self.email_index.get(self._normalize_email(email))
+        user_data = self.users_db.get(user_id) if user_id else None
         
-        for uid, data in self.users_db.items():
-            if data["user"].email == email:
-                user_data = data
-                user_id = uid
-                break
+        if not user_data:
+            if self._dummy_password_hash is None:
+                self._dummy_password_hash = await self._hash_password(uuid.uuid4().hex)
+            await self._verify_password(password, self._dummy_password_hash)
+            raise Exception("Invalid credentials")
         
-        if not user_data or not self._verify_password(password, user_data["password_hash"]):
+        valid, new_hash = await self._verify_password(password, user_data["password_hash"])
+        if not valid:
             raise Exception("Invalid credentials")
         
+        # Transparently migrate legacy SHA256 (or outdated bcrypt) hashes
+        if new_hash:
+            user_data["password_hash"] = new_hash
+        
         # Update last login
         user_data["user"].last_login = datetime.utcnow()
+        # A migrated hash must not be lost; last_login alone can ride the next group commit
+        await self._log_user(user_id, commit=new_hash is not None)
         
         # Create tokens
         access_token_expires = timedelta(minutes=self.access_token_expire_minutes)
@@ -125,8 +244,101 @@ class AuthService:
             )
         }
 
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        """Look up a user by email (case-insensitive)"""
+        user_id = self.email_index.get(self._normalize_email(email))
+        return self.users_db[user_id]["user"] if user_id else None
+
+    async def get_user_by_student_id(self, student_id: str) -> Optional[User]:
+        """Look up a user by student ID (case-insensitive)"""
+        user_id = self.student_id_index.get(self._normalize_student_id(student_id))
+        return self.users_db[user_id]["user"] if user_id else None
+
+    def lookup_user(self, user_id: str) -> Optional[User]:
+        """User by id, if any (synchronous, for lookups on hot paths)"""
+        user_data = self.users_db.get(user_id)
+        return user_data["user"] if user_data else None
+
+    def get_user_major(self, user_id: str) -> Optional[str]:
+        """Major of a user, if known (used to attribute analyses to a department)"""
+        user_data = self.users_db.get(user_id)
+        return user_data["user"].major if user_data else None
+
+    async def update_user(self, user_id: str, updates: Dict[str, Any]) -> User:
+        """Update profile fields of a user, keeping the lookup indexes consistent"""
+        user_data = self.users_db.get(user_id)
+        if user_data is None:
+            raise Exception("User not found")
+        
+        user = user_data["user"]
+        self._check_unique(updates.get("email"), updates.get("student_id"), user_id=user_id)
+        
+        updated_user = user.copy(update=updates)
+        self._unindex_user(user)
+        self._index_user(updated_user)
+        user_data["user"] = updated_user
+        # Cached tokens still point at the old user object
+        self.invalidate_user_tokens(user_id)
+        await self._log_user(user_id)
+        
+        return updated_user
+
+    async def delete_user(self, user_id: str) -> None:
+        """Delete a user and drop them from the lookup indexes"""
+        user_data = self.users_db.pop(user_id, None)
+        if user_data is None:
+            raise Exception("User not found")
+        
+        self._unindex_user(user_data["user"])
+        self.invalidate_user_tokens(user_id)
+        await self._log_user(user_id)
+        if self.on_user_removed:
+            self.on_user_removed(user_id)
+
+    async def deactivate_user(self, user_id: str) -> None:
+        """Deactivate a user; their tokens stop working immediately"""
+        user_data = self.users_db.get(user_id)
+        if user_data is None:
+            raise Exception("User not found")
+        
+        user_data["user"].is_active = False
+        self.invalidate_user_tokens(user_id)
+        await self._log_user(user_id)
+        if self.on_user_removed:
+            self.on_user_removed(user_id)
+
+    def invalidate_user_tokens(self, user_id: str) -> None:
+        """Drop all cached verifications for a user"""
+        for digest in self.token_digests_by_user.pop(user_id, set()):
+            self.token_cache.pop(digest, None)
+
+    def _cache_token(self, digest: str, expires_at: float, user: User) -> None:
+        self.token_cache[digest] = (expires_at, user)
+        self.token_digests_by_user.setdefault(user.id, set()).add(digest)
+        while len(self.token_cache) > self.token_cache_size:
+            self._evict_token(next(iter(self.token_cache)))
+
+    def _evict_token(self, digest: str) -> None:
+        _, user = self.token_cache.pop(digest)
+        digests = self.token_digests_by_user.get(user.id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self.token_digests_by_user[user.id]
+
     async def verify_token(self, token: str) -> User:
         """Verify JWT token and return user"""
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        cached = self.token_cache.get(digest)
+        if cached is not None:
+            expires_at, user = cached
+            if expires_at > time.time():
+                self.token_cache.move_to_end(digest)
+                self.token_cache_hits += 1
+                return user
+            self._evict_token(digest)
+        self.token_cache_misses += 1
+        
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
             user_id: str = payload.get("sub")
@@ -139,7 +351,24 @@ class AuthService:
         if user_data is None:
             raise Exception("User not found")
         
-        return user_data["user"]
+        user = user_data["user"]
+        if not user.is_active:
+            raise Exception("User is inactive")
+        
+        if "exp" in payload:
+            self._cache_token(digest, float(payload["exp"]), user)
+        
+        return user
+
+    def get_token_cache_stats(self) -> Dict[str, Any]:
+        """Get verified-token cache counters"""
+        lookups = self.token_cache_hits + self.token_cache_misses
+        return {
+            "entries": len(self.token_cache),
+            "hits": self.token_cache_hits,
+            "misses": self.token_cache_misses,
+            "hit_rate": self.token_cache_hits / lookups if lookups else 0.0
+        }
 
     async def refresh_access_token(self, refresh_token: str) -> Dict[str, str]:
         """Refresh access token using refresh token"""
@@ -0,0 +1,241 @@
+import re
+import math
+import hashlib
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from app.models.emotion import MoodType
+
+# Mood -> score on the 1-10 scale used by check-ins
+MOOD_SCORES = {
+    MoodType.POSITIVE: 8.0,
+    MoodType.NEUTRAL: 6.0,
+    MoodType.STRESSED: 4.0,
+    MoodType.NEGATIVE: 3.0
+}
+MOODS = list(MoodType)
+MOOD_INDEX = {mood: index for index, mood in enumerate(MOODS)}
+
+# Bucket width in seconds and how many buckets are kept
+GRANULARITIES = {
+    "hour": (3600, 72),
+    "day": (86400, 90),
+    "week": (7 * 86400, 52)
+}
+# Timeframe -> (granularity, number of buckets)
+TIMEFRAMES = {
+    "hour": ("hour", 1),
+    "day": ("hour", 24),
+    "week": ("day", 7),
+    "month": ("day", 30),
+    "semester": ("week", 16),
+    "year": ("week", 52)
+}
+ALL_DEPARTMENTS = "*"
+UNDECLARED = "undeclared"
+# 1970-01-01 was a Thursday; shifting by 3 days makes weeks start on Monday
+WEEK_OFFSET = 3 * 86400
+
+
+def department_key(major: Optional[str]) -> str:
+    """Normalize a major into a department key ("Computer Science" -> "computer_science")"""
+    if not major:
+        return UNDECLARED
+    key = re.sub(r"[^a-z0-9]+", "_", major.lower()).strip("_")
+    return key or UNDECLARED
+
+
+def stress_band(stress_level: Optional[float]) -> Optional[str]:
+    """Describe a 0-10 stress level"""
+    if stress_level is None:
+        return None
+    if stress_level >= 6:
+        return "high"
+    if stress_level >= 3.5:
+        return "moderate"
+    return "low"
+
+
+class HyperLogLog:
+    """Distinct-count sketch: 2**precision one-byte registers, mergeable by max"""
+
+    def __init__(self, precision: int = 11):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @staticmethod
+    def hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def add_hash(self, hashed: int):
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    @staticmethod
+    def estimate(registers: np.ndarray) -> int:
+        size = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        raw = alpha * size * size / np.sum(np.ldexp(1.0, -registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(registers == 0))
+        if raw <= 2.5 * size and zeros:
+            # Linear counting is far more accurate for small cardinalities
+            return int(round(size * math.log(size / zeros)))
+        return int(round(raw))
+
+
+class BucketCounters:
+    """Counters for one department in one time bucket"""
+
+    __slots__ = ("mood_counts", "score_sum", "interventions", "users")
+
+    def __init__(self, precision: int):
+        self.mood_counts = [0] * len(MOODS)
+        self.score_sum = 0.0
+        self.interventions = 0
+        self.users = HyperLogLog(precision)
+
+
+class CampusAggregator:
+    """Rolling campus-wide and per-department wellbeing counters.
+
+    Every analysis and intervention updates hour, day and week buckets for
+    the student's department and for the whole campus, so a query reads one
+    entry per bucket in its timeframe instead of scanning analyses. Active
+    users are HyperLogLog estimates (about 2.3% standard error at the default
+    precision) so they merge across buckets in constant time. Buckets older
+    than each granularity's retention are dropped as new ones open.
+    """
+
+    def __init__(self, hll_precision: int = 11):
+        self.hll_precision = hll_precision
+        # granularity -> bucket index -> department -> counters
+        self.buckets: Dict[str, Dict[int, Dict[str, BucketCounters]]] = {name: {} for name in GRANULARITIES}
+
+    @staticmethod
+    def _epoch_seconds(timestamp: datetime) -> float:
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+
+    @staticmethod
+    def _bucket_index(granularity: str, seconds: float) -> int:
+        width, _ = GRANULARITIES[granularity]
+        if granularity == "week":
+            seconds += WEEK_OFFSET
+        return int(seconds // width)
+
+    def _counters(self, granularity: str, index: int, department: str) -> Optional[BucketCounters]:
+        buckets = self.buckets[granularity]
+        bucket = buckets.get(index)
+        if bucket is None:
+            _, retention = GRANULARITIES[granularity]
+            newest = max(buckets) if buckets else index
+            if index <= newest - retention:
+                # Older than anything we keep
+                return None
+            buckets[index] = bucket = {}
+            self._expire(granularity, max(newest, index))
+        counters = bucket.get(department)
+        if counters is None:
+            bucket[department] = counters = BucketCounters(self.hll_precision)
+        return counters
+
+    def _expire(self, granularity: str, newest: int):
+        _, retention = GRANULARITIES[granularity]
+        buckets = self.buckets[granularity]
+        for index in [index for index in buckets if index <= newest - retention]:
+            del buckets[index]
+
+    def record_analysis(self, user_id: str, mood: MoodType, timestamp: datetime, department: str = UNDECLARED):
+        seconds = self._epoch_seconds(timestamp)
+        hashed = HyperLogLog.hash(user_id)
+        mood_index = MOOD_INDEX[mood]
+        score = MOOD_SCORES[mood]
+        for granularity in GRANULARITIES:
+            index = self._bucket_index(granularity, seconds)
+            for key in (department, ALL_DEPARTMENTS):
+                counters = self._counters(granularity, index, key)
+                if counters is None:
+                    break
+                counters.mood_counts[mood_index] += 1
+                counters.score_sum += score
+                counters.users.add_hash(hashed)
+
+    def record_intervention(self, timestamp: datetime, department: str = UNDECLARED):
+        seconds = self._epoch_seconds(timestamp)
+        for granularity in GRANULARITIES:
+            index = self._bucket_index(granularity, seconds)
+            for key in (department, ALL_DEPARTMENTS):
+                counters = self._counters(granularity, index, key)
+                if counters is None:
+                    break
+                counters.interventions += 1
+
+    def _window(self, timeframe: str, now: Optional[datetime] = None) -> Tuple[str, List[int]]:
+        if timeframe not in TIMEFRAMES:
+            raise Exception(f"Unknown timeframe: {timeframe}")
+        granularity, count = TIMEFRAMES[timeframe]
+        current = self._bucket_index(granularity, self._epoch_seconds(now or datetime.utcnow()))
+        self._expire(granularity, current)
+        return granularity, list(range(current - count + 1, current + 1))
+
+    def _summarize(self, counters: List[BucketCounters]) -> Dict[str, Any]:
+        mood_counts = [sum(c.mood_counts[index] for c in counters) for index in range(len(MOODS))]
+        total = sum(mood_counts)
+        score_sum = sum(c.score_sum for c in counters)
+        registers = np.maximum.reduce([c.users.registers for c in counters]) if counters else np.zeros(1 << self.hll_precision, np.uint8)
+        distressed = mood_counts[MOOD_INDEX[MoodType.STRESSED]] + mood_counts[MOOD_INDEX[MoodType.NEGATIVE]]
+        return {
+            'analyses': total,
+            'active_users': HyperLogLog.estimate(registers) if total else 0,
+            'average_mood_score': round(score_sum / total, 2) if total else None,
+            'stress_level': round(10 * distressed / total, 1) if total else None,
+            'mood_distribution': {mood.value: count for mood, count in zip(MOODS, mood_counts)},
+            'interventions_triggered': sum(c.interventions for c in counters)
+        }
+
+    def query(self, timeframe: str = "week", department: Optional[str] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Summaries over the timeframe for the campus (or one department) and per department"""
+        granularity, indexes = self._window(timeframe, now)
+        buckets = [self.buckets[granularity].get(index, {}) for index in indexes]
+        key = department_key(department) if department else ALL_DEPARTMENTS
+
+        selected = self._summarize([bucket[key] for bucket in buckets if key in bucket])
+
+        # Compare the two halves of the window for a trend
+        half = len(buckets) // 2
+        earlier = self._summarize([bucket[key] for bucket in buckets[:half] if key in bucket])
+        later = self._summarize([bucket[key] for bucket in buckets[half:] if key in bucket])
+        mood_improving = None
+        if earlier['average_mood_score'] is not None and later['average_mood_score'] is not None:
+            mood_improving = later['average_mood_score'] >= earlier['average_mood_score']
+
+        departments = set()
+        for bucket in buckets:
+            departments.update(bucket)
+        departments.discard(ALL_DEPARTMENTS)
+        breakdown = {}
+        for name in sorted(departments):
+            summary = self._summarize([bucket[name] for bucket in buckets if name in bucket])
+            breakdown[name] = {
+                'avg_mood': summary['average_mood_score'],
+                'stress_level': summary['stress_level'],
+                'active_users': summary['active_users'],
+                'analyses': summary['analyses']
+            }
+
+        return {
+            'timeframe': timeframe,
+            'department': key if department else None,
+            'granularity': granularity,
+            'buckets': len(indexes),
+            **selected,
+            'trends': {
+                'mood_improving': mood_improving,
+                'stress_levels': stress_band(selected['stress_level'])
+            },
+            'department_breakdown': breakdown
+        }
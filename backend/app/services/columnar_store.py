@@ -0,0 +1,302 @@
+from array import array
+from datetime import datetime, timedelta, timezone, date
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+import numpy as np
+from app.models.emotion import EmotionAnalysis, MoodType
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECONDS_PER_DAY = 86400 * 10 ** 6
+CHUNK_ROWS = 65536
+MOODS = list(MoodType)
+MOOD_CODES = {mood: code for code, mood in enumerate(MOODS)}
+
+# Column name -> dtype. Strings (user ids, labels, platforms, trigger lists)
+# are interned into CodeTables and stored as codes.
+COLUMNS = {
+    "user": np.int32,
+    "label": np.int16,
+    "mood": np.int8,
+    "platform": np.int16,
+    "triggers": np.int32,
+    "requires_intervention": np.bool_,
+    "timestamp": np.int64,      # microseconds since the epoch (naive UTC)
+    "confidence": np.float32
+}
+
+
+def to_epoch_us(timestamp: datetime) -> int:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def from_epoch_us(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+class CodeTable:
+    """Interns values as dense int codes"""
+
+    def __init__(self, values: Optional[List[Any]] = None):
+        self.values: List[Any] = list(values or [])
+        self.codes: Dict[Any, int] = {value: code for code, value in enumerate(self.values)}
+
+    def code(self, value: Any) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class AnalysisChunk:
+    """Fixed-capacity column arrays for a run of consecutive rows"""
+
+    def __init__(self, capacity: int, keep_text: bool):
+        self.columns = {name: np.zeros(capacity, dtype) for name, dtype in COLUMNS.items()}
+        self.text: Optional[List[str]] = [] if keep_text else None
+        self.size = 0
+        # Zone map, so time-range scans can skip whole chunks
+        self.min_timestamp = np.iinfo(np.int64).max
+        self.max_timestamp = np.iinfo(np.int64).min
+
+
+class ColumnarAnalysesSnapshot:
+    """Point-in-time copy of a ColumnarAnalysisStore for WriteAheadLog snapshots"""
+
+    def __init__(self, store: "ColumnarAnalysisStore"):
+        self._items = [("tables", (
+            list(store.users.values),
+            list(store.labels.values),
+            list(store.platforms.values),
+            list(store.trigger_sets.values)
+        ))]
+        for index, chunk in enumerate(store.chunks):
+            # Full chunks never change again; only the last one needs copying
+            if chunk.size == store.chunk_rows:
+                columns = {name: column[:chunk.size] for name, column in chunk.columns.items()}
+                text = chunk.text
+            else:
+                columns = {name: column[:chunk.size].copy() for name, column in chunk.columns.items()}
+                text = list(chunk.text) if chunk.text is not None else None
+            self._items.append((("chunk", index), (chunk.size, columns, text)))
+
+    def items(self):
+        return self._items
+
+
+class ColumnarAnalysisStore:
+    """Append-only column store for emotion analyses.
+
+    Roughly 25 bytes per analysis (plus 8 for the per-user row index) instead
+    of a pydantic object per analysis. EmotionAnalysis objects are only built
+    when read. Analysis ids are not kept (nothing looks analyses up by id),
+    and neither is the raw text unless `keep_text` is set.
+
+    Supports the dict methods WriteAheadLog uses, so it can be registered
+    as a WAL store; snapshots then hold whole column chunks.
+    """
+
+    def __init__(self, chunk_rows: int = CHUNK_ROWS, keep_text: bool = False):
+        self.chunk_rows = chunk_rows
+        self.keep_text = keep_text
+        self.chunks: List[AnalysisChunk] = []
+        self.users = CodeTable()
+        self.labels = CodeTable()
+        self.platforms = CodeTable()
+        self.trigger_sets = CodeTable()
+        # Row numbers of each user's analyses (indexed by user code) in
+        # insertion order, and analysis counts per day
+        self.user_rows: List[array] = []
+        self.daily_counts: Dict[date, int] = {}
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, analysis: EmotionAnalysis) -> int:
+        """Store an analysis; returns its row number"""
+        if not self.chunks or self.chunks[-1].size == self.chunk_rows:
+            self.chunks.append(AnalysisChunk(self.chunk_rows, self.keep_text))
+        chunk = self.chunks[-1]
+        offset = chunk.size
+        columns = chunk.columns
+
+        user = self.users.code(analysis.user_id)
+        timestamp = to_epoch_us(analysis.timestamp)
+        columns["user"][offset] = user
+        columns["label"][offset] = self.labels.code(analysis.sentiment_label)
+        columns["mood"][offset] = MOOD_CODES[analysis.mood]
+        columns["platform"][offset] = self.platforms.code(analysis.platform)
+        columns["triggers"][offset] = self.trigger_sets.code(tuple(analysis.triggers))
+        columns["requires_intervention"][offset] = analysis.requires_intervention
+        columns["timestamp"][offset] = timestamp
+        columns["confidence"][offset] = analysis.confidence
+        if chunk.text is not None:
+            chunk.text.append(analysis.text)
+        chunk.size += 1
+        chunk.min_timestamp = min(chunk.min_timestamp, timestamp)
+        chunk.max_timestamp = max(chunk.max_timestamp, timestamp)
+
+        row = self.size
+        self.size += 1
+        if user == len(self.user_rows):
+            self.user_rows.append(array("q"))
+        self.user_rows[user].append(row)
+        day = from_epoch_us(timestamp).date()
+        self.daily_counts[day] = self.daily_counts.get(day, 0) + 1
+        return row
+
+    def _gather(self, name: str, rows: np.ndarray) -> np.ndarray:
+        """Read one column at the given (ascending) row numbers"""
+        values = np.empty(len(rows), dtype=COLUMNS[name])
+        if not len(rows):
+            return values
+        chunk_ids = rows // self.chunk_rows
+        starts = np.flatnonzero(np.concatenate(([True], chunk_ids[1:] != chunk_ids[:-1])))
+        ends = np.append(starts[1:], len(rows))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            chunk_id = int(chunk_ids[start])
+            offsets = rows[start:end] - chunk_id * self.chunk_rows
+            values[start:end] = self.chunks[chunk_id].columns[name][offsets]
+        return values
+
+    def _materialize(self, rows: np.ndarray) -> List[EmotionAnalysis]:
+        """Build EmotionAnalysis objects for (ascending) rows, in timestamp order"""
+        columns = {name: self._gather(name, rows) for name in COLUMNS}
+        # Rows are in arrival order; analyses can arrive slightly out of order
+        order = np.argsort(columns["timestamp"], kind="stable")
+        columns = {name: column[order] for name, column in columns.items()}
+        rows = rows[order]
+        timestamps = columns["timestamp"]
+        if self.keep_text:
+            texts = [self.chunks[row // self.chunk_rows].text[row % self.chunk_rows] for row in rows.tolist()]
+        else:
+            texts = [""] * len(rows)
+
+        users = self.users.values
+        labels = self.labels.values
+        platforms = self.platforms.values
+        trigger_sets = self.trigger_sets.values
+        construct = EmotionAnalysis.model_construct
+        return [
+            construct(
+                user_id=users[user],
+                text=text,
+                sentiment_label=labels[label],
+                confidence=round(confidence, 6),
+                mood=MOODS[mood],
+                platform=platforms[platform],
+                triggers=list(trigger_sets[triggers]),
+                requires_intervention=requires_intervention,
+                timestamp=from_epoch_us(timestamp)
+            )
+            for user, text, label, confidence, mood, platform, triggers, requires_intervention, timestamp in zip(
+                columns["user"].tolist(), texts, columns["label"].tolist(), columns["confidence"].tolist(),
+                columns["mood"].tolist(), columns["platform"].tolist(), columns["triggers"].tolist(),
+                columns["requires_intervention"].tolist(), timestamps.tolist()
+            )
+        ]
+
+    def user_analyses(self, user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      limit: Optional[int] = None) -> List[EmotionAnalysis]:
+        """User's analyses in timestamp order, optionally only since <= timestamp <= until and the latest `limit`"""
+        code = self.users.codes.get(user_id)
+        if code is None:
+            return []
+        rows = np.array(self.user_rows[code], dtype=np.int64)
+        if since is not None or until is not None or limit is not None:
+            timestamps = self._gather("timestamp", rows)
+            keep = np.ones(len(rows), dtype=np.bool_)
+            if since is not None:
+                keep &= timestamps >= to_epoch_us(since)
+            if until is not None:
+                keep &= timestamps <= to_epoch_us(until)
+            rows, timestamps = rows[keep], timestamps[keep]
+            if limit is not None and len(rows) > limit:
+                # Only build objects for the latest rows
+                rows = np.sort(rows[np.argsort(timestamps, kind="stable")[len(rows) - limit:]])
+        return self._materialize(rows)
+
+    def analyses_between(self, start: datetime, end: datetime) -> List[EmotionAnalysis]:
+        """All analyses with start <= timestamp <= end, in timestamp order"""
+        start_us, end_us = to_epoch_us(start), to_epoch_us(end)
+        matches = []
+        for chunk_id, chunk in enumerate(self.chunks):
+            if chunk.size == 0 or chunk.max_timestamp < start_us or chunk.min_timestamp > end_us:
+                continue
+            timestamps = chunk.columns["timestamp"][:chunk.size]
+            offsets = np.flatnonzero((timestamps >= start_us) & (timestamps <= end_us))
+            matches.append(offsets + chunk_id * self.chunk_rows)
+        if not matches:
+            return []
+        return self._materialize(np.concatenate(matches))
+
+    def rebuild_indexes(self) -> None:
+        """Recompute the per-user rows, daily counts and zone maps from the columns"""
+        if not self.chunks:
+            self.user_rows = []
+            self.daily_counts = {}
+            self.size = 0
+            return
+        users = np.concatenate([chunk.columns["user"][:chunk.size] for chunk in self.chunks])
+        timestamps = np.concatenate([chunk.columns["timestamp"][:chunk.size] for chunk in self.chunks])
+        self.size = len(users)
+
+        order = np.argsort(users, kind="stable")
+        counts = np.bincount(users, minlength=len(self.users.values))
+        self.user_rows = []
+        for part in np.split(order, np.cumsum(counts)[:-1]):
+            rows = array("q")
+            rows.frombytes(part.astype(np.int64).tobytes())
+            self.user_rows.append(rows)
+
+        days, day_counts = np.unique(timestamps // MICROSECONDS_PER_DAY, return_counts=True)
+        self.daily_counts = {
+            EPOCH.date() + timedelta(days=day): count
+            for day, count in zip(days.tolist(), day_counts.tolist())
+        }
+        for chunk in self.chunks:
+            if chunk.size:
+                chunk.min_timestamp = int(chunk.columns["timestamp"][:chunk.size].min())
+                chunk.max_timestamp = int(chunk.columns["timestamp"][:chunk.size].max())
+
+    # Dict methods used by WriteAheadLog. Keys of logged analyses are their
+    # (discarded) analysis ids; snapshot items are code tables and chunks.
+
+    def __setitem__(self, analysis_id: str, analysis: EmotionAnalysis) -> None:
+        self.append(analysis)
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        # Analyses are never deleted
+        return default
+
+    def copy(self) -> ColumnarAnalysesSnapshot:
+        return ColumnarAnalysesSnapshot(self)
+
+    def update(self, entries: Iterable[Tuple[Any, Any]]) -> None:
+        restored_chunks = False
+        for key, value in entries:
+            if key == "tables":
+                users, labels, platforms, trigger_sets = value
+                self.users = CodeTable(users)
+                self.labels = CodeTable(labels)
+                self.platforms = CodeTable(platforms)
+                self.trigger_sets = CodeTable(trigger_sets)
+            elif isinstance(key, tuple) and key[0] == "chunk":
+                size, columns, text = value
+                if size > self.chunk_rows:
+                    raise Exception(f"Snapshot chunk has {size} rows but chunk_rows is {self.chunk_rows}")
+                chunk = AnalysisChunk(self.chunk_rows, self.keep_text)
+                for name, column in columns.items():
+                    chunk.columns[name][:size] = column
+                if chunk.text is not None:
+                    chunk.text = list(text) if text is not None else [""] * size
+                chunk.size = size
+                self.chunks.append(chunk)
+                restored_chunks = True
+            else:
+                self.append(value)
+        if restored_chunks:
+            self.rebuild_indexes()
@@ -0,0 +1,539 @@
+import bisect
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, date
+from typing import List, Dict, Optional, Tuple, AsyncIterator
+from sqlalchemy import (
+    MetaData, Table, Column, Index, String, Text, Float, Integer, Boolean, DateTime, JSON,
+    select, insert, update, func
+)
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.pool import StaticPool
+from app.models.emotion import EmotionAnalysis, Intervention, DailyCheckin, CrisisAlert, MoodType
+from app.services.columnar_store import ColumnarAnalysisStore, CHUNK_ROWS, from_epoch_us
+from app.utils.wal import WriteAheadLog
+
+
+class EmotionRepository(ABC):
+    """Storage interface behind EmotionService.
+
+    Analyses are written in batches of (analysis_id, analysis) pairs and read
+    back in timestamp order.
+    """
+
+    # Time range read per batch by the default iter_analyses_between
+    SCAN_SLICE = timedelta(days=1)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def add_analyses(self, records: List[Tuple[str, EmotionAnalysis]]) -> None:
+        ...
+
+    @abstractmethod
+    async def get_user_analyses(self, user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                limit: Optional[int] = None) -> List[EmotionAnalysis]:
+        """User's analyses in timestamp order, optionally only those with since <= timestamp <= until.
+
+        With `limit`, only the latest `limit` of them.
+        """
+
+    @abstractmethod
+    async def get_analyses_between(self, start: datetime, end: datetime) -> List[EmotionAnalysis]:
+        """All analyses with start <= timestamp <= end, in timestamp order"""
+
+    async def iter_analyses_between(self, start: datetime, end: datetime) -> AsyncIterator[List[EmotionAnalysis]]:
+        """Like get_analyses_between, but in batches so a long range never sits in memory at once.
+
+        Analyses with equal timestamps come in the same order on every scan.
+        """
+        slice_start = start
+        while slice_start <= end:
+            slice_end = slice_start + self.SCAN_SLICE
+            batch = await self.get_analyses_between(slice_start, min(slice_end, end))
+            if slice_end <= end:
+                # The next slice starts at slice_end
+                batch = [analysis for analysis in batch if analysis.timestamp < slice_end]
+            if batch:
+                yield batch
+            slice_start = slice_end
+
+    @abstractmethod
+    async def count_analyses(self) -> int:
+        ...
+
+    @abstractmethod
+    async def count_analyses_on(self, day: date) -> int:
+        ...
+
+    @abstractmethod
+    async def add_intervention(self, intervention: Intervention) -> None:
+        ...
+
+    @abstractmethod
+    async def get_intervention(self, intervention_id: str) -> Optional[Intervention]:
+        ...
+
+    @abstractmethod
+    async def update_intervention(self, intervention: Intervention) -> None:
+        ...
+
+    @abstractmethod
+    async def get_active_interventions(self, user_id: str) -> List[Intervention]:
+        ...
+
+    @abstractmethod
+    async def get_completed_interventions(self) -> List[Intervention]:
+        ...
+
+    @abstractmethod
+    async def get_interventions_since(self, since: datetime) -> List[Intervention]:
+        """Interventions created at or after `since`"""
+
+    @abstractmethod
+    async def add_checkin(self, checkin_id: str, checkin: DailyCheckin) -> None:
+        ...
+
+    @abstractmethod
+    async def add_crisis_alert(self, alert: CrisisAlert) -> None:
+        ...
+
+    @abstractmethod
+    async def get_crisis_alerts_since(self, since: datetime) -> List[CrisisAlert]:
+        """Crisis alerts created at or after `since`"""
+
+
+class InMemoryEmotionRepository(EmotionRepository):
+    """Dict-backed storage (the default).
+
+    Nothing survives a restart unless a WriteAheadLog is given, in which case
+    every mutation is logged and committed before the call returns. The log
+    then holds each analysis in full, raw text included.
+    """
+
+    def __init__(self, wal: Optional[WriteAheadLog] = None):
+        self.emotions_db: Dict[str, EmotionAnalysis] = {}
+        self.interventions_db: Dict[str, Intervention] = {}
+        self.checkins_db: Dict[str, DailyCheckin] = {}
+        self.crisis_alerts_db: Dict[str, CrisisAlert] = {}
+        # Indexes over emotions_db: per-user analysis ids kept in timestamp order
+        # (with a parallel list of timestamps for bisect) and analysis ids per day
+        self.user_emotion_index: Dict[str, List[str]] = {}
+        self.user_emotion_timestamps: Dict[str, List[datetime]] = {}
+        self.daily_emotion_index: Dict[date, List[str]] = {}
+
+        self.wal = wal
+        if wal:
+            wal.register("emotion.analyses", self._analysis_store(), on_replay=self._rebuild_indexes)
+            wal.register("emotion.interventions", self.interventions_db)
+            wal.register("emotion.checkins", self.checkins_db)
+            wal.register("emotion.crisis_alerts", self.crisis_alerts_db)
+
+    def _analysis_store(self):
+        """The store that holds analyses (registered with the WAL)"""
+        return self.emotions_db
+
+    def _rebuild_indexes(self) -> None:
+        """Rebuild the indexes from emotions_db (after WAL replay)"""
+        self.user_emotion_index.clear()
+        self.user_emotion_timestamps.clear()
+        self.daily_emotion_index.clear()
+        # Visiting analyses in timestamp order means every index list is
+        # built by appending, with no bisect
+        for analysis_id, analysis in sorted(self.emotions_db.items(), key=lambda item: item[1].timestamp):
+            user_id = analysis.user_id
+            if user_id not in self.user_emotion_index:
+                self.user_emotion_index[user_id] = []
+                self.user_emotion_timestamps[user_id] = []
+            self.user_emotion_index[user_id].append(analysis_id)
+            self.user_emotion_timestamps[user_id].append(analysis.timestamp)
+            self.daily_emotion_index.setdefault(analysis.timestamp.date(), []).append(analysis_id)
+
+    async def _log_set(self, store: str, key: str, value) -> None:
+        if self.wal:
+            self.wal.log_set(store, key, value)
+            await self.wal.commit()
+
+    async def add_analyses(self, records: List[Tuple[str, EmotionAnalysis]]) -> None:
+        for analysis_id, analysis in records:
+            self.emotions_db[analysis_id] = analysis
+            self._index_analysis(analysis_id, analysis)
+            if self.wal:
+                self.wal.log_set("emotion.analyses", analysis_id, analysis)
+        if self.wal:
+            # One group commit for the whole batch
+            await self.wal.commit()
+
+    def _index_analysis(self, analysis_id: str, analysis: EmotionAnalysis) -> None:
+        timestamps = self.user_emotion_timestamps.setdefault(analysis.user_id, [])
+        analysis_ids = self.user_emotion_index.setdefault(analysis.user_id, [])
+        # New analyses almost always land at the end, so this is an append in practice
+        position = bisect.bisect_right(timestamps, analysis.timestamp)
+        timestamps.insert(position, analysis.timestamp)
+        analysis_ids.insert(position, analysis_id)
+
+        self.daily_emotion_index.setdefault(analysis.timestamp.date(), []).append(analysis_id)
+
+    async def get_user_analyses(self, user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                limit: Optional[int] = None) -> List[EmotionAnalysis]:
+        analysis_ids = self.user_emotion_index.get(user_id, [])
+        timestamps = self.user_emotion_timestamps.get(user_id, [])
+        start, end = 0, len(analysis_ids)
+        if since is not None:
+            start = bisect.bisect_left(timestamps, since)
+        if until is not None:
+            end = bisect.bisect_right(timestamps, until)
+        if limit is not None:
+            start = max(start, end - limit)
+        return [self.emotions_db[analysis_id] for analysis_id in analysis_ids[start:end]]
+
+    async def get_analyses_between(self, start: datetime, end: datetime) -> List[EmotionAnalysis]:
+        analyses = []
+        day = start.date()
+        while day <= end.date():
+            for analysis_id in self.daily_emotion_index.get(day, []):
+                analysis = self.emotions_db[analysis_id]
+                if start <= analysis.timestamp <= end:
+                    analyses.append(analysis)
+            day += timedelta(days=1)
+        return sorted(analyses, key=lambda analysis: analysis.timestamp)
+
+    def _earliest_timestamp(self) -> Optional[datetime]:
+        if not self.daily_emotion_index:
+            return None
+        return datetime.combine(min(self.daily_emotion_index), datetime.min.time())
+
+    async def iter_analyses_between(self, start: datetime, end: datetime) -> AsyncIterator[List[EmotionAnalysis]]:
+        # Don't walk empty days before the first analysis
+        earliest = self._earliest_timestamp()
+        if earliest is None:
+            return
+        async for batch in super().iter_analyses_between(max(start, earliest), end):
+            yield batch
+
+    async def count_analyses(self) -> int:
+        return len(self.emotions_db)
+
+    async def count_analyses_on(self, day: date) -> int:
+        return len(self.daily_emotion_index.get(day, []))
+
+    async def add_intervention(self, intervention: Intervention) -> None:
+        self.interventions_db[intervention.id] = intervention
+        await self._log_set("emotion.interventions", intervention.id, intervention)
+
+    async def get_intervention(self, intervention_id: str) -> Optional[Intervention]:
+        return self.interventions_db.get(intervention_id)
+
+    async def update_intervention(self, intervention: Intervention) -> None:
+        self.interventions_db[intervention.id] = intervention
+        await self._log_set("emotion.interventions", intervention.id, intervention)
+
+    async def get_active_interventions(self, user_id: str) -> List[Intervention]:
+        return [
+            intervention for intervention in self.interventions_db.values()
+            if intervention.user_id == user_id and not intervention.completed
+        ]
+
+    async def get_completed_interventions(self) -> List[Intervention]:
+        return [i for i in self.interventions_db.values() if i.completed]
+
+    async def get_interventions_since(self, since: datetime) -> List[Intervention]:
+        return [i for i in self.interventions_db.values() if i.created_at >= since]
+
+    async def add_checkin(self, checkin_id: str, checkin: DailyCheckin) -> None:
+        self.checkins_db[checkin_id] = checkin
+        await self._log_set("emotion.checkins", checkin_id, checkin)
+
+    async def add_crisis_alert(self, alert: CrisisAlert) -> None:
+        self.crisis_alerts_db[alert.id] = alert
+        await self._log_set("emotion.crisis_alerts", alert.id, alert)
+
+    async def get_crisis_alerts_since(self, since: datetime) -> List[CrisisAlert]:
+        return [a for a in self.crisis_alerts_db.values() if a.created_at >= since]
+
+
+class ColumnarEmotionRepository(InMemoryEmotionRepository):
+    """In-memory storage with analyses held in a ColumnarAnalysisStore.
+
+    Uses a fraction of the memory of InMemoryEmotionRepository for months of
+    analyses; interventions, check-ins and crisis alerts stay in dicts. Unless
+    `keep_text` is set, raw text is kept out of the WAL too.
+    """
+
+    def __init__(self, wal: Optional[WriteAheadLog] = None, keep_text: bool = False, chunk_rows: int = CHUNK_ROWS):
+        self.analyses = ColumnarAnalysisStore(chunk_rows=chunk_rows, keep_text=keep_text)
+        super().__init__(wal)
+
+    def _analysis_store(self):
+        return self.analyses
+
+    def _rebuild_indexes(self) -> None:
+        self.analyses.rebuild_indexes()
+
+    async def add_analyses(self, records: List[Tuple[str, EmotionAnalysis]]) -> None:
+        for analysis_id, analysis in records:
+            self.analyses.append(analysis)
+            if self.wal:
+                if not self.analyses.keep_text:
+                    analysis = analysis.model_copy(update={"text": ""})
+                self.wal.log_set("emotion.analyses", analysis_id, analysis)
+        if self.wal:
+            await self.wal.commit()
+
+    async def get_user_analyses(self, user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                limit: Optional[int] = None) -> List[EmotionAnalysis]:
+        return self.analyses.user_analyses(user_id, since=since, until=until, limit=limit)
+
+    async def get_analyses_between(self, start: datetime, end: datetime) -> List[EmotionAnalysis]:
+        return self.analyses.analyses_between(start, end)
+
+    async def count_analyses(self) -> int:
+        return len(self.analyses)
+
+    async def count_analyses_on(self, day: date) -> int:
+        return self.analyses.daily_counts.get(day, 0)
+
+    def _earliest_timestamp(self) -> Optional[datetime]:
+        zone_minimums = [chunk.min_timestamp for chunk in self.analyses.chunks if chunk.size]
+        return from_epoch_us(min(zone_minimums)) if zone_minimums else None
+
+
+metadata = MetaData()
+
+emotion_analyses_table = Table(
+    "emotion_analyses", metadata,
+    Column("id", String(36), primary_key=True),
+    Column("user_id", String(64), nullable=False),
+    Column("text", Text, nullable=False),
+    Column("sentiment_label", String(32), nullable=False),
+    Column("confidence", Float, nullable=False),
+    Column("mood", String(16), nullable=False),
+    Column("platform", String(64)),
+    Column("triggers", JSON, nullable=False),
+    Column("requires_intervention", Boolean, nullable=False),
+    Column("timestamp", DateTime, nullable=False),
+    Index("ix_emotion_analyses_user_id_timestamp", "user_id", "timestamp"),
+    Index("ix_emotion_analyses_timestamp", "timestamp")
+)
+
+interventions_table = Table(
+    "interventions", metadata,
+    Column("id", String(36), primary_key=True),
+    Column("user_id", String(64), nullable=False),
+    Column("type", String(64), nullable=False),
+    Column("title", String(255), nullable=False),
+    Column("description", Text, nullable=False),
+    Column("duration", String(64), nullable=False),
+    Column("icon", String(16), nullable=False),
+    Column("trigger_reason", Text, nullable=False),
+    Column("effectiveness_rating", Integer),
+    Column("completed", Boolean, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("completed_at", DateTime),
+    Index("ix_interventions_user_id_completed", "user_id", "completed"),
+    Index("ix_interventions_created_at", "created_at")
+)
+
+checkins_table = Table(
+    "daily_checkins", metadata,
+    Column("id", String(36), primary_key=True),
+    Column("user_id", String(64), nullable=False),
+    Column("date", DateTime, nullable=False),
+    Column("mood_score", Integer, nullable=False),
+    Column("stress_level", Integer, nullable=False),
+    Column("sleep_hours", Float, nullable=False),
+    Column("notes", Text),
+    Index("ix_daily_checkins_user_id_date", "user_id", "date")
+)
+
+crisis_alerts_table = Table(
+    "crisis_alerts", metadata,
+    Column("id", String(36), primary_key=True),
+    Column("user_id", String(64), nullable=False),
+    Column("severity", String(16), nullable=False),
+    Column("description", Text, nullable=False),
+    Column("location", String(255)),
+    Column("resolved", Boolean, nullable=False),
+    Column("counselor_notified", Boolean, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("resolved_at", DateTime),
+    Index("ix_crisis_alerts_created_at", "created_at")
+)
+
+
+def _analysis_row(analysis_id: str, analysis: EmotionAnalysis) -> Dict:
+    return {
+        "id": analysis_id,
+        "user_id": analysis.user_id,
+        "text": analysis.text,
+        "sentiment_label": analysis.sentiment_label,
+        "confidence": analysis.confidence,
+        "mood": analysis.mood.value,
+        "platform": analysis.platform,
+        "triggers": list(analysis.triggers),
+        "requires_intervention": analysis.requires_intervention,
+        "timestamp": analysis.timestamp
+    }
+
+
+def _analysis_from_row(row) -> EmotionAnalysis:
+    return EmotionAnalysis(
+        user_id=row.user_id,
+        text=row.text,
+        sentiment_label=row.sentiment_label,
+        confidence=row.confidence,
+        mood=MoodType(row.mood),
+        platform=row.platform,
+        triggers=row.triggers,
+        requires_intervention=row.requires_intervention,
+        timestamp=row.timestamp
+    )
+
+
+def _intervention_from_row(row) -> Intervention:
+    return Intervention(**dict(row._mapping))
+
+
+class SQLAlchemyEmotionRepository(EmotionRepository):
+    """Async SQLAlchemy storage: SQLite (aiosqlite) locally and in tests, Postgres (asyncpg) in production.
+
+    Analyses are inserted with one executemany per batch. Postgres connections
+    come from a pool of `pool_size` (+ `max_overflow`); SQLite in-memory
+    databases share a single connection so all sessions see the same data.
+    """
+
+    STREAM_BATCH_SIZE = 5000
+
+    def __init__(self, url: str = "sqlite+aiosqlite:///./mindfulcampus.db", pool_size: int = 10,
+                 max_overflow: int = 20, echo: bool = False):
+        self.url = url
+        if url.startswith("sqlite"):
+            engine_options = {"connect_args": {"check_same_thread": False}}
+            if ":memory:" in url or url.endswith("sqlite+aiosqlite://"):
+                engine_options["poolclass"] = StaticPool
+        else:
+            engine_options = {"pool_size": pool_size, "max_overflow": max_overflow, "pool_pre_ping": True}
+        self.engine: AsyncEngine = create_async_engine(url, echo=echo, **engine_options)
+
+    async def initialize(self) -> None:
+        """Create tables and indexes if they don't exist"""
+        async with self.engine.begin() as connection:
+            await connection.run_sync(metadata.create_all)
+
+    async def close(self) -> None:
+        await self.engine.dispose()
+
+    async def add_analyses(self, records: List[Tuple[str, EmotionAnalysis]]) -> None:
+        if not records:
+            return
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                insert(emotion_analyses_table),
+                [_analysis_row(analysis_id, analysis) for analysis_id, analysis in records]
+            )
+
+    async def get_user_analyses(self, user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                limit: Optional[int] = None) -> List[EmotionAnalysis]:
+        table = emotion_analyses_table
+        query = select(table).where(table.c.user_id == user_id)
+        if since is not None:
+            query = query.where(table.c.timestamp >= since)
+        if until is not None:
+            query = query.where(table.c.timestamp <= until)
+        if limit is not None:
+            # Latest `limit` via the (user_id, timestamp) index, flipped back below
+            query = query.order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(limit)
+        else:
+            query = query.order_by(table.c.timestamp, table.c.id)
+        async with self.engine.connect() as connection:
+            result = await connection.execute(query)
+            analyses = [_analysis_from_row(row) for row in result]
+        return analyses[::-1] if limit is not None else analyses
+
+    async def get_analyses_between(self, start: datetime, end: datetime) -> List[EmotionAnalysis]:
+        query = (
+            select(emotion_analyses_table)
+            .where(emotion_analyses_table.c.timestamp.between(start, end))
+            .order_by(emotion_analyses_table.c.timestamp)
+        )
+        async with self.engine.connect() as connection:
+            result = await connection.execute(query)
+            return [_analysis_from_row(row) for row in result]
+
+    async def iter_analyses_between(self, start: datetime, end: datetime) -> AsyncIterator[List[EmotionAnalysis]]:
+        query = (
+            select(emotion_analyses_table)
+            .where(emotion_analyses_table.c.timestamp.between(start, end))
+            .order_by(emotion_analyses_table.c.timestamp, emotion_analyses_table.c.id)
+            .execution_options(yield_per=self.STREAM_BATCH_SIZE)
+        )
+        # Server-side cursor, read STREAM_BATCH_SIZE rows at a time
+        async with self.engine.connect() as connection:
+            result = await connection.stream(query)
+            async for rows in result.partitions():
+                yield [_analysis_from_row(row) for row in rows]
+
+    async def count_analyses(self) -> int:
+        async with self.engine.connect() as connection:
+            return await connection.scalar(select(func.count()).select_from(emotion_analyses_table))
+
+    async def count_analyses_on(self, day: date) -> int:
+        day_start = datetime.combine(day, datetime.min.time())
+        query = select(func.count()).select_from(emotion_analyses_table).where(
+            emotion_analyses_table.c.timestamp >= day_start,
+            emotion_analyses_table.c.timestamp < day_start + timedelta(days=1)
+        )
+        async with self.engine.connect() as connection:
+            return await connection.scalar(query)
+
+    async def add_intervention(self, intervention: Intervention) -> None:
+        async with self.engine.begin() as connection:
+            await connection.execute(insert(interventions_table), [intervention.dict()])
+
+    async def get_intervention(self, intervention_id: str) -> Optional[Intervention]:
+        query = select(interventions_table).where(interventions_table.c.id == intervention_id)
+        async with self.engine.connect() as connection:
+            row = (await connection.execute(query)).first()
+            return _intervention_from_row(row) if row else None
+
+    async def update_intervention(self, intervention: Intervention) -> None:
+        values = intervention.dict()
+        del values["id"]
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                update(interventions_table).where(interventions_table.c.id == intervention.id).values(**values)
+            )
+
+    async def get_active_interventions(self, user_id: str) -> List[Intervention]:
+        query = select(interventions_table).where(
+            interventions_table.c.user_id == user_id,
+            interventions_table.c.completed.is_(False)
+        )
+        async with self.engine.connect() as connection:
+            return [_intervention_from_row(row) for row in await connection.execute(query)]
+
+    async def get_completed_interventions(self) -> List[Intervention]:
+        query = select(interventions_table).where(interventions_table.c.completed.is_(True))
+        async with self.engine.connect() as connection:
+            return [_intervention_from_row(row) for row in await connection.execute(query)]
+
+    async def get_interventions_since(self, since: datetime) -> List[Intervention]:
+        query = select(interventions_table).where(interventions_table.c.created_at >= since)
+        async with self.engine.connect() as connection:
+            return [_intervention_from_row(row) for row in await connection.execute(query)]
+
+    async def add_checkin(self, checkin_id: str, checkin: DailyCheckin) -> None:
+        async with self.engine.begin() as connection:
+            await connection.execute(insert(checkins_table), [{"id": checkin_id, **checkin.dict()}])
+
+    async def add_crisis_alert(self, alert: CrisisAlert) -> None:
+        async with self.engine.begin() as connection:
+            await connection.execute(insert(crisis_alerts_table), [alert.dict()])
+
+    async def get_crisis_alerts_since(self, since: datetime) -> List[CrisisAlert]:
+        query = select(crisis_alerts_table).where(crisis_alerts_table.c.created_at >= since)
+        async with self.engine.connect() as connection:
+            return [CrisisAlert(**row._mapping) for row in await connection.execute(query)]
@@ -1,23 +1,187 @@
 import uuid
 import random
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable, AsyncIterator
 from app.models.emotion import EmotionAnalysis, MoodEntry, Intervention, DailyCheckin, CrisisAlert, MoodType
 from app.services.ai_service import AIService
+from app.services.emotion_repository import EmotionRepository, InMemoryEmotionRepository
+from app.services.write_behind import WriteBehindBuffer
+from app.services.campus_aggregates import CampusAggregator, department_key, GRANULARITIES
+from app.services.hotspot_detector import HotspotDetector
+from app.services.user_insights import UserInsightStore
+from app.services.anonymized_export import DATA_TYPES, FORMATS, decode_cursor, export_rows, format_stream
+from app.services.history_sync import (
+    encode_position, decode_position, ties_at_start, ties_at_end, in_window, history_record, mood_buckets, SYNC_WINDOW
+)
 
 class EmotionService:
-    def __init__(self):
-        self.ai_service = AIService()
-        # Mock storage (in production, use database)
-        self.emotions_db = {}
-        self.interventions_db = {}
-        self.checkins_db = {}
-        self.crisis_alerts_db = {}
+    def __init__(self, ai_service: Optional[AIService] = None, repository: Optional[EmotionRepository] = None,
+                 write_buffer_size: int = 10000, flush_size: int = 500, flush_interval: float = 0.5,
+                 major_lookup: Optional[Callable[[str], Optional[str]]] = None,
+                 on_hotspot: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                 on_analysis: Optional[Callable[[EmotionAnalysis], None]] = None,
+                 on_observed: Optional[Callable[[str, List[Dict[str, Any]]], Awaitable[None]]] = None):
+        # Share the application's initialized AIService when one is given
+        self.ai_service = ai_service or AIService()
+        # Storage backend; in-memory unless a durable repository is configured
+        self.repository = repository or InMemoryEmotionRepository()
+        # Analyses are written behind the request in bulk; crisis alerts and
+        # interventions still go straight to the repository
+        self.write_buffer = WriteBehindBuffer(
+            self.repository.add_analyses,
+            max_queue_size=write_buffer_size,
+            flush_size=flush_size,
+            flush_interval=flush_interval,
+            # Pending analyses by user and by day, for reads that merge them in
+            index_keys=lambda record: (("user", record[1].user_id), ("day", record[1].timestamp.date()))
+        )
+        # Rolling campus counters, updated as analyses and interventions come in;
+        # major_lookup maps a user id to their major (department)
+        self.campus_aggregates = CampusAggregator()
+        self.major_lookup = major_lookup
+        # Distress spikes per department/location; new hotspots go to on_hotspot
+        self.hotspots = HotspotDetector()
+        self.on_hotspot = on_hotspot
+        # Per-user running totals behind generate_user_insights
+        self.user_insights = UserInsightStore()
+        # Called with every stored analysis (and all history at startup)
+        self.on_analysis = on_analysis
+        # The aggregates above only see what this process ingests. With several
+        # workers, on_observed shares each ingested analysis, crisis alert and
+        # intervention (as JSON) and the others fold it in through observe_remote.
+        self.on_observed = on_observed
+
+    async def initialize(self):
+        """Prepare the storage backend and start the write-behind flusher"""
+        await self.repository.initialize()
+        await self._warm_aggregates()
+        self.write_buffer.start()
+
+    async def close(self):
+        """Drain buffered writes and release storage connections"""
+        await self.write_buffer.stop()
+        await self.repository.close()
+
+    async def _warm_aggregates(self) -> None:
+        """Rebuild the running aggregates from stored data.
+
+        Per-user insights need every analysis; campus counters and hotspot
+        windows only those within their retention.
+        """
+        now = datetime.utcnow()
+        since = now - max(timedelta(seconds=width * retention) for width, retention in GRANULARITIES.values())
+        alerts = sorted(await self.repository.get_crisis_alerts_since(since), key=lambda alert: alert.created_at)
+        # The detector wants events in time order; replayed hotspots are not pushed
+        position = 0
+        async for batch in self.repository.iter_analyses_between(datetime(1970, 1, 1), now):
+            for analysis in batch:
+                if analysis.timestamp < since:
+                    self._observe_user_analysis(analysis)
+                    continue
+                while position < len(alerts) and alerts[position].created_at <= analysis.timestamp:
+                    self._observe_crisis_alert(alerts[position])
+                    position += 1
+                self._observe_analysis(analysis)
+        for alert in alerts[position:]:
+            self._observe_crisis_alert(alert)
+        for intervention in await self.repository.get_interventions_since(since):
+            self._observe_intervention(intervention)
+
+    def _department(self, user_id: str) -> str:
+        return department_key(self.major_lookup(user_id) if self.major_lookup else None)
+
+    def _observe_user_analysis(self, analysis: EmotionAnalysis) -> None:
+        self.user_insights.record(analysis)
+        if self.on_analysis:
+            self.on_analysis(analysis)
+
+    def _observe_analysis(self, analysis: EmotionAnalysis) -> Optional[Dict[str, Any]]:
+        """Update the user, campus and hotspot aggregates; returns a new hotspot, if any"""
+        self._observe_user_analysis(analysis)
+        department = self._department(analysis.user_id)
+        self.campus_aggregates.record_analysis(analysis.user_id, analysis.mood, analysis.timestamp, department)
+        return self.hotspots.record_analysis(analysis.user_id, analysis.mood, analysis.timestamp, department)
+
+    def _observe_crisis_alert(self, alert: CrisisAlert) -> List[Dict[str, Any]]:
+        return self.hotspots.record_crisis(
+            alert.user_id, alert.severity, alert.created_at, self._department(alert.user_id), alert.location
+        )
+
+    def _observe_intervention(self, intervention: Intervention) -> None:
+        self.campus_aggregates.record_intervention(intervention.created_at, self._department(intervention.user_id))
+
+    async def _share(self, kind: str, items: List[Any]) -> None:
+        if self.on_observed and items:
+            await self.on_observed(kind, [item.model_dump(mode="json") for item in items])
+
+    def observe_remote(self, kind: str, items: List[Dict[str, Any]]) -> None:
+        """Fold events ingested by another worker into the aggregates.
+
+        Hotspots they start are not pushed here; the ingesting worker's
+        detector sees the same events and pushes them once.
+        """
+        if kind == "analyses":
+            for data in items:
+                self._observe_analysis(EmotionAnalysis(**data))
+        elif kind == "crisis_alerts":
+            for data in items:
+                self._observe_crisis_alert(CrisisAlert(**data))
+        elif kind == "interventions":
+            for data in items:
+                self._observe_intervention(Intervention(**data))
+
+    async def _publish_hotspots(self, hotspots: List[Optional[Dict[str, Any]]]) -> None:
+        if self.on_hotspot is None:
+            return
+        for hotspot in hotspots:
+            if hotspot:
+                await self.on_hotspot(hotspot)
+
+    async def _store_emotion(self, analysis_id: str, analysis: EmotionAnalysis) -> None:
+        """Queue a single analysis for storage"""
+        await self.write_buffer.put((analysis_id, analysis))
+        await self._publish_hotspots([self._observe_analysis(analysis)])
+        await self._share("analyses", [analysis])
+
+    def _pending_emotions(self, user_id: str) -> List[EmotionAnalysis]:
+        """User's analyses accepted by the write buffer but not yet in the repository"""
+        return [analysis for _, analysis in self.write_buffer.pending(("user", user_id))]
+
+    async def _get_user_emotions(self, user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                 limit: Optional[int] = None) -> List[EmotionAnalysis]:
+        """Get user's analyses in timestamp order, optionally only since <= timestamp <= until and the latest `limit`"""
+        stored = await self.repository.get_user_analyses(user_id, since=since, until=until, limit=limit)
+        pending = [
+            analysis for analysis in self._pending_emotions(user_id)
+            if (since is None or analysis.timestamp >= since)
+            and (until is None or analysis.timestamp <= until)
+        ]
+        if not pending:
+            return stored
+        merged = sorted(stored + pending, key=lambda analysis: analysis.timestamp)
+        return merged[-limit:] if limit is not None else merged
         
-    async def analyze_text_emotion(self, user_id: str, text: str, platform: str = "general") -> EmotionAnalysis:
+    async def analyze_text_emotion(self, user_id: str, text: str, platform: str = "general", bypass_cache: bool = False) -> EmotionAnalysis:
         """Analyze emotion from text input"""
-        sentiment_result = await self.ai_service.analyze_sentiment(text)
-        
+        sentiment_result = await self.ai_service.analyze_sentiment(text, bypass_cache=bypass_cache)
+        analysis_id, analysis = self._build_text_analysis(user_id, text, platform, sentiment_result)
+        await self._store_emotion(analysis_id, analysis)
+        return analysis
+
+    async def analyze_text_emotion_batch(self, user_id: str, texts: List[str], platform: str = "general", bypass_cache: bool = False) -> List[EmotionAnalysis]:
+        """Analyze emotion for several texts from one user in a single scoring pass"""
+        sentiment_results = await self.ai_service.analyze_sentiment_batch(texts, bypass_cache=bypass_cache)
+        records = [
+            self._build_text_analysis(user_id, text, platform, sentiment_result)
+            for text, sentiment_result in zip(texts, sentiment_results)
+        ]
+        await self.write_buffer.put_many(records)
+        await self._publish_hotspots([self._observe_analysis(analysis) for _, analysis in records])
+        await self._share("analyses", [analysis for _, analysis in records])
+        return [analysis for _, analysis in records]
+
+    def _build_text_analysis(self, user_id: str, text: str, platform: str, sentiment_result: Dict[str, Any]) -> Tuple[str, EmotionAnalysis]:
+        """Build an analysis (and its id) from a sentiment result"""
         # Determine if intervention is needed
         requires_intervention = (
             sentiment_result['label'] in ['negative', 'stressed'] and 
@@ -35,11 +199,7 @@ class EmotionService:
             timestamp=datetime.utcnow()
         )
         
-        # Store analysis
-        analysis_id = str(uuid.uuid4())
-        self.emotions_db[analysis_id] = analysis
-        
-        return analysis
+        return str(uuid.uuid4()), analysis
 
     async def trigger_intervention(self, user_id: str, emotion_analysis: EmotionAnalysis) -> Intervention:
         """Trigger appropriate intervention based on emotion analysis"""
@@ -93,73 +253,113 @@ class EmotionService:
             created_at=datetime.utcnow()
         )
         
-        self.interventions_db[intervention.id] = intervention
+        await self.repository.add_intervention(intervention)
+        self._observe_intervention(intervention)
+        await self._share("interventions", [intervention])
         return intervention
 
     async def get_user_emotion_history(self, user_id: str, days: int = 30) -> List[Dict[str, Any]]:
         """Get user's emotion history"""
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        user_emotions = [
-            {
-                'mood': analysis.mood.value,
-                'confidence': analysis.confidence,
-                'platform': analysis.platform,
-                'timestamp': analysis.timestamp.isoformat()
-            }
-            for analysis in self.emotions_db.values()
-            if analysis.user_id == user_id and analysis.timestamp >= cutoff_date
+        return [
+            history_record(analysis)
+            for analysis in reversed(await self._get_user_emotions(user_id, since=cutoff_date))
         ]
-        
-        return sorted(user_emotions, key=lambda x: x['timestamp'], reverse=True)
+
+    async def get_user_emotion_page(self, user_id: str, days: int = 30, limit: int = 50,
+                                    cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get one newest-first page of the user's emotion history.
+
+        Pass `next_cursor` back for the following page. The first page also
+        carries a `sync_token` for get_user_emotion_changes.
+        """
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        until, seen = decode_position(cursor) if cursor else (None, 0)
+        # One extra analysis tells whether there is another page
+        analyses = await self._get_user_emotions(user_id, since=cutoff_date, until=until, limit=limit + seen + 1)
+        if seen:
+            # Already returned on earlier pages
+            analyses = analyses[:len(analyses) - min(seen, ties_at_end(analyses, until))]
+        has_more = len(analyses) > limit
+        page = analyses[-limit:] if limit else []
+
+        result = {
+            'items': [history_record(analysis) for analysis in reversed(page)],
+            'next_cursor': None
+        }
+        if has_more:
+            oldest = page[0].timestamp
+            returned = ties_at_start(page, oldest) + (seen if oldest == until else 0)
+            result['next_cursor'] = encode_position(oldest, returned)
+        if cursor is None:
+            result['sync_token'] = self._sync_token(page)
+        return result
+
+    def _sync_token(self, known: List[EmotionAnalysis], previous: Optional[datetime] = None) -> str:
+        """Sync position after the newest of `known` (timestamp order): its timestamp and
+        how many analyses the client holds in the SYNC_WINDOW ending there"""
+        if not known:
+            newest = previous or datetime(1970, 1, 1)
+            return encode_position(newest, 0)
+        newest = known[-1].timestamp
+        return encode_position(newest, in_window(known, newest))
+
+    async def get_user_emotion_changes(self, user_id: str, sync_token: str, limit: int = 500) -> Dict[str, Any]:
+        """Get analyses added since `sync_token`, oldest first, with the token for the next sync.
+
+        Analyses can be committed after newer ones were synced (another
+        worker's write-behind buffer). The token counts the analyses the
+        client holds in the SYNC_WINDOW before its position; when that count
+        no longer matches, the response re-sends the whole window and carries
+        `resync_from`: the client replaces its analyses from that timestamp on.
+        """
+        since, held = decode_position(sync_token)
+        analyses = await self._get_user_emotions(user_id, since=since - SYNC_WINDOW)
+        synced = [analysis for analysis in analyses if analysis.timestamp <= since]
+        resync = len(synced) != held
+        pending = analyses if resync else analyses[len(synced):]
+        items = pending[:limit]
+        # Never split analyses sharing a timestamp across responses
+        while items and len(items) < len(pending) and pending[len(items)].timestamp == items[-1].timestamp:
+            items.append(pending[len(items)])
+        result = {
+            'items': [history_record(analysis) for analysis in items],
+            'sync_token': self._sync_token(items if resync else synced + items, previous=since),
+            'has_more': len(pending) > len(items)
+        }
+        if resync:
+            result['resync_from'] = (since - SYNC_WINDOW).isoformat()
+        return result
+
+    async def get_user_mood_buckets(self, user_id: str, days: int = 30, resolution: str = "hour") -> Dict[str, Any]:
+        """Get the user's emotion history downsampled to hourly or daily mood buckets"""
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        analyses = await self._get_user_emotions(user_id, since=cutoff_date)
+        return {
+            'resolution': resolution,
+            'buckets': mood_buckets(analyses, resolution)
+        }
 
     async def generate_user_insights(self, user_id: str) -> Dict[str, Any]:
         """Generate personalized insights for user"""
-        user_emotions = [
-            analysis for analysis in self.emotions_db.values()
-            if analysis.user_id == user_id
-        ]
+        insights = self.user_insights.insights(user_id, datetime.utcnow().date())
         
-        if not user_emotions:
+        if insights is None:
             return {
                 'patterns': {},
                 'triggers': [],
                 'recommendations': ['Start tracking your mood to get personalized insights!']
             }
         
-        # Analyze mood patterns
-        mood_counts = {}
-        for emotion in user_emotions:
-            mood = emotion.mood.value
-            mood_counts[mood] = mood_counts.get(mood, 0) + 1
-        
-        # Find triggers
-        triggers = {}
-        for emotion in user_emotions:
-            if emotion.platform != 'general':
-                triggers[emotion.platform] = triggers.get(emotion.platform, 0) + 1
-        
-        # Generate recommendations
-        recommendations = []
-        if mood_counts.get('negative', 0) > mood_counts.get('positive', 0):
-            recommendations.append("Consider incorporating daily mindfulness practices")
-        if triggers.get('instagram', 0) > 5:
-            recommendations.append("Instagram usage shows correlation with mood changes")
-        if mood_counts.get('stressed', 0) > 3:
-            recommendations.append("Try time management techniques to reduce stress")
-        
-        return {
-            'patterns': mood_counts,
-            'triggers': [{'platform': k, 'count': v} for k, v in triggers.items()],
-            'recommendations': recommendations
-        }
+        return insights
 
     async def create_mood_entry(self, mood_data: MoodEntry) -> MoodEntry:
         """Create a manual mood entry"""
         entry_id = str(uuid.uuid4())
         mood_data.timestamp = datetime.utcnow()
         
-        # Store in emotions_db as well for consistency
+        # Store as an analysis as well for consistency
         analysis = EmotionAnalysis(
             user_id=mood_data.user_id,
             text=mood_data.notes or f"Manual mood entry: {mood_data.mood.value}",
@@ -171,25 +371,23 @@ class EmotionService:
             timestamp=mood_data.timestamp
         )
         
-        self.emotions_db[entry_id] = analysis
+        await self._store_emotion(entry_id, analysis)
         return mood_data
 
     async def get_active_interventions(self, user_id: str) -> List[Intervention]:
         """Get active interventions for user"""
-        return [
-            intervention for intervention in self.interventions_db.values()
-            if intervention.user_id == user_id and not intervention.completed
-        ]
+        return await self.repository.get_active_interventions(user_id)
 
     async def complete_intervention(self, intervention_id: str, user_id: str, effectiveness_rating: int) -> Dict[str, Any]:
         """Mark intervention as completed"""
-        intervention = self.interventions_db.get(intervention_id)
+        intervention = await self.repository.get_intervention(intervention_id)
         if not intervention or intervention.user_id != user_id:
             raise Exception("Intervention not found")
         
         intervention.completed = True
         intervention.completed_at = datetime.utcnow()
         intervention.effectiveness_rating = effectiveness_rating
+        await self.repository.update_intervention(intervention)
         
         return {
             'success': True,
@@ -214,7 +412,7 @@ class EmotionService:
         )
         
         checkin_id = str(uuid.uuid4())
-        self.checkins_db[checkin_id] = checkin
+        await self.repository.add_checkin(checkin_id, checkin)
         
         return checkin
 
@@ -230,68 +428,32 @@ class EmotionService:
             created_at=datetime.utcnow()
         )
         
-        self.crisis_alerts_db[alert.id] = alert
+        # Crisis alerts bypass the write buffer and are committed before returning
+        await self.repository.add_crisis_alert(alert)
+        await self._publish_hotspots(self._observe_crisis_alert(alert))
+        await self._share("crisis_alerts", [alert])
         return alert
 
     async def get_campus_insights(self, timeframe: str = "week", department: Optional[str] = None) -> Dict[str, Any]:
         """Get campus-wide mental health insights"""
-        # Mock campus data
-        return {
-            'total_students': 12847,
-            'active_users': 3421,
-            'average_mood_score': 6.8,
-            'interventions_triggered': 247,
-            'support_sessions': 34,
-            'trends': {
-                'mood_improving': True,
-                'stress_levels': 'moderate',
-                'high_risk_areas': ['Library - 3rd Floor', 'Engineering Building']
-            },
-            'department_breakdown': {
-                'computer_science': {'avg_mood': 6.2, 'stress_level': 7.8},
-                'engineering': {'avg_mood': 6.5, 'stress_level': 7.5},
-                'business': {'avg_mood': 7.1, 'stress_level': 6.2}
-            }
-        }
+        return self.campus_aggregates.query(timeframe=timeframe, department=department)
 
     async def get_high_risk_alerts(self) -> List[Dict[str, Any]]:
         """Get high-risk student alerts for counselors"""
-        return [
-            {
-                'id': 'alert_1',
-                'location': 'Library - 3rd Floor',
-                'students_affected': 8,
-                'severity': 'high',
-                'type': 'academic_stress',
-                'timeframe': 'last_24h'
-            },
-            {
-                'id': 'alert_2',
-                'location': 'Student Dormitories',
-                'students_affected': 6,
-                'severity': 'medium',
-                'type': 'social_isolation',
-                'timeframe': 'last_12h'
-            }
-        ]
+        return self.hotspots.get_active_hotspots()
 
     async def get_active_user_count(self) -> int:
         """Get number of active users"""
-        return len(self.emotions_db)
+        return await self.repository.count_analyses() + self.write_buffer.queue_depth
 
     async def get_daily_analysis_count(self) -> int:
         """Get number of analyses performed today"""
         today = datetime.utcnow().date()
-        return len([
-            analysis for analysis in self.emotions_db.values()
-            if analysis.timestamp.date() == today
-        ])
+        return await self.repository.count_analyses_on(today) + self.write_buffer.pending_count(("day", today))
 
     async def get_intervention_success_rate(self) -> float:
         """Get intervention success rate"""
-        completed_interventions = [
-            i for i in self.interventions_db.values() if i.completed
-        ]
+        completed_interventions = await self.repository.get_completed_interventions()
         if not completed_interventions:
             return 0.0
         
@@ -318,7 +480,7 @@ class EmotionService:
         )
         
         analysis_id = str(uuid.uuid4())
-        self.emotions_db[analysis_id] = emotion_analysis
+        await self._store_emotion(analysis_id, emotion_analysis)
 
     async def check_browsing_distress(self, user_id: str, interaction_data: Dict[str, Any]) -> None:
         """Check for browsing distress patterns"""
@@ -338,7 +500,17 @@ class EmotionService:
                 created_at=datetime.utcnow()
             )
             
-            self.interventions_db[intervention.id] = intervention
+            await self.repository.add_intervention(intervention)
+            self._observe_intervention(intervention)
+            await self._share("interventions", [intervention])
+
+    def get_write_buffer_stats(self) -> Dict[str, Any]:
+        """Get write-behind queue depth and flush counters"""
+        return self.write_buffer.get_stats()
+
+    def get_hotspot_stats(self) -> Dict[str, Any]:
+        """Get hotspot detector event and area counters"""
+        return self.hotspots.get_stats()
 
     async def get_personalized_resources(self, user_id: str) -> List[Dict[str, Any]]:
         """Get personalized mental health resources"""
@@ -391,25 +563,22 @@ class EmotionService:
             }
         ]
 
+    async def _export_rows(self, start_date: datetime, end_date: datetime, data_type: str, cursor: Optional[str] = None):
+        if data_type not in DATA_TYPES:
+            raise Exception(f"Unknown data type: {data_type}")
+        resume_from, skip = decode_cursor(cursor, data_type) if cursor else (start_date, 0)
+        if resume_from < start_date:
+            resume_from, skip = start_date, 0
+        # Exports read the repository only, so commit what is buffered first
+        await self.write_buffer.drain()
+        batches = self.repository.iter_analyses_between(resume_from, end_date)
+        return export_rows(batches, data_type, resume_from, skip)
+
     async def export_anonymized_data(self, start_date: datetime, end_date: datetime, data_type: str) -> Dict[str, Any]:
         """Export anonymized data for research"""
-        # Filter data by date range
-        filtered_data = [
-            analysis for analysis in self.emotions_db.values()
-            if start_date <= analysis.timestamp <= end_date
-        ]
-        
-        # Anonymize data
         anonymized_data = []
-        for analysis in filtered_data:
-            anonymized_data.append({
-                'mood': analysis.mood.value,
-                'confidence': analysis.confidence,
-                'platform': analysis.platform,
-                'timestamp': analysis.timestamp.isoformat(),
-                'requires_intervention': analysis.requires_intervention
-                # Note: user_id and text are NOT included for privacy
-            })
+        async for rows, _ in await self._export_rows(start_date, end_date, data_type):
+            anonymized_data.extend(rows)
         
         return {
             'data_type': data_type,
@@ -419,4 +588,12 @@ class EmotionService:
             },
             'total_records': len(anonymized_data),
             'data': anonymized_data
-        }
\ No newline at end of file
+        }
+
+    async def stream_anonymized_data(self, start_date: datetime, end_date: datetime, data_type: str,
+                                     output_format: str = "ndjson", cursor: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream anonymized data for research as NDJSON, CSV or column batches, resumable from a cursor"""
+        if output_format not in FORMATS:
+            raise Exception(f"Unknown export format: {output_format}")
+        rows = await self._export_rows(start_date, end_date, data_type, cursor)
+        return format_stream(rows, data_type, output_format)
\ No newline at end of file
@@ -0,0 +1,81 @@
+from typing import Dict, Any, Set
+
+_EMPTY: Set[str] = frozenset()
+
+
+class GroupMembershipRegistry:
+    """Support group membership in both directions, plus who is online.
+
+    group -> members and user -> groups are sets, and each group also keeps
+    the set of its members that are currently online, updated as users
+    connect and disconnect. Online members and active counts are therefore
+    read directly instead of intersecting member lists with presence.
+    """
+
+    def __init__(self):
+        self.members: Dict[str, Set[str]] = {}
+        self.groups: Dict[str, Set[str]] = {}
+        # Users with a live connection, and the online subset of each group
+        self.online: Set[str] = set()
+        self.online_members: Dict[str, Set[str]] = {}
+
+    def add(self, group_id: str, user_id: str) -> bool:
+        """Add a member; False if they already were one"""
+        members = self.members.setdefault(group_id, set())
+        if user_id in members:
+            return False
+        members.add(user_id)
+        self.groups.setdefault(user_id, set()).add(group_id)
+        if user_id in self.online:
+            self.online_members.setdefault(group_id, set()).add(user_id)
+        return True
+
+    def remove(self, group_id: str, user_id: str) -> bool:
+        members = self.members.get(group_id)
+        if not members or user_id not in members:
+            return False
+        members.discard(user_id)
+        self.groups[user_id].discard(group_id)
+        self.online_members.get(group_id, set()).discard(user_id)
+        return True
+
+    def set_online(self, user_id: str, online: bool) -> None:
+        if online == (user_id in self.online):
+            return
+        if online:
+            self.online.add(user_id)
+            for group_id in self.groups.get(user_id, ()):
+                self.online_members.setdefault(group_id, set()).add(user_id)
+        else:
+            self.online.discard(user_id)
+            for group_id in self.groups.get(user_id, ()):
+                self.online_members.get(group_id, set()).discard(user_id)
+
+    def is_member(self, group_id: str, user_id: str) -> bool:
+        return user_id in self.members.get(group_id, _EMPTY)
+
+    def members_of(self, group_id: str) -> Set[str]:
+        return self.members.get(group_id, _EMPTY)
+
+    def groups_of(self, user_id: str) -> Set[str]:
+        return self.groups.get(user_id, _EMPTY)
+
+    def online_members_of(self, group_id: str) -> Set[str]:
+        return self.online_members.get(group_id, _EMPTY)
+
+    def active_now(self, group_id: str) -> int:
+        return len(self.online_members.get(group_id, _EMPTY))
+
+    def clear(self) -> None:
+        """Forget memberships (presence is kept)"""
+        self.members.clear()
+        self.groups.clear()
+        self.online_members.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "groups": len(self.members),
+            "memberships": sum(len(members) for members in self.members.values()),
+            "online_users": len(self.online),
+            "online_memberships": sum(len(members) for members in self.online_members.values())
+        }
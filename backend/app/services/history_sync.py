@@ -0,0 +1,96 @@
+import base64
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Tuple
+from app.models.emotion import EmotionAnalysis, MoodType
+from app.services.campus_aggregates import MOOD_SCORES
+from app.services.columnar_store import to_epoch_us, from_epoch_us
+
+# Resolution -> timestamp truncation for downsampled history
+RESOLUTIONS = {
+    "hour": lambda timestamp: timestamp.replace(minute=0, second=0, microsecond=0),
+    "day": lambda timestamp: timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+}
+
+# How far back a sync re-checks for analyses committed after newer ones were
+# already synced (another worker's write-behind buffer, clock skew between
+# workers). Later stragglers are only picked up by a full reload.
+SYNC_WINDOW = timedelta(seconds=60)
+
+
+def encode_position(timestamp: datetime, count: int) -> str:
+    """Opaque position in a user's history: a timestamp and a count (analyses carry no id).
+
+    Page cursors count the analyses at exactly that timestamp on the near side
+    of it; sync tokens count those in the SYNC_WINDOW ending there.
+    """
+    return base64.urlsafe_b64encode(f"{to_epoch_us(timestamp)}.{count}".encode()).decode().rstrip("=")
+
+
+def decode_position(token: str) -> Tuple[datetime, int]:
+    try:
+        padded = token.strip('"') + "=" * (-len(token.strip('"')) % 4)
+        timestamp, count = base64.urlsafe_b64decode(padded.encode()).decode().split(".")
+        return from_epoch_us(int(timestamp)), int(count)
+    except ValueError:
+        raise Exception("Invalid history cursor")
+
+
+def ties_at_end(analyses: List[EmotionAnalysis], timestamp: datetime) -> int:
+    """Number of trailing analyses (timestamp order) at exactly `timestamp`"""
+    count = 0
+    for analysis in reversed(analyses):
+        if analysis.timestamp != timestamp:
+            break
+        count += 1
+    return count
+
+
+def ties_at_start(analyses: List[EmotionAnalysis], timestamp: datetime) -> int:
+    """Number of leading analyses (timestamp order) at exactly `timestamp`"""
+    count = 0
+    for analysis in analyses:
+        if analysis.timestamp != timestamp:
+            break
+        count += 1
+    return count
+
+
+def history_record(analysis: EmotionAnalysis) -> Dict[str, Any]:
+    return {
+        'mood': analysis.mood.value,
+        'confidence': analysis.confidence,
+        'platform': analysis.platform,
+        'timestamp': analysis.timestamp.isoformat()
+    }
+
+
+def mood_buckets(analyses: List[EmotionAnalysis], resolution: str) -> List[Dict[str, Any]]:
+    """Per-bucket mood counts and average score, in time order"""
+    if resolution not in RESOLUTIONS:
+        raise Exception(f"Unknown resolution: {resolution}")
+    truncate = RESOLUTIONS[resolution]
+    buckets: Dict[datetime, Dict[MoodType, int]] = {}
+    for analysis in analyses:
+        start = truncate(analysis.timestamp)
+        counts = buckets.get(start)
+        if counts is None:
+            buckets[start] = counts = dict.fromkeys(MoodType, 0)
+        counts[analysis.mood] += 1
+
+    result = []
+    for start, counts in sorted(buckets.items()):
+        total = sum(counts.values())
+        result.append({
+            'start': start.isoformat(),
+            'count': total,
+            'moods': {mood.value: count for mood, count in counts.items() if count},
+            'dominant_mood': max(counts, key=counts.get).value,
+            'average_mood_score': round(sum(MOOD_SCORES[mood] * count for mood, count in counts.items()) / total, 2)
+        })
+    return result
+
+
+def in_window(analyses: List[EmotionAnalysis], newest: datetime) -> int:
+    """Number of analyses within SYNC_WINDOW up to and including `newest`"""
+    start = newest - SYNC_WINDOW
+    return sum(1 for analysis in analyses if start <= analysis.timestamp <= newest)
@@ -0,0 +1,202 @@
+import math
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from app.models.emotion import MoodType
+
+SLOT_SECONDS = 300
+WINDOW_SLOTS = 12   # one hour sliding window of five minute slots
+# Idle slots folded into the baseline one at a time before it is left as is
+MAX_IDLE_SLOTS = 288
+CRISIS_WEIGHTS = {"low": 1.0, "medium": 2.0, "high": 4.0, "critical": 6.0}
+DISTRESS_MOODS = (MoodType.NEGATIVE, MoodType.STRESSED)
+# Event kinds, in ring order
+NEGATIVE, STRESSED, CRISIS = 0, 1, 2
+
+
+def _epoch_seconds(timestamp: datetime) -> float:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class AreaWindow:
+    """Sliding window counts and baseline for one department or location"""
+
+    __slots__ = ("kind", "name", "first_slot", "slot", "rings", "totals", "mean", "variance", "users", "hotspot")
+
+    def __init__(self, kind: str, name: str, slot: int):
+        self.kind = kind
+        self.name = name
+        self.first_slot = slot
+        self.slot = slot
+        # Per-kind weighted counts for each slot in the window, and their sums
+        self.rings = [[0.0] * WINDOW_SLOTS for _ in range(3)]
+        self.totals = [0.0, 0.0, 0.0]
+        # Exponentially weighted mean and variance of the window score
+        self.mean = 0.0
+        self.variance = 0.0
+        # user_id -> last event time, oldest first
+        self.users: "OrderedDict[str, float]" = OrderedDict()
+        self.hotspot: Optional[Dict[str, Any]] = None
+
+    @property
+    def score(self) -> float:
+        return self.totals[NEGATIVE] + self.totals[STRESSED] + self.totals[CRISIS]
+
+
+class HotspotDetector:
+    """Flags departments and locations with unusual spikes of distress.
+
+    Negative and stressed analyses count 1 and crisis alerts count by
+    severity. Each area keeps the counts of the last hour in five minute
+    slots together with an exponentially weighted baseline of that hourly
+    score, updated as slots roll over. An area becomes a hotspot when its
+    score is at least `min_score` and `threshold` deviations above the
+    baseline (the deviation has a Poisson floor so quiet areas need a real
+    burst), and clears once it drops under half the threshold. Areas are
+    only flagged after `warmup_slots` of history. Every event does a bounded
+    amount of work, so the detector keeps up with ingest.
+
+    Time comes from the event timestamps, so history can be replayed.
+    """
+
+    def __init__(self, threshold: float = 4.0, min_score: float = 5.0, baseline_alpha: float = 0.005,
+                 warmup_slots: int = 288):
+        self.threshold = threshold
+        self.warmup_slots = warmup_slots
+        self.min_score = min_score
+        self.baseline_alpha = baseline_alpha
+        self.areas: Dict[Tuple[str, str], AreaWindow] = {}
+        self.active: Dict[Tuple[str, str], AreaWindow] = {}
+        self.stats = {"events": 0, "hotspots_detected": 0, "late_events_dropped": 0}
+
+    def _fold(self, area: AreaWindow, score: float) -> None:
+        """Fold one finished window score into the baseline"""
+        alpha = self.baseline_alpha
+        diff = score - area.mean
+        area.mean += alpha * diff
+        area.variance = (1 - alpha) * (area.variance + alpha * diff * diff)
+
+    def _advance(self, area: AreaWindow, slot: int) -> None:
+        """Roll the window forward to `slot`"""
+        steps = slot - area.slot
+        if steps <= 0:
+            return
+        for _ in range(min(steps, WINDOW_SLOTS)):
+            self._fold(area, area.score)
+            area.slot += 1
+            position = area.slot % WINDOW_SLOTS
+            for kind in (NEGATIVE, STRESSED, CRISIS):
+                area.totals[kind] -= area.rings[kind][position]
+                area.rings[kind][position] = 0.0
+        # The window is empty from here on
+        for _ in range(min(slot - area.slot, MAX_IDLE_SLOTS)):
+            self._fold(area, 0.0)
+        area.slot = slot
+        if area.score < 1e-9:
+            area.totals = [0.0, 0.0, 0.0]
+
+    def _deviations(self, area: AreaWindow) -> float:
+        return (area.score - area.mean) / math.sqrt(area.variance + area.mean + 1.0)
+
+    def _students_affected(self, area: AreaWindow) -> int:
+        window_start = (area.slot - WINDOW_SLOTS + 1) * SLOT_SECONDS
+        users = area.users
+        while users:
+            _, seen = next(iter(users.items()))
+            if seen >= window_start:
+                break
+            users.popitem(last=False)
+        return len(users)
+
+    def _describe(self, area: AreaWindow, detected_at: datetime) -> Dict[str, Any]:
+        totals = area.totals
+        if totals[CRISIS] >= totals[NEGATIVE] + totals[STRESSED]:
+            kind = "crisis"
+        elif totals[STRESSED] >= totals[NEGATIVE]:
+            kind = "stress"
+        else:
+            kind = "low_mood"
+        deviations = self._deviations(area)
+        return {
+            'id': area.hotspot['id'] if area.hotspot else str(uuid.uuid4()),
+            'location': area.name,
+            'area_type': area.kind,
+            'students_affected': self._students_affected(area),
+            'severity': 'high' if deviations >= 2 * self.threshold or totals[CRISIS] >= CRISIS_WEIGHTS["high"] else 'medium',
+            'type': kind,
+            'timeframe': 'last_1h',
+            'score': round(area.score, 1),
+            'baseline': round(area.mean, 2),
+            'deviations': round(deviations, 1),
+            'detected_at': area.hotspot['detected_at'] if area.hotspot else detected_at.isoformat()
+        }
+
+    def _record(self, kind: str, name: str, user_id: str, event: int, weight: float,
+                timestamp: datetime) -> Optional[Dict[str, Any]]:
+        self.stats["events"] += 1
+        seconds = _epoch_seconds(timestamp)
+        slot = int(seconds // SLOT_SECONDS)
+        key = (kind, name)
+        area = self.areas.get(key)
+        if area is None:
+            self.areas[key] = area = AreaWindow(kind, name, slot)
+        self._advance(area, slot)
+        if slot <= area.slot - WINDOW_SLOTS:
+            self.stats["late_events_dropped"] += 1
+            return None
+
+        area.rings[event][slot % WINDOW_SLOTS] += weight
+        area.totals[event] += weight
+        area.users[user_id] = max(seconds, area.users.pop(user_id, seconds))
+        self._students_affected(area)  # prunes users who left the window
+
+        deviations = self._deviations(area)
+        if area.hotspot is None:
+            if (area.score >= self.min_score and deviations >= self.threshold
+                    and area.slot - area.first_slot >= self.warmup_slots):
+                area.hotspot = self._describe(area, timestamp)
+                self.active[key] = area
+                self.stats["hotspots_detected"] += 1
+                return area.hotspot
+        elif deviations < self.threshold / 2:
+            area.hotspot = None
+            self.active.pop(key, None)
+        return None
+
+    def record_analysis(self, user_id: str, mood: MoodType, timestamp: datetime,
+                        department: str) -> Optional[Dict[str, Any]]:
+        """Count a distress analysis; returns a hotspot if this event started one"""
+        if mood not in DISTRESS_MOODS:
+            return None
+        event = NEGATIVE if mood == MoodType.NEGATIVE else STRESSED
+        return self._record("department", department, user_id, event, 1.0, timestamp)
+
+    def record_crisis(self, user_id: str, severity: str, timestamp: datetime, department: str,
+                      location: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Count a crisis alert for the department and location; returns any new hotspots"""
+        weight = CRISIS_WEIGHTS.get(severity, 1.0)
+        areas = [("department", department)]
+        if location:
+            areas.append(("location", location))
+        detected = [self._record(kind, name, user_id, CRISIS, weight, timestamp) for kind, name in areas]
+        return [hotspot for hotspot in detected if hotspot]
+
+    def get_active_hotspots(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Current hotspots, strongest first"""
+        slot = int(_epoch_seconds(now or datetime.utcnow()) // SLOT_SECONDS)
+        hotspots = []
+        for key, area in list(self.active.items()):
+            self._advance(area, slot)
+            if self._deviations(area) < self.threshold / 2:
+                area.hotspot = None
+                del self.active[key]
+                continue
+            area.hotspot = self._describe(area, now or datetime.utcnow())
+            hotspots.append(area.hotspot)
+        return sorted(hotspots, key=lambda hotspot: hotspot['deviations'], reverse=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "areas": len(self.areas), "active_hotspots": len(self.active)}
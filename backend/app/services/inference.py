@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+from app.services.lexicon import CompiledLexicon, tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def classify_keyword_scores(scores: Dict[str, float]) -> Dict[str, Any]:
+    """Turn per-category keyword scores into a sentiment label"""
+    positive_score = scores['positive']
+    negative_score = scores['negative']
+    stress_score = scores['stress']
+
+    # Determine sentiment
+    if stress_score > 0 and stress_score >= positive_score:
+        label = 'stressed'
+        confidence = min(0.7 + stress_score * 0.1, 0.95)
+    elif negative_score > positive_score:
+        label = 'negative'
+        confidence = min(0.6 + negative_score * 0.1, 0.95)
+    elif positive_score > negative_score:
+        label = 'positive'
+        confidence = min(0.6 + positive_score * 0.1, 0.95)
+    else:
+        label = 'neutral'
+        confidence = 0.5
+
+    return {
+        'label': label,
+        'confidence': confidence,
+        'scores': {
+            'positive': positive_score,
+            'negative': negative_score,
+            'stress': stress_score
+        }
+    }
+
+
+class KeywordSentimentBackend:
+    """Default backend: the compiled keyword lexicon"""
+
+    name = 'keyword'
+
+    def __init__(self, keywords: Dict[str, List[str]]):
+        self.keywords = keywords
+        self.lexicon: Optional[CompiledLexicon] = None
+
+    def load(self):
+        self.lexicon = CompiledLexicon(self.keywords)
+
+    def predict_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        return [classify_keyword_scores(self.lexicon.score(text)) for text in texts]
+
+
+class SklearnSentimentBackend:
+    """Small scikit-learn text classifier.
+
+    Loads a pickled pipeline exposing `predict_proba` and `classes_` from
+    `model_path`. Without a model file, a TF-IDF + logistic regression model
+    is bootstrapped from the keyword lexicon so the backend works out of the box.
+    """
+
+    name = 'sklearn'
+
+    def __init__(self, keywords: Dict[str, List[str]], model_path: Optional[str] = None):
+        self.keywords = keywords
+        self.model_path = model_path
+        self.model = None
+
+    def load(self):
+        if self.model_path:
+            with open(self.model_path, 'rb') as model_file:
+                self.model = pickle.load(model_file)
+        else:
+            self.model = self._train_bootstrap_model()
+
+    def _train_bootstrap_model(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        labels = {'positive': 'positive', 'negative': 'negative', 'stress': 'stressed'}
+        documents, targets = [], []
+        for category, terms in self.keywords.items():
+            for term in terms:
+                documents.extend([term, f"i feel {term}", f"so much {term} today"])
+                targets.extend([labels[category]] * 3)
+        for text in ['hello', 'ok', 'see you later', 'what time is it', 'the weather today', 'i went to class']:
+            documents.append(text)
+            targets.append('neutral')
+
+        model = make_pipeline(
+            TfidfVectorizer(tokenizer=tokenize, token_pattern=None, ngram_range=(1, 2)),
+            LogisticRegression(max_iter=1000)
+        )
+        model.fit(documents, targets)
+        return model
+
+    def predict_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        classes = list(self.model.classes_)
+        results = []
+        for probabilities in self.model.predict_proba(texts):
+            best = int(probabilities.argmax())
+            results.append({
+                'label': classes[best],
+                'confidence': float(probabilities[best]),
+                'scores': {label: float(p) for label, p in zip(classes, probabilities)}
+            })
+        return results
+
+
+SENTIMENT_BACKENDS = {
+    'keyword': KeywordSentimentBackend,
+    'sklearn': SklearnSentimentBackend
+}
+
+
+def create_backend(name: str, keywords: Dict[str, List[str]], options: Optional[Dict[str, Any]] = None):
+    if name not in SENTIMENT_BACKENDS:
+        raise Exception(f"Unknown sentiment backend: {name}")
+    return SENTIMENT_BACKENDS[name](keywords, **(options or {}))
+
+
+# Backend instance owned by each worker process
+_worker_backend = None
+
+
+def _init_worker(name: str, keywords: Dict[str, List[str]], options: Optional[Dict[str, Any]]):
+    global _worker_backend
+    _worker_backend = create_backend(name, keywords, options)
+    _worker_backend.load()
+
+
+def _predict_in_worker(texts: List[str]) -> List[Dict[str, Any]]:
+    return _worker_backend.predict_batch(texts)
+
+
+class InferencePool:
+    """Micro-batching front end for sentiment model inference.
+
+    Requests go into a bounded asyncio queue (callers wait when it is full).
+    A collector task groups them into batches of up to `max_batch_size`
+    texts, waiting at most `max_wait_ms` for a batch to fill, and runs each
+    batch on a pool of `workers` processes so model code never blocks the
+    event loop. With `workers=0` batches run inline, which is only meant for
+    the cheap keyword backend.
+    """
+
+    def __init__(self, backend: str, keywords: Dict[str, List[str]], backend_options: Optional[Dict[str, Any]] = None,
+                 workers: int = 0, max_batch_size: int = 32, max_wait_ms: float = 2.0, max_queue_size: int = 1000):
+        self.backend_name = backend
+        self.keywords = keywords
+        self.backend_options = backend_options
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inline_backend = None
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+        self._running_batches = set()
+
+        self.stats = {
+            'requests': 0,
+            'batches': 0,
+            'failed_batches': 0
+        }
+
+    async def start(self):
+        """Load the backend and start collecting requests"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.backend_name, self.keywords, self.backend_options)
+            )
+            self._batch_slots = asyncio.Semaphore(self.workers)
+            # Warm up every worker so the first requests don't pay for model loading
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[
+                loop.run_in_executor(self._executor, _predict_in_worker, [''])
+                for _ in range(self.workers)
+            ])
+        else:
+            self._inline_backend = create_backend(self.backend_name, self.keywords, self.backend_options)
+            self._inline_backend.load()
+            self._batch_slots = asyncio.Semaphore(1)
+        self._collector = asyncio.create_task(self._collect_batches())
+        logger.info(f"Inference pool started: backend={self.backend_name}, workers={self.workers}")
+
+    async def stop(self):
+        """Stop collecting, fail queued requests and shut down workers"""
+        if self._collector:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        if self._running_batches:
+            await asyncio.gather(*self._running_batches, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(Exception("Inference pool stopped"))
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def predict(self, text: str) -> Dict[str, Any]:
+        """Queue one text and wait for its result"""
+        return (await self.predict_many([text]))[0]
+
+    async def predict_many(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Queue several texts and wait for all their results"""
+        if self._collector is None:
+            raise Exception("Inference pool not started")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            # Blocks while the queue is full, pushing back on callers
+            await self._queue.put((text, future))
+            futures.append(future)
+        self.stats['requests'] += len(texts)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._batch_slots.acquire()
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(Exception("Inference pool stopped"))
+                raise
+
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running_batches.add(task)
+            task.add_done_callback(self._running_batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            if self._executor:
+                loop = asyncio.get_running_loop()
+                results = await loop.run_in_executor(self._executor, _predict_in_worker, texts)
+            else:
+                results = self._inline_backend.predict_batch(texts)
+            self.stats['batches'] += 1
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            logger.error(f"Inference batch failed: {e}")
+            self.stats['failed_batches'] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._batch_slots.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'backend': self.backend_name,
+            'workers': self.workers,
+            'queue_length': self._queue.qsize() if self._queue else 0,
+            'active_batches': len(self._running_batches),
+            **self.stats
+        }
@@ -0,0 +1,93 @@
+import re
+from typing import Dict, List, Tuple, Optional
+
+# Lowercase words, keeping contractions like "can't" together but splitting off possessive 's
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'(?!s\b)[a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens, ignoring punctuation"""
+    return TOKEN_PATTERN.findall(text.lower().replace('’', "'"))
+
+
+class CompiledLexicon:
+    """Keyword lexicon compiled into hash tables so text is scored in one pass.
+
+    Every term (a single word or a multi-word phrase such as "can't sleep")
+    gets an integer id. Single words are looked up directly; phrases are
+    indexed by their first token and matched greedily, longest first, so a
+    phrase match consumes its tokens.
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]], weights: Optional[Dict[str, float]] = None):
+        weights = weights or {}
+        self.categories: List[str] = list(keywords)
+        # term id -> (category index, weight)
+        self.term_entries: List[Tuple[int, float]] = []
+        self.term_names: List[str] = []
+        # token -> term ids for single-word terms (a word may sit in several categories)
+        self.word_terms: Dict[str, List[int]] = {}
+        # first token -> [(remaining tokens, term id)], longest phrase first
+        self.phrase_terms: Dict[str, List[Tuple[Tuple[str, ...], int]]] = {}
+
+        for category_index, category in enumerate(self.categories):
+            for term in keywords[category]:
+                tokens = tokenize(term)
+                if not tokens:
+                    continue
+                term_id = len(self.term_entries)
+                self.term_entries.append((category_index, weights.get(term, 1)))
+                self.term_names.append(term)
+                if len(tokens) == 1:
+                    self.word_terms.setdefault(tokens[0], []).append(term_id)
+                else:
+                    self.phrase_terms.setdefault(tokens[0], []).append((tuple(tokens[1:]), term_id))
+
+        for candidates in self.phrase_terms.values():
+            candidates.sort(key=lambda candidate: len(candidate[0]), reverse=True)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self.term_entries)
+
+    def match_tokens(self, tokens: List[str]) -> List[int]:
+        """Return the ids of all terms found in a token list"""
+        matches = []
+        word_terms = self.word_terms
+        phrase_terms = self.phrase_terms
+        position = 0
+        token_count = len(tokens)
+
+        while position < token_count:
+            token = tokens[position]
+            candidates = phrase_terms.get(token)
+            if candidates:
+                matched = False
+                for rest, term_id in candidates:
+                    end = position + 1 + len(rest)
+                    if end <= token_count and tuple(tokens[position + 1:end]) == rest:
+                        matches.append(term_id)
+                        position = end
+                        matched = True
+                        break
+                if matched:
+                    continue
+            term_ids = word_terms.get(token)
+            if term_ids:
+                matches.extend(term_ids)
+            position += 1
+
+        return matches
+
+    def match(self, text: str) -> List[int]:
+        """Return the ids of all terms found in text"""
+        return self.match_tokens(tokenize(text))
+
+    def score(self, text: str) -> Dict[str, float]:
+        """Score text against every category in a single pass"""
+        totals = [0] * len(self.categories)
+        term_entries = self.term_entries
+        for term_id in self.match(text):
+            category_index, weight = term_entries[term_id]
+            totals[category_index] += weight
+        return dict(zip(self.categories, totals))
@@ -0,0 +1,236 @@
+import base64
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Iterable, Callable, Tuple
+from app.models.peer_support import Message
+
+# Most recent messages kept in memory per conversation, and how many
+# conversations keep them (least recently read ones are evicted)
+HOT_TAIL_SIZE = 50
+MAX_HOT_CONVERSATIONS = 10000
+
+
+def peer_conversation(user_id: str, peer_id: str) -> str:
+    """Conversation key of two peers (the same whichever of them asks)"""
+    return "peer:" + ":".join(sorted((user_id, peer_id)))
+
+
+def group_conversation(group_id: str) -> str:
+    return f"group:{group_id}"
+
+
+def encode_cursor(seq: int) -> str:
+    """Opaque page cursor: the position of the oldest message already returned"""
+    return base64.urlsafe_b64encode(str(seq).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode((cursor + "=" * (-len(cursor) % 4)).encode()).decode())
+    except ValueError:
+        raise Exception("Invalid message cursor")
+
+
+class Conversation:
+    """Message ids of one conversation in append order, plus delivery and read positions"""
+
+    __slots__ = ("key", "message_ids", "positions", "delivered", "read")
+
+    def __init__(self, key: str):
+        self.key = key
+        # A message's position (seq) is its index + 1
+        self.message_ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        # participant -> seq of the last message acknowledged by their client / read
+        self.delivered: Dict[str, int] = {}
+        self.read: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+
+class ConversationStore:
+    """Per-conversation message index with cursor pages, unread counts and hot tails.
+
+    Message bodies stay in the backing store and are fetched through `load`;
+    each conversation only keeps its ids, so a page is a slice by position
+    rather than a scan of every message. The last HOT_TAIL_SIZE messages of
+    recently read conversations are cached, so the common "latest page"
+    read never touches the backing store.
+    """
+
+    def __init__(self, load: Callable[[List[str]], List[Message]], hot_tail_size: int = HOT_TAIL_SIZE,
+                 max_hot_conversations: int = MAX_HOT_CONVERSATIONS):
+        self.load = load
+        self.hot_tail_size = hot_tail_size
+        self.max_hot_conversations = max_hot_conversations
+        self.conversations: Dict[str, Conversation] = {}
+        # user_id -> keys of conversations they take part in
+        self.user_conversations: Dict[str, set] = {}
+        self.tails: "OrderedDict[str, deque]" = OrderedDict()
+        self.stats = {"tail_hits": 0, "tail_misses": 0, "loaded_messages": 0}
+
+    def _conversation(self, key: str) -> Conversation:
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            self.conversations[key] = conversation = Conversation(key)
+        return conversation
+
+    def _join(self, conversation: Conversation, user_id: str) -> None:
+        self.user_conversations.setdefault(user_id, set()).add(conversation.key)
+
+    def append(self, key: str, message: Message, participants: Iterable[str] = ()) -> int:
+        """Add a message to a conversation; returns its seq. Sending marks the sender as read up to it."""
+        conversation = self._conversation(key)
+        conversation.message_ids.append(message.id)
+        seq = len(conversation.message_ids)
+        conversation.positions[message.id] = seq
+        conversation.delivered[message.sender_id] = seq
+        conversation.read[message.sender_id] = seq
+        self._join(conversation, message.sender_id)
+        for user_id in participants:
+            self._join(conversation, user_id)
+
+        tail = self.tails.get(key)
+        if tail is not None:
+            tail.append(message)
+        elif seq == 1:
+            self._cache_tail(key, deque([message], maxlen=self.hot_tail_size))
+        return seq
+
+    def _cache_tail(self, key: str, tail: deque) -> None:
+        self.tails[key] = tail
+        self.tails.move_to_end(key)
+        while len(self.tails) > self.max_hot_conversations:
+            self.tails.popitem(last=False)
+
+    def _tail(self, conversation: Conversation) -> deque:
+        tail = self.tails.get(conversation.key)
+        if tail is None:
+            ids = conversation.message_ids[-self.hot_tail_size:]
+            tail = deque(self.load(ids), maxlen=self.hot_tail_size)
+            self.stats["loaded_messages"] += len(ids)
+            self._cache_tail(conversation.key, tail)
+        else:
+            self.tails.move_to_end(conversation.key)
+        return tail
+
+    def page(self, key: str, limit: int, before: Optional[int] = None) -> Tuple[List[Tuple[int, Message]], Optional[int]]:
+        """Up to `limit` (seq, message) pairs with seq < `before` (newest when None), oldest first,
+        and the seq to pass as `before` for the next older page (None at the start)"""
+        conversation = self.conversations.get(key)
+        if conversation is None or limit <= 0:
+            return [], None
+        end = len(conversation) if before is None else max(0, min(before - 1, len(conversation)))
+        start = max(0, end - limit)
+        tail_start = len(conversation) - min(len(conversation), self.hot_tail_size)
+        if start >= tail_start:
+            self.stats["tail_hits"] += 1
+            tail = self._tail(conversation)
+            messages = [tail[index - tail_start] for index in range(start, end)]
+        else:
+            self.stats["tail_misses"] += 1
+            messages = self.load(conversation.message_ids[start:end])
+            self.stats["loaded_messages"] += len(messages)
+        return list(zip(range(start + 1, end + 1), messages)), (start + 1 if start > 0 else None)
+
+    def messages_after(self, key: str, seq: int, limit: int) -> List[Tuple[int, Message]]:
+        """Up to the newest `limit` (seq, message) pairs after `seq`, oldest first"""
+        conversation = self.conversations.get(key)
+        if conversation is None or seq >= len(conversation):
+            return []
+        return self.page(key, min(limit, len(conversation) - seq))[0]
+
+    def mark_delivered(self, key: str, user_id: str, seq: int) -> bool:
+        """Record that `user_id`'s client has received everything up to `seq`; False if nothing changed"""
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            return False
+        seq = max(0, min(seq, len(conversation)))
+        if seq <= self.delivered_seq(key, user_id):
+            return False
+        conversation.delivered[user_id] = seq
+        self._join(conversation, user_id)
+        return True
+
+    def mark_read(self, key: str, user_id: str, seq: Optional[int] = None) -> int:
+        """Mark `user_id` as having read up to `seq` (everything when None); returns their unread count"""
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            return 0
+        seq = len(conversation) if seq is None else max(0, min(seq, len(conversation)))
+        if seq > conversation.read.get(user_id, 0):
+            conversation.read[user_id] = seq
+            self._join(conversation, user_id)
+        return self.unread(key, user_id)
+
+    def delivered_seq(self, key: str, user_id: str) -> int:
+        """Seq of the last message delivered to `user_id` (reading implies delivery)"""
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            return 0
+        return max(conversation.delivered.get(user_id, 0), conversation.read.get(user_id, 0))
+
+    def read_seq(self, key: str, user_id: str) -> int:
+        conversation = self.conversations.get(key)
+        return conversation.read.get(user_id, 0) if conversation else 0
+
+    def length(self, key: str) -> int:
+        conversation = self.conversations.get(key)
+        return len(conversation) if conversation else 0
+
+    def conversations_of(self, user_id: str) -> List[str]:
+        return list(self.user_conversations.get(user_id, ()))
+
+    def unread(self, key: str, user_id: str) -> int:
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            return 0
+        return len(conversation) - conversation.read.get(user_id, 0)
+
+    def unread_counts(self, user_id: str) -> Dict[str, int]:
+        """Conversation key -> unread messages, for the user's conversations with any"""
+        counts = {}
+        for key in self.user_conversations.get(user_id, ()):
+            unread = self.unread(key, user_id)
+            if unread:
+                counts[key] = unread
+        return counts
+
+    def message_id(self, key: str, seq: int) -> Optional[str]:
+        """Id of the message at `seq` (stable across rebuilds, unlike seq)"""
+        conversation = self.conversations.get(key)
+        return conversation.message_ids[seq - 1] if conversation and 0 < seq <= len(conversation) else None
+
+    def rebuild(self, conversations: Iterable[Tuple[str, Message, Iterable[str]]],
+                read_positions: Dict[Tuple[str, str], str],
+                delivered_positions: Optional[Dict[Tuple[str, str], str]] = None) -> None:
+        """Reload from (key, message, participants) in send order and (key, user_id) -> id of the last
+        message read / delivered"""
+        self.conversations.clear()
+        self.user_conversations.clear()
+        self.tails.clear()
+        for key, message, participants in conversations:
+            conversation = self._conversation(key)
+            conversation.message_ids.append(message.id)
+            conversation.positions[message.id] = len(conversation.message_ids)
+            conversation.delivered[message.sender_id] = len(conversation.message_ids)
+            conversation.read[message.sender_id] = len(conversation.message_ids)
+            self._join(conversation, message.sender_id)
+            for user_id in participants:
+                self._join(conversation, user_id)
+        for positions, attribute in ((read_positions, "read"), (delivered_positions or {}, "delivered")):
+            for (key, user_id), message_id in positions.items():
+                conversation = self.conversations.get(key)
+                seq = conversation.positions.get(message_id) if conversation else None
+                marks = getattr(conversation, attribute) if conversation else None
+                if seq and seq > marks.get(user_id, 0):
+                    marks[user_id] = seq
+                    self._join(conversation, user_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self.conversations),
+            "hot_tails": len(self.tails),
+            "hot_tail_size": self.hot_tail_size,
+            **self.stats
+        }
@@ -0,0 +1,150 @@
+from typing import Dict, Any, List, Tuple
+import numpy as np
+
+# Rows per chunk when assigning vectors to centroids (bounds the score matrix)
+ASSIGN_CHUNK = 16384
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by inner product) of each vector"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = vectors[start:start + ASSIGN_CHUNK]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors: np.ndarray, lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means: unit-length centroids for unit-length vectors"""
+    rng = np.random.default_rng(seed)
+    lists = min(lists, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # Restart empty lists from random vectors
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms[empty] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over the rows of a vector matrix.
+
+    Rows are partitioned by their nearest k-means centroid; a query scores
+    only the rows in its `nprobe` nearest lists. Each list is a growable
+    int32 array with swap-remove, so rows move between lists in O(1) when
+    their vectors change. More probes give higher recall at the cost of
+    scoring more rows.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray):
+        self.centroids = centroids
+        # row -> list (-1 when unindexed) and position within the list
+        self.assignments = np.full(max(len(assignments), 1024), -1, dtype=np.int32)
+        self.positions = np.zeros(len(self.assignments), dtype=np.int32)
+        self.members: List[np.ndarray] = []
+        self.sizes = np.zeros(len(centroids), dtype=np.int64)
+
+        rows = np.flatnonzero(assignments >= 0)
+        order = np.argsort(assignments[rows], kind="stable")
+        rows = rows[order]
+        counts = np.bincount(assignments[rows], minlength=len(centroids))
+        start = 0
+        for index, count in enumerate(counts):
+            members = np.zeros(max(16, int(count) * 2), dtype=np.int32)
+            members[:count] = rows[start:start + count]
+            self.members.append(members)
+            self.positions[rows[start:start + count]] = np.arange(count, dtype=np.int32)
+            start += count
+        self.sizes[:] = counts
+        self.assignments[rows] = assignments[rows]
+
+    @property
+    def lists(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return int(self.sizes.sum())
+
+    def _ensure_rows(self, rows: int) -> None:
+        if rows > len(self.assignments):
+            capacity = max(rows, len(self.assignments) * 2)
+            assignments = np.full(capacity, -1, dtype=np.int32)
+            assignments[:len(self.assignments)] = self.assignments
+            positions = np.zeros(capacity, dtype=np.int32)
+            positions[:len(self.positions)] = self.positions
+            self.assignments, self.positions = assignments, positions
+
+    def _insert(self, row: int, target: int) -> None:
+        members = self.members[target]
+        size = self.sizes[target]
+        if size == len(members):
+            grown = np.zeros(len(members) * 2, dtype=np.int32)
+            grown[:size] = members
+            self.members[target] = members = grown
+        members[size] = row
+        self.positions[row] = size
+        self.assignments[row] = target
+        self.sizes[target] = size + 1
+
+    def remove(self, row: int) -> None:
+        if row >= len(self.assignments):
+            return
+        target = self.assignments[row]
+        if target < 0:
+            return
+        members = self.members[target]
+        last = self.sizes[target] - 1
+        position = self.positions[row]
+        moved = members[last]
+        members[position] = moved
+        self.positions[moved] = position
+        self.sizes[target] = last
+        self.assignments[row] = -1
+
+    def update(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """(Re)index `rows`, whose vectors are `vectors`"""
+        if not len(rows):
+            return
+        self._ensure_rows(int(rows.max()) + 1)
+        targets = assign(vectors, self.centroids)
+        for row, target in zip(rows.tolist(), targets.tolist()):
+            if self.assignments[row] != target:
+                self.remove(row)
+                self._insert(row, target)
+
+    def candidates(self, vector: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows in the `nprobe` lists nearest to `vector`"""
+        nprobe = min(nprobe, self.lists)
+        scores = self.centroids @ vector
+        if nprobe < self.lists:
+            probe = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.lists)
+        return np.concatenate([self.members[index][:self.sizes[index]] for index in probe])
+
+    def get_stats(self) -> Dict[str, Any]:
+        sizes = self.sizes
+        return {
+            "lists": self.lists,
+            "indexed_rows": int(sizes.sum()),
+            "largest_list": int(sizes.max()) if len(sizes) else 0
+        }
+
+
+def build_index(vectors: np.ndarray, active: np.ndarray, sample_size: int = 50000,
+                seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Train centroids (about sqrt(n) lists) on a sample of the active rows and assign every
+    active row; returns (centroids, assignments), with -1 for inactive rows"""
+    rows = np.flatnonzero(active)
+    rng = np.random.default_rng(seed)
+    sample = rows if len(rows) <= sample_size else rng.choice(rows, sample_size, replace=False)
+    centroids = train_centroids(vectors[sample], max(1, int(np.sqrt(len(rows)))), seed=seed)
+    assignments = np.full(len(vectors), -1, dtype=np.int32)
+    assignments[rows] = assign(vectors[rows], centroids)
+    return centroids, assignments
@@ -0,0 +1,315 @@
+import zlib
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set, Tuple
+import numpy as np
+from app.models.emotion import EmotionAnalysis, MoodType
+from app.services.peer_index import IVFIndex, build_index
+
+MOODS = list(MoodType)
+MOOD_INDEX = {mood: index for index, mood in enumerate(MOODS)}
+YEARS = ["freshman", "sophomore", "junior", "senior", "graduate"]
+# Triggers and majors are open-ended strings, so they are hashed into buckets
+TRIGGER_BUCKETS = 32
+MAJOR_BUCKETS = 32
+
+# Vector layout: (name, size, weight). Each block is normalized on its own and
+# scaled by its weight, so no block dominates just because it has more counts.
+BLOCKS = [
+    ("moods", len(MOODS), 1.0),
+    ("triggers", TRIGGER_BUCKETS, 1.2),
+    ("major", MAJOR_BUCKETS, 0.6),
+    ("year", len(YEARS) + 1, 0.4)
+]
+OFFSETS = {}
+_offset = 0
+for _name, _size, _ in BLOCKS:
+    OFFSETS[_name] = _offset
+    _offset += _size
+DIMENSIONS = _offset
+
+# Share of a user's analyses in a mood for it to count as a shared challenge
+CHALLENGE_SHARE = 0.3
+MOOD_CHALLENGES = {MoodType.STRESSED: "Stress", MoodType.NEGATIVE: "Low Mood"}
+# Users with an analysis this recent are shown as online
+ONLINE_WINDOW = timedelta(minutes=15)
+
+
+def _bucket(value: str, buckets: int) -> int:
+    return zlib.crc32(value.strip().lower().encode()) % buckets
+
+
+def _challenge_name(trigger: str) -> str:
+    return trigger.replace("_", " ").title()
+
+
+class PeerMatchingEngine:
+    """Cosine-similarity peer matching over per-user feature vectors.
+
+    A user's vector combines their mood distribution, stressor triggers
+    (hashed), major (hashed) and year. Vectors are unit length and live in
+    one contiguous float32 matrix (grown by doubling), so a top-k query is a
+    single matrix-vector product plus argpartition. Analyses only bump the
+    user's counts and mark the row dirty; dirty rows are re-embedded together
+    before the next query.
+
+    Past `index_threshold` users, rebuild_index() trains an IVF index and
+    queries score only the rows in the `nprobe` nearest lists (raise nprobe
+    for recall, lower it for latency). Re-embedded and removed rows update
+    the index in place; it is retrained once the user count has grown by
+    `rebuild_growth` since the last build.
+    """
+
+    def __init__(self, initial_capacity: int = 1024, nprobe: int = 16,
+                 index_threshold: int = 20000, rebuild_growth: float = 0.2):
+        self.vectors = np.zeros((initial_capacity, DIMENSIONS), dtype=np.float32)
+        self.mood_counts = np.zeros((initial_capacity, len(MOODS)), dtype=np.float32)
+        self.trigger_counts = np.zeros((initial_capacity, TRIGGER_BUCKETS), dtype=np.float32)
+        self.major_buckets = np.full(initial_capacity, -1, dtype=np.int16)
+        self.year_positions = np.full(initial_capacity, -1, dtype=np.int8)
+        self.active = np.zeros(initial_capacity, dtype=np.bool_)
+        self.rows: Dict[str, int] = {}
+        self.user_ids: List[Optional[str]] = []
+        self.free_rows: List[int] = []
+        self.dirty: Set[int] = set()
+        # Per-row details used to explain matches
+        self.profiles: List[Tuple[Optional[str], Optional[str]]] = []
+        self.triggers: List[Dict[str, int]] = []
+        self.last_active: List[Optional[datetime]] = []
+
+        self.index: Optional[IVFIndex] = None
+        self.nprobe = nprobe
+        self.index_threshold = index_threshold
+        self.rebuild_growth = rebuild_growth
+        self.users_at_build = 0
+        # Rows re-embedded or removed while a rebuild trains on a snapshot
+        self._touched: Optional[Set[int]] = None
+        self.rebuilds = 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def size(self) -> int:
+        """Rows in use, including freed ones"""
+        return len(self.user_ids)
+
+    def _grow(self) -> None:
+        capacity = len(self.vectors) * 2
+        for name in ("vectors", "mood_counts", "trigger_counts", "major_buckets", "year_positions", "active"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            if name in ("major_buckets", "year_positions"):
+                new[:] = -1
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _row(self, user_id: str) -> int:
+        row = self.rows.get(user_id)
+        if row is not None:
+            return row
+        if self.free_rows:
+            row = self.free_rows.pop()
+            self.user_ids[row] = user_id
+            self.profiles[row] = (None, None)
+            self.triggers[row] = {}
+            self.last_active[row] = None
+        else:
+            row = len(self.user_ids)
+            if row == len(self.vectors):
+                self._grow()
+            self.user_ids.append(user_id)
+            self.profiles.append((None, None))
+            self.triggers.append({})
+            self.last_active.append(None)
+        self.rows[user_id] = row
+        self.active[row] = True
+        return row
+
+    def _embed(self, rows: np.ndarray) -> None:
+        """Recompute the unit vectors of `rows` from their counts and profile"""
+        vectors = np.zeros((len(rows), DIMENSIONS), dtype=np.float32)
+        weights = {name: weight for name, _, weight in BLOCKS}
+        for name, counts in (("moods", self.mood_counts[rows]), ("triggers", self.trigger_counts[rows])):
+            norms = np.linalg.norm(counts, axis=1, keepdims=True)
+            offset = OFFSETS[name]
+            np.divide(counts * weights[name], norms, out=vectors[:, offset:offset + counts.shape[1]], where=norms > 0)
+        for name, positions in (("major", self.major_buckets[rows]), ("year", self.year_positions[rows])):
+            known = np.flatnonzero(positions >= 0)
+            vectors[known, OFFSETS[name] + positions[known]] = weights[name]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        self.vectors[rows] = vectors
+        if self.index is not None:
+            self.index.update(rows, vectors)
+        if self._touched is not None:
+            self._touched.update(rows.tolist())
+
+    def _refresh(self) -> None:
+        if self.dirty:
+            self._embed(np.fromiter(self.dirty, dtype=np.int64, count=len(self.dirty)))
+            self.dirty.clear()
+
+    def update_profile(self, user_id: str, major: Optional[str], year: Optional[str]) -> int:
+        """Set a user's major and year; returns their row"""
+        row = self._row(user_id)
+        if self.profiles[row] != (major, year):
+            self.profiles[row] = (major, year)
+            self.major_buckets[row] = _bucket(major, MAJOR_BUCKETS) if major else -1
+            year_key = year.strip().lower() if year else None
+            self.year_positions[row] = -1 if not year_key else (YEARS.index(year_key) if year_key in YEARS else len(YEARS))
+            self.dirty.add(row)
+        return row
+
+    def record_analysis(self, analysis: EmotionAnalysis) -> int:
+        """Fold an analysis into the user's counts; returns their row"""
+        row = self._row(analysis.user_id)
+        self.mood_counts[row, MOOD_INDEX[analysis.mood]] += 1
+        triggers = self.triggers[row]
+        for trigger in analysis.triggers:
+            self.trigger_counts[row, _bucket(trigger, TRIGGER_BUCKETS)] += 1
+            triggers[trigger] = triggers.get(trigger, 0) + 1
+        last = self.last_active[row]
+        if last is None or analysis.timestamp > last:
+            self.last_active[row] = analysis.timestamp
+        self.dirty.add(row)
+        return row
+
+    def remove(self, user_id: str) -> None:
+        row = self.rows.pop(user_id, None)
+        if row is None:
+            return
+        self.active[row] = False
+        self.vectors[row] = 0
+        self.mood_counts[row] = 0
+        self.trigger_counts[row] = 0
+        self.major_buckets[row] = -1
+        self.year_positions[row] = -1
+        self.user_ids[row] = None
+        self.dirty.discard(row)
+        self.free_rows.append(row)
+        if self.index is not None:
+            self.index.remove(row)
+        if self._touched is not None:
+            self._touched.add(row)
+
+    def _exclusion_mask(self, row: int, exclude: Optional[Set[str]]) -> np.ndarray:
+        blocked = ~self.active[:self.size]
+        blocked[row] = True
+        for user_id in exclude or ():
+            excluded = self.rows.get(user_id)
+            if excluded is not None:
+                blocked[excluded] = True
+        return blocked
+
+    def _allowed(self, candidates: np.ndarray, row: int, exclude: Optional[Set[str]]) -> np.ndarray:
+        """`candidates` minus inactive rows, the querying row and `exclude`"""
+        keep = self.active[candidates] & (candidates != row)
+        if exclude:
+            excluded = [self.rows[user_id] for user_id in exclude if user_id in self.rows]
+            keep &= ~np.isin(candidates, excluded)
+        return candidates[keep]
+
+    def _top_k(self, scores: np.ndarray, candidates: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(candidates[index]), float(scores[index])) for index in best if np.isfinite(scores[index])]
+
+    def query(self, user_id: str, k: int = 10, exclude: Optional[Set[str]] = None,
+              nprobe: Optional[int] = None, exact: bool = False) -> List[Tuple[str, float]]:
+        """Top-k (user_id, cosine similarity) for a user, skipping themselves and `exclude`"""
+        row = self.rows.get(user_id)
+        if row is None or k <= 0:
+            return []
+        self._refresh()
+        vector = self.vectors[row]
+        if self.index is None or exact:
+            size = self.size
+            scores = self.vectors[:size] @ vector
+            scores[self._exclusion_mask(row, exclude)] = -np.inf
+            matches = self._top_k(scores, np.arange(size), k)
+        else:
+            nprobe = nprobe or self.nprobe
+            candidates = self._allowed(self.index.candidates(vector, nprobe), row, exclude)
+            # Probe more lists when exclusions leave fewer than k candidates
+            while len(candidates) < k and nprobe < self.index.lists:
+                nprobe *= 2
+                candidates = self._allowed(self.index.candidates(vector, nprobe), row, exclude)
+            matches = self._top_k(self.vectors[candidates] @ vector, candidates, k)
+        return [(self.user_ids[match], score) for match, score in matches]
+
+    def needs_rebuild(self) -> bool:
+        if self.index is None:
+            return len(self.rows) >= self.index_threshold
+        return len(self.rows) > self.users_at_build * (1 + self.rebuild_growth)
+
+    async def rebuild_index(self) -> None:
+        """Retrain the IVF index off the event loop and swap it in"""
+        if self._touched is not None:
+            return
+        self._refresh()
+        size = self.size
+        # Train on a snapshot; rows that change meanwhile are re-indexed after the swap
+        vectors, active = self.vectors[:size].copy(), self.active[:size].copy()
+        self._touched = set()
+        try:
+            centroids, assignments = await asyncio.to_thread(build_index, vectors, active)
+        finally:
+            touched, self._touched = self._touched, None
+        index = IVFIndex(centroids, assignments)
+        touched.update(range(size, self.size))
+        for row in touched:
+            if not self.active[row]:
+                index.remove(row)
+        changed = np.array(sorted(row for row in touched if self.active[row]), dtype=np.int64)
+        index.update(changed, self.vectors[changed])
+        self.index = index
+        self.users_at_build = len(self.rows)
+        self.rebuilds += 1
+
+    def shared_challenges(self, user_id: str, peer_id: str, limit: int = 3) -> List[str]:
+        """Stressors and distress moods common to both users"""
+        row, peer_row = self.rows.get(user_id), self.rows.get(peer_id)
+        if row is None or peer_row is None:
+            return []
+        challenges = []
+        for mood, name in MOOD_CHALLENGES.items():
+            shares = []
+            for counts in (self.mood_counts[row], self.mood_counts[peer_row]):
+                total = float(counts.sum())
+                shares.append(counts[MOOD_INDEX[mood]] / total if total else 0.0)
+            if min(shares) >= CHALLENGE_SHARE:
+                challenges.append(name)
+        peer_triggers = self.triggers[peer_row]
+        common = sorted(
+            (trigger for trigger in self.triggers[row] if trigger in peer_triggers),
+            key=lambda trigger: -(self.triggers[row][trigger] + peer_triggers[trigger])
+        )
+        challenges.extend(_challenge_name(trigger) for trigger in common)
+        return challenges[:limit]
+
+    def describe(self, user_id: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        row = self.rows[user_id]
+        major, year = self.profiles[row]
+        last_active = self.last_active[row]
+        online = last_active is not None and last_active >= (now or datetime.utcnow()) - ONLINE_WINDOW
+        # No exact activity times: together with major and year they would identify the peer
+        return {
+            'major': major,
+            'year': year,
+            'status': 'online' if online else 'away'
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self.rows),
+            "capacity": len(self.vectors),
+            "dimensions": DIMENSIONS,
+            "matrix_bytes": int(self.vectors.nbytes),
+            "nprobe": self.nprobe,
+            "rebuilds": self.rebuilds,
+            "index": self.index.get_stats() if self.index is not None else None
+        }
@@ -1,19 +1,219 @@
 import uuid
+import zlib
+import secrets
 import random
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Set, Tuple
 from app.models.peer_support import PeerMatch, SupportGroup, Message, PeerConnection
+from app.models.emotion import EmotionAnalysis
+from app.models.user import User
+from app.services.peer_matching import PeerMatchingEngine
+from app.services.group_registry import GroupMembershipRegistry
+from app.services.message_store import ConversationStore, peer_conversation, group_conversation, encode_cursor, decode_cursor
+from app.utils.wal import WriteAheadLog
+
+logger = logging.getLogger(__name__)
+
+# Most messages per conversation pushed when a user reconnects; older ones are paged in
+REPLAY_LIMIT = 200
+# Replayed messages are pushed in pages of this size, each once the user's
+# outbound queue has room for it
+REPLAY_PAGE_SIZE = 50
+# Match handles kept per user; issuing more forgets the least recently issued
+MAX_HANDLES_PER_USER = 200
 
 class PeerSupportService:
-    def __init__(self):
+    def __init__(self, wal: Optional[WriteAheadLog] = None, user_lookup: Optional[Callable[[str], Optional[User]]] = None,
+                 match_nprobe: int = 16, index_check_interval: float = 60.0,
+                 deliver: Optional[Callable[[str, Dict[str, Any]], Awaitable[bool]]] = None,
+                 deliver_to_group: Optional[Callable[[Set[str], Set[str], Dict[str, Any]], Awaitable[Dict[str, int]]]] = None,
+                 wait_for_room: Optional[Callable[[str, int], Awaitable[bool]]] = None):
         # Mock storage (in production, use database)
         self.matches_db = {}
         self.groups_db = {}
         self.messages_db = {}
         self.connections_db = {}
+        # (conversation key, user_id) -> id of the last message they have read / received
+        self.read_positions_db = {}
+        self.delivery_positions_db = {}
+        # Pushes a WebSocket message to a user's socket(s); returns whether any was reachable
+        self.deliver = deliver
+        # Waits until a user's socket can take n more messages; False once it is gone
+        self.wait_for_room = wait_for_room
+        # (group_id, user_id) -> joined_at, indexed both ways in the registry
+        self.memberships_db = {}
+        self.memberships = GroupMembershipRegistry()
+        # Pushes one message to a group, given its members and online members
+        self.deliver_to_group = deliver_to_group
+        
+        # Messages by conversation; bodies stay in messages_db
+        self.conversations = ConversationStore(load=self._load_messages)
         
-        # Initialize with some mock support groups
-        self._initialize_mock_groups()
+        # Peer matching vectors, fed with analyses via record_analysis;
+        # user_lookup supplies major and year
+        self.matcher = PeerMatchingEngine(nprobe=match_nprobe)
+        self.user_lookup = user_lookup
+        # Background task that (re)builds the matcher's ANN index as users grow
+        self.index_check_interval = index_check_interval
+        self._index_task: Optional[asyncio.Task] = None
+        # user_id -> users they have a connection (in any state) with, and
+        # the subset blocked either way (excluded from matching and messaging)
+        self.connected_peers: Dict[str, Set[str]] = {}
+        self.blocked_peers: Dict[str, Set[str]] = {}
+        # Match cards carry an opaque handle instead of the peer's user id:
+        # handle -> (user it was issued to, peer), and per user peer -> handle,
+        # least recently issued first. Handles are not in the WAL: after a
+        # restart (or once evicted) they stop resolving and the client fetches
+        # matches again; connections and blocks are kept by user id.
+        self.match_handles: Dict[str, Tuple[str, str]] = {}
+        self.issued_handles: Dict[str, "OrderedDict[str, str]"] = {}
+        
+        # With a write-ahead log the stores survive restarts; mock groups are
+        # then only seeded into an empty log (after replay)
+        self.wal = wal
+        if wal:
+            wal.register("peer.matches", self.matches_db)
+            wal.register("peer.groups", self.groups_db, on_replay=self._seed_mock_groups)
+            wal.register("peer.messages", self.messages_db)
+            wal.register("peer.read_positions", self.read_positions_db, on_replay=self._rebuild_conversations)
+            wal.register("peer.delivery_positions", self.delivery_positions_db)
+            wal.register("peer.connections", self.connections_db, on_replay=self._rebuild_connection_index)
+            wal.register("peer.memberships", self.memberships_db, on_replay=self._rebuild_memberships)
+        else:
+            # Initialize with some mock support groups
+            self._initialize_mock_groups()
+
+    def _seed_mock_groups(self):
+        if not self.groups_db:
+            self._initialize_mock_groups()
+            for group in self.groups_db.values():
+                self.wal.log_set("peer.groups", group.id, group)
+
+    async def _log_set(self, store: str, key: str, value: Any) -> None:
+        """Log a mutation and wait for it to be durable (no-op without a WAL)"""
+        if self.wal:
+            self.wal.log_set(store, key, value)
+            await self.wal.commit()
+
+    def _load_messages(self, message_ids: List[str]) -> List[Message]:
+        return [self.messages_db[message_id] for message_id in message_ids]
+
+    @staticmethod
+    def _conversation_of(message: Message) -> str:
+        if message.group_id:
+            return group_conversation(message.group_id)
+        return peer_conversation(message.sender_id, message.recipient_id)
+
+    def _rebuild_conversations(self):
+        # Messages sharing a timestamp are ordered by id
+        ordered = sorted(self.messages_db.values(), key=lambda message: (message.sent_at, message.id))
+        self.conversations.rebuild(
+            ((self._conversation_of(message), message, [message.recipient_id] if message.recipient_id else [])
+             for message in ordered),
+            self.read_positions_db,
+            self.delivery_positions_db
+        )
+
+    async def _save_read_position(self, key: str, user_id: str):
+        await self._save_position("peer.read_positions", self.read_positions_db, key, user_id,
+                                  self.conversations.read_seq(key, user_id))
+
+    async def _save_position(self, store: str, positions: Dict[Any, str], key: str, user_id: str, seq: int):
+        message_id = self.conversations.message_id(key, seq)
+        if message_id and positions.get((key, user_id)) != message_id:
+            positions[(key, user_id)] = message_id
+            await self._log_set(store, (key, user_id), message_id)
+
+    def _rebuild_memberships(self):
+        self.memberships.clear()
+        for group_id, user_id in self.memberships_db:
+            self.memberships.add(group_id, user_id)
+
+    def set_presence(self, user_id: str, online: bool):
+        """Called as users' WebSockets connect and disconnect"""
+        self.memberships.set_online(user_id, online)
+
+    def _rebuild_connection_index(self):
+        self.connected_peers.clear()
+        self.blocked_peers.clear()
+        for connection in self.connections_db.values():
+            self._index_connection(connection)
+
+    def _index_connection(self, connection: PeerConnection):
+        self.connected_peers.setdefault(connection.requester_id, set()).add(connection.requested_id)
+        self.connected_peers.setdefault(connection.requested_id, set()).add(connection.requester_id)
+        if connection.status == 'blocked':
+            self.blocked_peers.setdefault(connection.requester_id, set()).add(connection.requested_id)
+            self.blocked_peers.setdefault(connection.requested_id, set()).add(connection.requester_id)
+
+    def _match_handle(self, user_id: str, peer_id: str) -> str:
+        issued = self.issued_handles.setdefault(user_id, OrderedDict())
+        handle = issued.get(peer_id)
+        if handle is not None:
+            issued.move_to_end(peer_id)
+            return handle
+        handle = secrets.token_urlsafe(16)
+        issued[peer_id] = handle
+        self.match_handles[handle] = (user_id, peer_id)
+        if len(issued) > MAX_HANDLES_PER_USER:
+            _, evicted = issued.popitem(last=False)
+            del self.match_handles[evicted]
+        return handle
+
+    def _resolve_handle(self, user_id: str, handle: str) -> Optional[str]:
+        """Peer behind a match handle, if it was issued to user_id"""
+        issued = self.match_handles.get(handle)
+        return issued[1] if issued and issued[0] == user_id else None
+
+    def _refresh_profile(self, user_id: str) -> bool:
+        """Sync the matcher's profile of a user; False if they are gone or deactivated"""
+        if self.user_lookup is None:
+            return True
+        user = self.user_lookup(user_id)
+        if user is None or not user.is_active:
+            return False
+        self.matcher.update_profile(user_id, user.major, user.year)
+        return True
+
+    def record_analysis(self, analysis: EmotionAnalysis):
+        """Fold a stored analysis into the user's matching vector"""
+        if self._refresh_profile(analysis.user_id):
+            self.matcher.record_analysis(analysis)
+
+    def remove_user(self, user_id: str):
+        """Stop offering a deleted or deactivated user as a peer match"""
+        self.matcher.remove(user_id)
+        for handle in self.issued_handles.pop(user_id, {}).values():
+            del self.match_handles[handle]
+
+    def get_matching_stats(self) -> Dict[str, Any]:
+        return self.matcher.get_stats()
+
+    def start(self):
+        if self._index_task is None:
+            self._index_task = asyncio.create_task(self._maintain_index())
+
+    async def stop(self):
+        if self._index_task is None:
+            return
+        self._index_task.cancel()
+        try:
+            await self._index_task
+        except asyncio.CancelledError:
+            pass
+        self._index_task = None
+
+    async def _maintain_index(self):
+        while True:
+            if self.matcher.needs_rebuild():
+                try:
+                    await self.matcher.rebuild_index()
+                except Exception as e:
+                    logger.error(f"Peer matching index rebuild failed: {e}")
+            await asyncio.sleep(self.index_check_interval)
 
     def _initialize_mock_groups(self):
         """Initialize with mock support groups"""
@@ -61,46 +261,33 @@ class PeerSupportService:
             )
             self.groups_db[group_id] = group
 
-    async def find_peer_matches(self, user_id: str) -> List[Dict[str, Any]]:
+    async def find_peer_matches(self, user_id: str, limit: int = 3) -> List[Dict[str, Any]]:
         """Find potential peer matches for user"""
-        # Mock peer matching algorithm
-        mock_peers = [
-            {
-                'id': str(uuid.uuid4()),
-                'name': 'Anonymous Student A',
-                'compatibility_score': 92,
-                'shared_challenges': ['Academic Stress', 'Social Anxiety'],
-                'major': 'Computer Science',
-                'year': 'Junior',
-                'status': 'online',
-                'last_active': '2 min ago'
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'name': 'Anonymous Student B',
-                'compatibility_score': 87,
-                'shared_challenges': ['Time Management', 'Perfectionism'],
-                'major': 'Psychology',
-                'year': 'Senior',
-                'status': 'online',
-                'last_active': '5 min ago'
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'name': 'Anonymous Student C',
-                'compatibility_score': 78,
-                'shared_challenges': ['Academic Pressure', 'Sleep Issues'],
-                'major': 'Engineering',
-                'year': 'Sophomore',
-                'status': 'away',
-                'last_active': '1 hour ago'
-            }
-        ]
+        self._refresh_profile(user_id)
+        # Skip anyone the user already has a connection with (including blocked)
+        matches = self.matcher.query(user_id, k=limit, exclude=self.connected_peers.get(user_id))
+        
+        peers = []
+        for position, (peer_id, similarity) in enumerate(matches):
+            peers.append({
+                # Opaque handle for create_peer_connection; the peer stays anonymous until then
+                'id': self._match_handle(user_id, peer_id),
+                'name': f'Anonymous Student {chr(ord("A") + position % 26)}',
+                'compatibility_score': round(max(similarity, 0.0) * 100),
+                'shared_challenges': self.matcher.shared_challenges(user_id, peer_id),
+                **self.matcher.describe(peer_id)
+            })
         
-        return mock_peers
+        return peers
 
-    async def create_peer_connection(self, requester_id: str, requested_id: str) -> PeerConnection:
-        """Create a peer connection request"""
+    async def create_peer_connection(self, requester_id: str, match_handle: str) -> PeerConnection:
+        """Create a peer connection request for a match returned by find_peer_matches"""
+        requested_id = self._resolve_handle(requester_id, match_handle)
+        if requested_id is None:
+            raise Exception("Unknown or expired peer match; fetch matches again")
+        if requested_id in self.connected_peers.get(requester_id, ()):
+            raise Exception("Connection already exists")
+        
         connection = PeerConnection(
             id=str(uuid.uuid4()),
             requester_id=requester_id,
@@ -110,6 +297,8 @@ class PeerSupportService:
         )
         
         self.connections_db[connection.id] = connection
+        self._index_connection(connection)
+        await self._log_set("peer.connections", connection.id, connection)
         return connection
 
     async def get_available_support_groups(self, user_id: str) -> List[Dict[str, Any]]:
@@ -125,22 +314,53 @@ class PeerSupportService:
                 'max_members': group.max_members,
                 'is_full': group.current_members >= group.max_members,
                 'created_at': group.created_at.isoformat(),
-                'active_now': random.randint(2, 12)  # Mock active users
+                'active_now': self.memberships.active_now(group.id),
+                'is_member': self.memberships.is_member(group.id, user_id)
             })
         
         return groups_data
 
+    async def _add_member(self, group_id: str, user_id: str):
+        """Record a membership (its WAL entry is committed with the group's)"""
+        self.memberships.add(group_id, user_id)
+        self.memberships_db[(group_id, user_id)] = datetime.utcnow()
+        # Earlier group messages don't count as unread for a new member
+        self.conversations.mark_read(group_conversation(group_id), user_id)
+        await self._save_read_position(group_conversation(group_id), user_id)
+        if self.wal:
+            self.wal.log_set("peer.memberships", (group_id, user_id), self.memberships_db[(group_id, user_id)])
+
     async def join_support_group(self, user_id: str, group_id: str) -> Dict[str, Any]:
         """Join a support group"""
         group = self.groups_db.get(group_id)
         if not group:
             raise Exception("Support group not found")
         
+        if self.memberships.is_member(group_id, user_id):
+            return {
+                'success': True,
+                'message': f'Already a member of {group.name}',
+                'group_id': group_id,
+                'member_count': group.current_members
+            }
+        
         if group.current_members >= group.max_members:
             raise Exception("Support group is full")
         
-        # Add user to group (in production, track membership in database)
+        await self._add_member(group_id, user_id)
         group.current_members += 1
+        await self._log_set("peer.groups", group.id, group)
+        
+        if self.deliver_to_group:
+            await self.deliver_to_group(self.memberships.members_of(group_id), self.memberships.online_members_of(group_id), {
+                'type': 'group_activity',
+                'data': {
+                    'kind': 'member_joined',
+                    'group_id': group_id,
+                    'member_count': group.current_members,
+                    'active_now': self.memberships.active_now(group_id)
+                }
+            })
         
         return {
             'success': True,
@@ -149,51 +369,111 @@ class PeerSupportService:
             'member_count': group.current_members
         }
 
-    async def get_peer_messages(self, user_id: str, peer_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get messages between user and peer"""
-        # Mock conversation history
-        mock_messages = [
-            {
-                'id': str(uuid.uuid4()),
-                'sender_id': peer_id,
-                'content': "Hey! I saw you're also dealing with academic stress. How do you manage during finals week?",
-                'sent_at': (datetime.utcnow() - timedelta(hours=2)).isoformat(),
-                'is_own': False
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'sender_id': user_id,
-                'content': "Hi! I try to break everything into smaller tasks and take regular breaks. What about you?",
-                'sent_at': (datetime.utcnow() - timedelta(hours=2, minutes=-2)).isoformat(),
-                'is_own': True
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'sender_id': peer_id,
-                'content': "That's a great approach! I've been using the Pomodoro technique lately. It really helps with focus.",
-                'sent_at': (datetime.utcnow() - timedelta(hours=1, minutes=55)).isoformat(),
-                'is_own': False
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'sender_id': user_id,
-                'content': "I should try that! Do you have any good apps you'd recommend for the Pomodoro technique?",
-                'sent_at': (datetime.utcnow() - timedelta(hours=1, minutes=50)).isoformat(),
-                'is_own': True
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'sender_id': peer_id,
-                'content': "I use Forest - it's really motivating because you grow virtual trees while studying. Plus it helps me stay off my phone!",
-                'sent_at': (datetime.utcnow() - timedelta(minutes=30)).isoformat(),
-                'is_own': False
-            }
-        ]
+    @staticmethod
+    def _peer_message_record(seq: int, message: Message) -> Dict[str, Any]:
+        return {
+            'id': message.id,
+            'seq': seq,
+            'sender_id': message.sender_id,
+            'recipient_id': message.recipient_id,
+            'content': message.content,
+            'sent_at': message.sent_at.isoformat()
+        }
+
+    @staticmethod
+    def _peer_of(key: str, user_id: str) -> str:
+        members = key.split(":")[1:]
+        return next((member for member in members if member != user_id), user_id)
+
+    async def get_peer_messages(self, user_id: str, peer_id: str, limit: int = 50,
+                                cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get a page of messages between user and peer, oldest first"""
+        key = peer_conversation(user_id, peer_id)
+        page, next_before = self.conversations.page(key, limit, decode_cursor(cursor) if cursor else None)
+        
+        messages = []
+        for seq, message in page:
+            messages.append({**self._peer_message_record(seq, message), 'is_own': message.sender_id == user_id})
         
-        return mock_messages
+        return {
+            'messages': messages,
+            'next_cursor': encode_cursor(next_before) if next_before else None,
+            'unread': self.conversations.unread(key, user_id)
+        }
+
+    async def mark_peer_messages_read(self, user_id: str, peer_id: str, seq: Optional[int] = None) -> Dict[str, Any]:
+        """Mark the conversation with peer as read up to seq (all of it by default)"""
+        key = peer_conversation(user_id, peer_id)
+        previous = self.conversations.read_seq(key, user_id)
+        unread = self.conversations.mark_read(key, user_id, seq)
+        if self.conversations.read_seq(key, user_id) > previous:
+            await self._save_read_position(key, user_id)
+            await self._push_peer_status(key, user_id)
+        return {'unread': unread}
 
-    async def send_peer_message(self, sender_id: str, recipient_id: str, content: str) -> Message:
-        """Send message to peer"""
+    async def acknowledge_peer_messages(self, user_id: str, peer_id: str, seq: int) -> None:
+        """Record that user's client has received the conversation with peer up to seq"""
+        key = peer_conversation(user_id, peer_id)
+        if self.conversations.mark_delivered(key, user_id, seq):
+            await self._save_position("peer.delivery_positions", self.delivery_positions_db, key, user_id,
+                                      self.conversations.delivered_seq(key, user_id))
+            await self._push_peer_status(key, user_id)
+
+    def _peer_status(self, key: str, user_id: str) -> Dict[str, Any]:
+        """How far user has received and read the conversation, as seen by the peer"""
+        return {
+            'type': 'peer_message_status',
+            'data': {
+                'peer_id': user_id,
+                'delivered_seq': self.conversations.delivered_seq(key, user_id),
+                'read_seq': self.conversations.read_seq(key, user_id)
+            }
+        }
+
+    async def _push_peer_status(self, key: str, user_id: str):
+        if self.deliver:
+            await self.deliver(self._peer_of(key, user_id), self._peer_status(key, user_id))
+
+    async def replay_peer_messages(self, user_id: str, limit: int = REPLAY_LIMIT) -> int:
+        """Push what user's client missed while offline: messages after their last acknowledged
+        one (the newest `limit` per conversation) and each peer's current delivery/read status.
+        Returns how many messages were pushed."""
+        if not self.deliver:
+            return 0
+        replayed = 0
+        for key in self.conversations.conversations_of(user_id):
+            if not key.startswith("peer:"):
+                continue
+            peer_id = self._peer_of(key, user_id)
+            missed = self.conversations.messages_after(key, self.conversations.delivered_seq(key, user_id), limit)
+            for start in range(0, len(missed), REPLAY_PAGE_SIZE):
+                page = missed[start:start + REPLAY_PAGE_SIZE]
+                # Let the writer drain between pages instead of overflowing the
+                # queue (with a slot to spare for the status that follows)
+                if self.wait_for_room and not await self.wait_for_room(user_id, len(page) + 1):
+                    return replayed
+                for seq, message in page:
+                    await self.deliver(user_id, {'type': 'peer_message', 'data': self._peer_message_record(seq, message)})
+                    replayed += 1
+            await self.deliver(user_id, self._peer_status(key, peer_id))
+        return replayed
+
+    async def get_unread_counts(self, user_id: str) -> Dict[str, Any]:
+        """Unread messages per conversation with any"""
+        peers, groups = {}, {}
+        for key, unread in self.conversations.unread_counts(user_id).items():
+            kind, _, rest = key.partition(":")
+            if kind == "group":
+                groups[rest] = unread
+            else:
+                peers[self._peer_of(key, user_id)] = unread
+        return {'total': sum(peers.values()) + sum(groups.values()), 'peers': peers, 'groups': groups}
+
+    async def send_peer_message(self, sender_id: str, recipient_id: str, content: str,
+                                client_id: Optional[str] = None) -> Message:
+        """Send message to peer: persist it, then push it to the recipient and confirm to the sender"""
+        if recipient_id in self.blocked_peers.get(sender_id, ()):
+            raise Exception("Cannot message this user")
         message = Message(
             id=str(uuid.uuid4()),
             sender_id=sender_id,
@@ -203,6 +483,14 @@ class PeerSupportService:
         )
         
         self.messages_db[message.id] = message
+        seq = self.conversations.append(peer_conversation(sender_id, recipient_id), message, [recipient_id])
+        await self._log_set("peer.messages", message.id, message)
+        
+        if self.deliver:
+            record = self._peer_message_record(seq, message)
+            # Offline recipients get it from replay_peer_messages when they reconnect
+            await self.deliver(recipient_id, {'type': 'peer_message', 'data': record})
+            await self.deliver(sender_id, {'type': 'peer_message_sent', 'client_id': client_id, 'data': record})
         return message
 
     async def send_group_message(self, sender_id: str, group_id: str, content: str) -> Message:
@@ -210,6 +498,8 @@ class PeerSupportService:
         group = self.groups_db.get(group_id)
         if not group:
             raise Exception("Support group not found")
+        if not self.memberships.is_member(group_id, sender_id):
+            raise Exception("Join the support group to post messages")
         
         message = Message(
             id=str(uuid.uuid4()),
@@ -220,43 +510,63 @@ class PeerSupportService:
         )
         
         self.messages_db[message.id] = message
+        seq = self.conversations.append(group_conversation(group_id), message)
+        await self._log_set("peer.messages", message.id, message)
+        
+        # Online members (the sender included, as confirmation) get it pushed
+        if self.deliver_to_group:
+            await self.deliver_to_group(self.memberships.members_of(group_id), self.memberships.online_members_of(group_id), {
+                'type': 'group_message',
+                'data': self._group_message_record(group_id, seq, message)
+            })
         return message
 
-    async def get_group_messages(self, group_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get messages from support group"""
-        # Mock group conversation
-        mock_messages = [
-            {
-                'id': str(uuid.uuid4()),
-                'sender_name': 'Anonymous Student D',
-                'content': "Just wanted to share that I finally finished my research paper! Thanks everyone for the support this week.",
-                'sent_at': (datetime.utcnow() - timedelta(hours=3)).isoformat(),
-                'message_type': 'celebration'
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'sender_name': 'Anonymous Student E',
-                'content': "That's amazing! Congratulations! 🎉",
-                'sent_at': (datetime.utcnow() - timedelta(hours=2, minutes=58)).isoformat(),
-                'message_type': 'support'
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'sender_name': 'Anonymous Student F',
-                'content': "I'm struggling with my midterm prep. Any tips for managing anxiety during exams?",
-                'sent_at': (datetime.utcnow() - timedelta(hours=1)).isoformat(),
-                'message_type': 'help_request'
-            },
-            {
-                'id': str(uuid.uuid4()),
-                'sender_name': 'Anonymous Student G',
-                'content': "What helps me is creating a study schedule and breaking it into small chunks. Also, deep breathing exercises before each study session!",
-                'sent_at': (datetime.utcnow() - timedelta(minutes=45)).isoformat(),
-                'message_type': 'advice'
-            }
-        ]
+    @staticmethod
+    def _group_message_record(group_id: str, seq: int, message: Message) -> Dict[str, Any]:
+        return {
+            'id': message.id,
+            'group_id': group_id,
+            'seq': seq,
+            # Group messages are anonymous, but a sender keeps one alias per group
+            'sender_name': f'Anonymous Student {chr(ord("A") + zlib.crc32(f"{group_id}:{message.sender_id}".encode()) % 26)}',
+            'content': message.content,
+            'sent_at': message.sent_at.isoformat(),
+            'message_type': message.message_type
+        }
+
+    def _check_member(self, group_id: str, user_id: str):
+        if group_id not in self.groups_db:
+            raise Exception("Support group not found")
+        if not self.memberships.is_member(group_id, user_id):
+            raise Exception("Join the support group to read messages")
+
+    async def get_group_messages(self, user_id: str, group_id: str, limit: int = 50,
+                                 cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get a page of messages from support group, oldest first"""
+        self._check_member(group_id, user_id)
+        key = group_conversation(group_id)
+        page, next_before = self.conversations.page(key, limit, decode_cursor(cursor) if cursor else None)
         
-        return mock_messages
+        messages = []
+        for seq, message in page:
+            messages.append({**self._group_message_record(group_id, seq, message), 'is_own': message.sender_id == user_id})
+        
+        return {
+            'messages': messages,
+            'next_cursor': encode_cursor(next_before) if next_before else None,
+            'unread': self.conversations.unread(key, user_id)
+        }
+
+    async def mark_group_messages_read(self, user_id: str, group_id: str, seq: Optional[int] = None) -> Dict[str, Any]:
+        """Mark the group conversation as read up to seq (all of it by default)"""
+        self._check_member(group_id, user_id)
+        key = group_conversation(group_id)
+        unread = self.conversations.mark_read(key, user_id, seq)
+        await self._save_read_position(key, user_id)
+        return {'unread': unread}
+
+    def get_message_stats(self) -> Dict[str, Any]:
+        return {**self.conversations.get_stats(), 'group_memberships': self.memberships.get_stats()}
 
     async def get_user_support_stats(self, user_id: str) -> Dict[str, Any]:
         """Get user's peer support statistics"""
@@ -264,7 +574,7 @@ class PeerSupportService:
             'active_connections': random.randint(8, 15),
             'support_points_given': random.randint(40, 80),
             'support_points_received': random.randint(35, 70),
-            'groups_joined': random.randint(2, 5),
+            'groups_joined': len(self.memberships.groups_of(user_id)),
             'messages_sent': random.randint(50, 200),
             'support_rating': round(random.uniform(4.5, 5.0), 1),
             'hours_this_month': random.randint(15, 40)
@@ -283,8 +593,20 @@ class PeerSupportService:
         }
 
     async def block_user(self, blocker_id: str, blocked_id: str) -> Dict[str, Any]:
-        """Block a user from contacting the current user"""
-        # In production, this would update the database to prevent communication
+        """Block a user (by user id or match handle) from contacting or being matched with the current user"""
+        blocked_user_id = self._resolve_handle(blocker_id, blocked_id) or blocked_id
+        if blocked_user_id not in self.blocked_peers.get(blocker_id, ()):
+            connection = PeerConnection(
+                id=str(uuid.uuid4()),
+                requester_id=blocker_id,
+                requested_id=blocked_user_id,
+                status='blocked',
+                created_at=datetime.utcnow()
+            )
+            self.connections_db[connection.id] = connection
+            self._index_connection(connection)
+            await self._log_set("peer.connections", connection.id, connection)
+        
         return {
             'success': True,
             'message': 'User has been blocked successfully',
@@ -389,6 +711,8 @@ class PeerSupportService:
         )
         
         self.groups_db[group.id] = group
+        await self._add_member(group.id, creator_id)
+        await self._log_set("peer.groups", group.id, group)
         return group
 
     async def moderate_message(self, message_id: str, moderator_id: str, action: str, reason: str) -> Dict[str, Any]:
@@ -0,0 +1,150 @@
+from collections import deque
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional
+from app.models.emotion import EmotionAnalysis, MoodType
+
+WINDOWS = (7, 30)
+DISTRESS_MOODS = (MoodType.NEGATIVE, MoodType.STRESSED)
+
+
+class DayCounts:
+    """One user's mood and platform counts for one day"""
+
+    __slots__ = ("day", "moods", "platforms")
+
+    def __init__(self, day: date):
+        self.day = day
+        self.moods: Dict[str, int] = {}
+        self.platforms: Dict[str, int] = {}
+
+
+class UserAggregate:
+    """Running totals for one user"""
+
+    __slots__ = ("moods", "platforms", "days", "last_stress_day", "stress_streak", "longest_stress_streak")
+
+    def __init__(self):
+        # All-time counts
+        self.moods: Dict[str, int] = {}
+        self.platforms: Dict[str, int] = {}
+        # The last max(WINDOWS) days with analyses, oldest first
+        self.days: "deque[DayCounts]" = deque()
+        # Consecutive days with a negative or stressed analysis, ending at last_stress_day
+        self.last_stress_day: Optional[date] = None
+        self.stress_streak = 0
+        self.longest_stress_streak = 0
+
+
+class UserInsightStore:
+    """Per-user mood and platform aggregates, maintained as analyses are stored.
+
+    Keeps all-time counts, daily counts for the last 30 days (summed on read
+    into 7 and 30 day windows) and the current run of days with stress or
+    low mood, so insights never rescan a user's history.
+    """
+
+    def __init__(self):
+        self.users: Dict[str, UserAggregate] = {}
+
+    def record(self, analysis: EmotionAnalysis) -> None:
+        aggregate = self.users.get(analysis.user_id)
+        if aggregate is None:
+            self.users[analysis.user_id] = aggregate = UserAggregate()
+        mood = analysis.mood.value
+        platform = analysis.platform
+        aggregate.moods[mood] = aggregate.moods.get(mood, 0) + 1
+        if platform != 'general':
+            aggregate.platforms[platform] = aggregate.platforms.get(platform, 0) + 1
+
+        day = analysis.timestamp.date()
+        day_counts = self._day_counts(aggregate, day)
+        if day_counts is not None:
+            day_counts.moods[mood] = day_counts.moods.get(mood, 0) + 1
+            if platform != 'general':
+                day_counts.platforms[platform] = day_counts.platforms.get(platform, 0) + 1
+
+        if analysis.mood in DISTRESS_MOODS:
+            last = aggregate.last_stress_day
+            if last is None or day > last + timedelta(days=1):
+                aggregate.stress_streak = 1
+            elif day == last + timedelta(days=1):
+                aggregate.stress_streak += 1
+            if last is None or day > last:
+                aggregate.last_stress_day = day
+            aggregate.longest_stress_streak = max(aggregate.longest_stress_streak, aggregate.stress_streak)
+
+    @staticmethod
+    def _day_counts(aggregate: UserAggregate, day: date) -> Optional[DayCounts]:
+        days = aggregate.days
+        # Analyses almost always belong to the newest day
+        for day_counts in reversed(days):
+            if day_counts.day == day:
+                return day_counts
+            if day_counts.day < day:
+                break
+        if days and day < days[-1].day:
+            if day <= days[-1].day - timedelta(days=max(WINDOWS)):
+                return None
+            # Late arrival for a day with no analyses yet; keep days sorted
+            ordered = sorted([*days, DayCounts(day)], key=lambda counts: counts.day)
+            days.clear()
+            days.extend(ordered)
+            return next(counts for counts in days if counts.day == day)
+        days.append(DayCounts(day))
+        while days[0].day <= day - timedelta(days=max(WINDOWS)):
+            days.popleft()
+        return days[-1]
+
+    def window(self, user_id: str, days: int, today: date) -> Dict[str, Dict[str, int]]:
+        """Mood and platform counts over the last `days` days"""
+        moods: Dict[str, int] = {}
+        platforms: Dict[str, int] = {}
+        aggregate = self.users.get(user_id)
+        if aggregate is not None:
+            start = today - timedelta(days=days - 1)
+            for day_counts in reversed(aggregate.days):
+                if day_counts.day < start:
+                    break
+                if day_counts.day > today:
+                    continue
+                for mood, count in day_counts.moods.items():
+                    moods[mood] = moods.get(mood, 0) + count
+                for platform, count in day_counts.platforms.items():
+                    platforms[platform] = platforms.get(platform, 0) + count
+        return {'moods': moods, 'platforms': platforms}
+
+    def stress_streak(self, user_id: str, today: date) -> int:
+        """Current run of days with stress or low mood (still counting if yesterday was one)"""
+        aggregate = self.users.get(user_id)
+        if aggregate is None or aggregate.last_stress_day is None:
+            return 0
+        if aggregate.last_stress_day < today - timedelta(days=1):
+            return 0
+        return aggregate.stress_streak
+
+    def insights(self, user_id: str, today: date) -> Optional[Dict[str, Any]]:
+        aggregate = self.users.get(user_id)
+        if aggregate is None:
+            return None
+        windows = {f"{days}d": self.window(user_id, days, today) for days in WINDOWS}
+        week, month = windows['7d'], windows['30d']
+        streak = self.stress_streak(user_id, today)
+
+        recommendations: List[str] = []
+        if month['moods'].get('negative', 0) > month['moods'].get('positive', 0):
+            recommendations.append("Consider incorporating daily mindfulness practices")
+        if week['platforms'].get('instagram', 0) > 5:
+            recommendations.append("Instagram usage shows correlation with mood changes")
+        if week['moods'].get('stressed', 0) > 3:
+            recommendations.append("Try time management techniques to reduce stress")
+        if streak >= 3:
+            recommendations.append(f"You've had {streak} stressful days in a row - talking to a counselor can help")
+
+        return {
+            'patterns': dict(aggregate.moods),
+            'triggers': [{'platform': k, 'count': v} for k, v in aggregate.platforms.items()],
+            'windows': windows,
+            'stress_streak': streak,
+            'longest_stress_streak': aggregate.longest_stress_streak,
+            'recommendations': recommendations
+        }
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Bounded in-memory queue of records flushed to storage in bulk.
+
+    Records are flushed by a background task once `flush_size` records are
+    waiting or `flush_interval` seconds have passed. When `max_queue_size`
+    records are queued (e.g. the database is slow), `put` waits for a flush
+    instead of growing the queue. A failed flush keeps its records at the
+    front of the queue and is retried on the next interval. Until `start` is
+    called records are written through immediately. `index_keys` files each
+    pending record under the keys it returns, for `pending(key)` lookups.
+    """
+
+    def __init__(self, flush: Callable[[List[Any]], Awaitable[None]], max_queue_size: int = 10000,
+                 flush_size: int = 500, flush_interval: float = 0.5,
+                 index_keys: Optional[Callable[[Any], Iterable[Hashable]]] = None):
+        self.flush = flush
+        self.index_keys = index_keys
+        self.max_queue_size = max_queue_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self._queue: Deque[Any] = deque()
+        # Records taken off the queue whose flush hasn't committed yet
+        self._in_flight: List[Any] = []
+        # key -> pending records filed under it, oldest first
+        self._index: Dict[Hashable, Deque[Any]] = {}
+        self._flush_now = asyncio.Event()
+        self._space = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.stats = {
+            "enqueued": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "backpressure_waits": 0
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue) + len(self._in_flight)
+
+    def pending(self, key: Optional[Hashable] = None) -> List[Any]:
+        """Records accepted but not yet committed, oldest first; only those filed under `key` if given"""
+        if key is None:
+            return self._in_flight + list(self._queue)
+        return list(self._index.get(key, ()))
+
+    def pending_count(self, key: Hashable) -> int:
+        return len(self._index.get(key, ()))
+
+    def _unindex(self, records: List[Any]):
+        # Records commit in queue order, so each is the oldest under its keys
+        for record in records:
+            for key in self.index_keys(record):
+                filed = self._index[key]
+                filed.popleft()
+                if not filed:
+                    del self._index[key]
+
+    def start(self):
+        if self._flusher is None:
+            self._stopping = False
+            self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued and stop the background task"""
+        if self._flusher is None:
+            return
+        self._stopping = True
+        self._flush_now.set()
+        await self._flusher
+        self._flusher = None
+
+    async def put(self, record: Any):
+        """Queue a record, waiting for a flush if the queue is full"""
+        if self._flusher is None:
+            await self.flush([record])
+            self.stats["flushed"] += 1
+            return
+
+        if self.queue_depth >= self.max_queue_size:
+            self.stats["backpressure_waits"] += 1
+            while self.queue_depth >= self.max_queue_size:
+                self._flush_now.set()
+                self._space.clear()
+                await self._space.wait()
+
+        self._queue.append(record)
+        if self.index_keys:
+            for key in self.index_keys(record):
+                self._index.setdefault(key, deque()).append(record)
+        self.stats["enqueued"] += 1
+        if len(self._queue) >= self.flush_size:
+            self._flush_now.set()
+
+    async def put_many(self, records: List[Any]):
+        for record in records:
+            await self.put(record)
+
+    async def drain(self):
+        """Flush everything queued so far without stopping"""
+        await self._flush_queue()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self._flush_queue()
+
+        # Drain on shutdown
+        await self._flush_queue()
+        if self._queue:
+            logger.error(f"Write-behind buffer stopped with {len(self._queue)} unflushed records")
+
+    async def _flush_queue(self):
+        async with self._flush_lock:
+            while self._queue:
+                batch_size = min(self.flush_size, len(self._queue))
+                self._in_flight = [self._queue.popleft() for _ in range(batch_size)]
+                try:
+                    await self.flush(self._in_flight)
+                except Exception as e:
+                    logger.error(f"Write-behind flush of {batch_size} records failed: {e}")
+                    self.stats["failed_flushes"] += 1
+                    self._queue.extendleft(reversed(self._in_flight))
+                    self._in_flight = []
+                    break
+                if self.index_keys:
+                    self._unindex(self._in_flight)
+                self._in_flight = []
+                self.stats["flushed"] += batch_size
+                self.stats["flushes"] += 1
+                self._space.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_size": self.max_queue_size,
+            "running": self._flusher is not None,
+            **self.stats
+        }
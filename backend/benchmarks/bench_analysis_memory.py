@@ -0,0 +1,90 @@
+"""Resident memory per stored analysis: pydantic objects vs column chunks.
+
+Streams analyses (with realistic text, triggers and platforms) into
+InMemoryEmotionRepository and ColumnarEmotionRepository and reports the
+memory each one retains, measured with tracemalloc (which also tracks
+NumPy buffers).
+
+Run from the backend directory:
+    python -m benchmarks.bench_analysis_memory [analyses]
+"""
+import asyncio
+import gc
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+from app.models.emotion import EmotionAnalysis, MoodType
+from app.services.emotion_repository import InMemoryEmotionRepository, ColumnarEmotionRepository
+
+ANALYSES = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+BATCH_SIZE = 10_000
+USERS = 20_000
+SNIPPETS = [
+    "so stressed about the exam deadline tomorrow, can't sleep and feel like everything is falling apart",
+    "had a great day with friends at the campus festival, feeling grateful",
+    "another all-nighter for the project due tomorrow, fed up with this semester",
+    "lecture notes for week 6, nothing special going on",
+    "feeling lonely since everyone went home for the weekend"
+]
+PLATFORMS = ["general", "instagram", "twitter", "reddit", "manual", "quick_check"]
+TRIGGER_SETS = [[], [], ["academic_pressure"], ["social_comparison"], ["academic_pressure", "sleep"]]
+
+
+def analysis_batches(count, seed=11):
+    rng = random.Random(seed)
+    start = datetime.utcnow() - timedelta(days=120)
+    # Spread the analyses evenly over the 120 days
+    spacing = timedelta(days=120) / count
+    moods = list(MoodType)
+    for offset in range(0, count, BATCH_SIZE):
+        batch = []
+        for index in range(offset, min(offset + BATCH_SIZE, count)):
+            mood = rng.choice(moods)
+            batch.append((str(uuid.uuid4()), EmotionAnalysis(
+                user_id=f"{uuid.UUID(int=rng.randrange(USERS))}",
+                text=f"{rng.choice(SNIPPETS)} #{index}",
+                sentiment_label=mood.value,
+                confidence=rng.random(),
+                mood=mood,
+                platform=rng.choice(PLATFORMS),
+                triggers=list(rng.choice(TRIGGER_SETS)),
+                requires_intervention=rng.random() < 0.2,
+                timestamp=start + spacing * index
+            )))
+        yield batch
+
+
+async def measure(label, repository):
+    gc.collect()
+    tracemalloc.start()
+    for batch in analysis_batches(ANALYSES):
+        await repository.add_analyses(batch)
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    since = datetime.utcnow() - timedelta(days=30)
+    await repository.get_user_analyses(str(uuid.UUID(int=0)), since=since)
+    start = time.perf_counter()
+    for user in range(1, 201):
+        await repository.get_user_analyses(str(uuid.UUID(int=user)), since=since)
+    query_ms = (time.perf_counter() - start) / 200 * 1000
+
+    print(f"{label:<10} {retained / 2 ** 20:>9.1f} MiB  {retained / ANALYSES:>7.1f} bytes/analysis  "
+          f"30-day history {query_ms:.3f}ms/user")
+    return retained
+
+
+async def main():
+    print(f"{ANALYSES:,} analyses from {USERS:,} users")
+    columnar = await measure("columnar", ColumnarEmotionRepository())
+    pydantic = await measure("pydantic", InMemoryEmotionRepository())
+    print(f"reduction  {pydantic / columnar:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""Login lookup benchmark at 100k users.
+
+Compares the original linear scan over users_db against the email index.
+
+Run from the backend directory:
+    python -m benchmarks.bench_auth_login
+"""
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from passlib.context import CryptContext
+from app.models.user import User
+from app.services.auth_service import AuthService
+
+USER_COUNT = 100_000
+LOGINS = 2_000
+
+
+def legacy_find_user(users_db, email):
+    for uid, data in users_db.items():
+        if data["user"].email == email:
+            return uid, data
+    return None, None
+
+
+async def populate(service, count):
+    # Insert users directly with one shared low-cost bcrypt hash; hashing 100k
+    # passwords at production cost would dominate the run
+    service.pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+    password_hash = service.pwd_context.hash("correct horse battery staple")
+    for index in range(count):
+        user = User.model_construct(
+            id=f"user-{index}",
+            email=f"student{index}@university.edu",
+            name=f"Student {index}",
+            student_id=f"S{index:07d}",
+            created_at=datetime.utcnow()
+        )
+        service.users_db[user.id] = {"user": user, "password_hash": password_hash}
+        service._index_user(user)
+
+
+async def main():
+    service = AuthService()
+    start = time.perf_counter()
+    await populate(service, USER_COUNT)
+    print(f"created {USER_COUNT:,} users in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(3)
+    emails = [f"Student{rng.randrange(USER_COUNT)}@University.edu" for _ in range(LOGINS)]
+
+    start = time.perf_counter()
+    for email in emails[:200]:
+        legacy_find_user(service.users_db, email.lower())
+    legacy_elapsed = (time.perf_counter() - start) / 200
+    print(f"legacy scan lookup      {legacy_elapsed * 1e6:>10.1f} us/login")
+
+    start = time.perf_counter()
+    for email in emails:
+        await service.authenticate_user(email, "correct horse battery staple")
+    indexed_elapsed = (time.perf_counter() - start) / LOGINS
+    print(f"indexed authenticate    {indexed_elapsed * 1e6:>10.1f} us/login (includes bcrypt rounds=4 verify and token creation)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""Emotion storage backends: write throughput and history-query latency.
+
+Compares the in-memory repository against the SQLAlchemy repository on a
+SQLite file (or on DATABASE_URL when set, e.g. a local Postgres), writing
+analyses one at a time and in batches, then timing per-user history reads.
+
+Run from the backend directory:
+    python -m benchmarks.bench_emotion_storage
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.models.emotion import EmotionAnalysis, MoodType
+from app.services.emotion_repository import InMemoryEmotionRepository, SQLAlchemyEmotionRepository
+
+USERS = 500
+ANALYSES = 50_000
+SINGLE_WRITES = 2_000
+BATCH_SIZE = 100
+HISTORY_QUERIES = 500
+
+
+def make_analyses(count, rng):
+    start = datetime.utcnow() - timedelta(days=60)
+    moods = list(MoodType)
+    records = []
+    for index in range(count):
+        mood = rng.choice(moods)
+        records.append((str(uuid.uuid4()), EmotionAnalysis(
+            user_id=f"user-{rng.randrange(USERS)}",
+            text=f"benchmark text {index}",
+            sentiment_label=mood.value,
+            confidence=rng.random(),
+            mood=mood,
+            platform="general",
+            timestamp=start + timedelta(seconds=index * 100)
+        )))
+    return records
+
+
+async def run(label, repository, records, rng):
+    await repository.initialize()
+
+    start = time.perf_counter()
+    for record in records[:SINGLE_WRITES]:
+        await repository.add_analyses([record])
+    single_rate = SINGLE_WRITES / (time.perf_counter() - start)
+
+    rest = records[SINGLE_WRITES:]
+    start = time.perf_counter()
+    for offset in range(0, len(rest), BATCH_SIZE):
+        await repository.add_analyses(rest[offset:offset + BATCH_SIZE])
+    batch_rate = len(rest) / (time.perf_counter() - start)
+
+    cutoff = datetime.utcnow() - timedelta(days=30)
+    latencies = []
+    for _ in range(HISTORY_QUERIES):
+        user_id = f"user-{rng.randrange(USERS)}"
+        start = time.perf_counter()
+        await repository.get_user_analyses(user_id, since=cutoff)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    print(f"{label:<12} single {single_rate:>9,.0f} writes/s  batched {batch_rate:>9,.0f} writes/s  "
+          f"history p50={latencies[len(latencies) // 2] * 1000:.2f}ms  p99={latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+    await repository.close()
+
+
+async def main():
+    rng = random.Random(7)
+    records = make_analyses(ANALYSES, rng)
+
+    await run("in-memory", InMemoryEmotionRepository(), records, rng)
+
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        await run("database", SQLAlchemyEmotionRepository(database_url), records, rng)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+        await run("sqlite", SQLAlchemyEmotionRepository(url), records, rng)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
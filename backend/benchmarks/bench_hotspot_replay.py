@@ -0,0 +1,127 @@
+"""Hotspot detection over a synthetic semester of emotion and crisis events.
+
+Generates 16 weeks of analyses for a set of departments (daily rhythm,
+heavier load and more stress in midterm and finals weeks, occasional
+crisis alerts) and injects short distress bursts into random departments
+and locations. Replays everything through HotspotDetector in time order and
+reports throughput, how many bursts were flagged and how quickly, and how
+many hotspots were raised outside any burst.
+
+Run from the backend directory:
+    python -m benchmarks.bench_hotspot_replay [departments]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app.models.emotion import MoodType
+from app.services.hotspot_detector import HotspotDetector
+
+DEPARTMENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+WEEKS = 16
+EXAM_WEEKS = {7, 8, 15, 16}
+LOCATIONS = ["Library - 3rd Floor", "Engineering Building", "Student Dormitories", "Student Center", "Science Hall"]
+STUDENTS_PER_DEPARTMENT = 400
+BURSTS = 40
+BURST_EVENTS = (15, 30)
+BURST_MINUTES = 30
+# Analyses per department per hour, by hour of day
+HOURLY_RATE = [1, 0.5, 0.3, 0.2, 0.2, 0.4, 1, 3, 6, 9, 10, 10, 11, 10, 10, 10, 9, 9, 8, 8, 7, 6, 4, 2]
+
+
+def synthesize(seed=5):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 13)
+    events = []
+    for department in range(DEPARTMENTS):
+        name = f"department_{department}"
+        # Departments differ in size and baseline stress
+        size = rng.uniform(0.5, 2.0)
+        distress = rng.uniform(0.2, 0.4)
+        for hour in range(WEEKS * 7 * 24):
+            exam = hour // (7 * 24) + 1 in EXAM_WEEKS
+            rate = HOURLY_RATE[hour % 24] * size * (1.5 if exam else 1.0)
+            for _ in range(_poisson(rng, rate)):
+                at = start + timedelta(hours=hour, seconds=rng.random() * 3600)
+                mood = _mood(rng, distress * (1.3 if exam else 1.0))
+                events.append((at, "analysis", f"{name}-{rng.randrange(STUDENTS_PER_DEPARTMENT)}", mood, name, None))
+            if rng.random() < 0.01 * size:
+                at = start + timedelta(hours=hour, seconds=rng.random() * 3600)
+                severity = rng.choice(["low", "medium", "medium", "high"])
+                events.append((at, "crisis", f"{name}-{rng.randrange(STUDENTS_PER_DEPARTMENT)}", severity, name,
+                               rng.choice(LOCATIONS + [None] * 5)))
+
+    bursts = []
+    for _ in range(BURSTS):
+        department = f"department_{rng.randrange(DEPARTMENTS)}"
+        # Bursts during waking hours, after a week of history
+        day = rng.randrange(7, WEEKS * 7)
+        burst_start = start + timedelta(days=day, hours=rng.randrange(8, 22), minutes=rng.randrange(60))
+        bursts.append((department, burst_start))
+        for _ in range(rng.randint(*BURST_EVENTS)):
+            at = burst_start + timedelta(seconds=rng.random() * BURST_MINUTES * 60)
+            mood = rng.choice([MoodType.STRESSED, MoodType.NEGATIVE])
+            events.append((at, "analysis", f"{department}-{rng.randrange(STUDENTS_PER_DEPARTMENT)}", mood, department, None))
+    events.sort(key=lambda event: event[0])
+    return events, bursts
+
+
+def _poisson(rng, rate):
+    count, threshold, product = 0, 2.718281828459045 ** -rate, rng.random()
+    while product > threshold:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def _mood(rng, distress):
+    value = rng.random()
+    if value < distress * 0.6:
+        return MoodType.STRESSED
+    if value < distress:
+        return MoodType.NEGATIVE
+    return MoodType.POSITIVE if value < distress + (1 - distress) / 2 else MoodType.NEUTRAL
+
+
+def main():
+    print(f"synthesizing {WEEKS} weeks for {DEPARTMENTS} departments...")
+    events, bursts = synthesize()
+    detector = HotspotDetector()
+    detections = []
+    started = time.perf_counter()
+    for at, kind, user_id, value, department, location in events:
+        if kind == "analysis":
+            hotspot = detector.record_analysis(user_id, value, at, department)
+            if hotspot:
+                detections.append((at, hotspot))
+        else:
+            for hotspot in detector.record_crisis(user_id, value, at, department, location):
+                detections.append((at, hotspot))
+    elapsed = time.perf_counter() - started
+
+    flagged, delays = 0, []
+    matched = set()
+    for department, burst_start in bursts:
+        burst_end = burst_start + timedelta(minutes=BURST_MINUTES + 60)
+        hits = [
+            (index, at) for index, (at, hotspot) in enumerate(detections)
+            if hotspot['location'] == department and burst_start <= at <= burst_end
+        ]
+        if hits:
+            flagged += 1
+            delays.append((hits[0][1] - burst_start).total_seconds() / 60)
+            matched.update(index for index, _ in hits)
+    false_positives = len(detections) - len(matched)
+    delays.sort()
+
+    print(f"events           {len(events):>12,}")
+    print(f"throughput       {len(events) / elapsed:>12,.0f} events/s ({elapsed / len(events) * 1e6:.2f}us/event)")
+    print(f"bursts flagged   {flagged:>12} / {len(bursts)}")
+    if delays:
+        print(f"detection delay  {delays[len(delays) // 2]:>12.1f} min median, {delays[-1]:.1f} max")
+    print(f"other hotspots   {false_positives:>12} over {WEEKS * 7} days ({len(detector.areas)} areas)")
+
+
+if __name__ == "__main__":
+    main()
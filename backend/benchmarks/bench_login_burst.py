@@ -0,0 +1,82 @@
+"""Load test: emotion analysis latency during a login burst.
+
+Runs a steady stream of text analyses (the work behind /emotions/analyze)
+while a burst of bcrypt logins hits AuthService, and reports analysis
+latency percentiles with hashing inline on the event loop versus on the
+password thread pool.
+
+Run from the backend directory:
+    python -m benchmarks.bench_login_burst
+"""
+import asyncio
+import time
+
+from app.models.user import UserCreate
+from app.services.ai_service import AIService
+from app.services.auth_service import AuthService
+from app.services.emotion_service import EmotionService
+
+LOGIN_BURST = 40
+USERS = 10
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def probe(emotion_service, latencies, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await emotion_service.analyze_text_emotion(
+            "probe-user", f"so stressed about the exam deadline {len(latencies)}"
+        )
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.005)
+
+
+async def run(label, auth_service, emotion_service):
+    latencies = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(emotion_service, latencies, stop))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        auth_service.authenticate_user(f"student{index % USERS}@university.edu", "hunter2-but-longer")
+        for index in range(LOGIN_BURST)
+    ])
+    burst_elapsed = time.perf_counter() - start
+    stop.set()
+    await prober
+
+    print(f"{label:<16} burst {burst_elapsed:.2f}s  analyses={len(latencies):<5} "
+          f"p50={percentile(latencies, 0.5) * 1000:.1f}ms  p99={percentile(latencies, 0.99) * 1000:.1f}ms")
+
+
+async def main():
+    ai_service = AIService()
+    await ai_service.initialize()
+    emotion_service = EmotionService(ai_service)
+    auth_service = AuthService()
+    for index in range(USERS):
+        await auth_service.create_user(UserCreate(
+            email=f"student{index}@university.edu",
+            name=f"Student {index}",
+            password="hunter2-but-longer"
+        ))
+
+    executor_job = auth_service._run_password_job
+
+    async def inline_job(func, *args):
+        return func(*args)
+
+    auth_service._run_password_job = inline_job
+    await run("inline hashing", auth_service, emotion_service)
+    auth_service._run_password_job = executor_job
+    await run("thread pool", auth_service, emotion_service)
+
+    await ai_service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
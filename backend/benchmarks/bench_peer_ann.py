@@ -0,0 +1,110 @@
+"""Peer matching ANN index: recall@10 and QPS against exact search.
+
+Builds PeerMatchingEngine vectors for synthetic students, times exact
+(brute-force) queries, trains the IVF index and then sweeps nprobe,
+reporting recall@10 against the exact results and queries per second.
+Finally inserts and removes users incrementally (no retrain), checks that
+removed users are never returned and reports recall again.
+
+A result counts as a hit when its similarity reaches the exact 10th best
+(synthetic students often tie exactly, so comparing ids would undercount).
+
+Run from the backend directory:
+    python -m benchmarks.bench_peer_ann [users]
+"""
+import sys
+import time
+import random
+import asyncio
+from datetime import datetime, timedelta
+
+from app.models.emotion import EmotionAnalysis, MoodType
+from app.services.peer_matching import PeerMatchingEngine
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+ANALYSES_PER_USER = 4
+QUERIES = 500
+K = 10
+NPROBES = [1, 2, 4, 8, 16, 32, 64]
+MAJORS = [f"Major {index}" for index in range(60)]
+YEARS = ["Freshman", "Sophomore", "Junior", "Senior", "Graduate"]
+TRIGGERS = [f"stressor_{index}" for index in range(40)]
+MOODS = list(MoodType)
+
+
+def add_user(engine, rng, user_id, start):
+    engine.update_profile(user_id, rng.choice(MAJORS), rng.choice(YEARS))
+    weights = [rng.random() ** 2 for _ in MOODS]
+    stressors = rng.sample(TRIGGERS, 3)
+    for index in range(ANALYSES_PER_USER):
+        engine.record_analysis(EmotionAnalysis.model_construct(
+            user_id=user_id, text="", sentiment_label="", confidence=0.8,
+            mood=rng.choices(MOODS, weights)[0], platform="general",
+            triggers=rng.sample(stressors, rng.randint(0, 2)), requires_intervention=False,
+            timestamp=start + timedelta(hours=index)
+        ))
+
+
+def timed(engine, users, **kwargs):
+    started = time.perf_counter()
+    results = [engine.query(user_id, k=K, **kwargs) for user_id in users]
+    return results, len(users) / (time.perf_counter() - started)
+
+
+def recall(results, exact):
+    hits = total = 0
+    for found, truth in zip(results, exact):
+        if not truth:
+            continue
+        threshold = truth[-1][1] - 1e-5
+        hits += sum(1 for _, score in found if score >= threshold)
+        total += len(truth)
+    return hits / total
+
+
+def sweep(engine, users):
+    exact, exact_qps = timed(engine, users, exact=True)
+    print(f"  exact            {exact_qps:8.0f} QPS")
+    for nprobe in NPROBES:
+        results, qps = timed(engine, users, nprobe=nprobe)
+        print(f"  nprobe {nprobe:<3}       {qps:8.0f} QPS  recall@{K} {recall(results, exact):.3f}")
+
+
+async def main():
+    rng = random.Random(5)
+    start = datetime.utcnow() - timedelta(days=30)
+    engine = PeerMatchingEngine(initial_capacity=USERS * 2)
+    began = time.perf_counter()
+    for user in range(USERS):
+        add_user(engine, rng, f"user-{user}", start)
+    engine._refresh()
+    print(f"{USERS:,} users ingested in {time.perf_counter() - began:.1f}s")
+
+    began = time.perf_counter()
+    await engine.rebuild_index()
+    stats = engine.get_stats()["index"]
+    print(f"index built in {time.perf_counter() - began:.2f}s: {stats['lists']} lists, "
+          f"largest {stats['largest_list']} rows")
+
+    users = [f"user-{rng.randrange(USERS)}" for _ in range(QUERIES)]
+    sweep(engine, users)
+
+    # Incremental changes without retraining
+    churn = USERS // 10
+    began = time.perf_counter()
+    for user in range(USERS, USERS + churn):
+        add_user(engine, rng, f"user-{user}", start)
+    removed = {f"user-{user}" for user in rng.sample(range(USERS), churn // 2)}
+    for user_id in removed:
+        engine.remove(user_id)
+    engine._refresh()
+    print(f"+{churn:,} users / -{churn // 2:,} users applied in {time.perf_counter() - began:.1f}s")
+    users = [user_id for user_id in users if user_id in engine.rows]
+    for exact in (True, False):
+        returned = {peer_id for user_id in users for peer_id, _ in engine.query(user_id, k=K, exact=exact)}
+        assert not returned & removed, "removed users are still matched"
+    sweep(engine, users)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
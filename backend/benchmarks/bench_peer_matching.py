@@ -0,0 +1,99 @@
+"""Peer matching latency: exact top-k cosine search over all users.
+
+Builds PeerMatchingEngine vectors for synthetic students (majors, years,
+mood mixes and stressor triggers fed through record_analysis), then times
+find-style queries with exclusion sets, both on a settled matrix and with
+fresh analyses arriving between queries (dirty rows re-embedded first).
+
+Run from the backend directory:
+    python -m benchmarks.bench_peer_matching [users]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app.models.emotion import EmotionAnalysis, MoodType
+from app.services.peer_matching import PeerMatchingEngine
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+ANALYSES_PER_USER = 10
+QUERIES = 1_000
+K = 10
+MAJORS = ["Computer Science", "Psychology", "Engineering", "Business", "Biology", "English", "Mathematics",
+          "Nursing", "Economics", "History", "Physics", "Art", "Music", "Chemistry", "Political Science"]
+YEARS = ["Freshman", "Sophomore", "Junior", "Senior", "Graduate"]
+TRIGGERS = ["academic_pressure", "social_comparison", "sleep", "finances", "loneliness", "family",
+            "exams", "deadlines", "relationships", "health", "work", "perfectionism"]
+
+
+def build(rng):
+    engine = PeerMatchingEngine()
+    moods = list(MoodType)
+    start = datetime.utcnow() - timedelta(days=60)
+    for user in range(USERS):
+        user_id = f"user-{user}"
+        engine.update_profile(user_id, rng.choice(MAJORS), rng.choice(YEARS))
+        weights = [rng.random() for _ in moods]
+        stressors = rng.sample(TRIGGERS, 3)
+        for index in range(ANALYSES_PER_USER):
+            engine.record_analysis(EmotionAnalysis.model_construct(
+                user_id=user_id,
+                text="",
+                sentiment_label="",
+                confidence=0.8,
+                mood=rng.choices(moods, weights)[0],
+                platform="general",
+                triggers=rng.sample(stressors, rng.randint(0, 2)),
+                requires_intervention=False,
+                timestamp=start + timedelta(hours=index)
+            ))
+    return engine
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.99)] * 1000
+
+
+def main():
+    rng = random.Random(3)
+    started = time.perf_counter()
+    engine = build(rng)
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    engine._refresh()
+    embedded = time.perf_counter() - started
+    print(f"{USERS:,} users, {USERS * ANALYSES_PER_USER:,} analyses: ingest {built:.2f}s, "
+          f"embed {embedded * 1000:.0f}ms, matrix {engine.vectors.nbytes / 2 ** 20:.1f} MiB")
+
+    users = [f"user-{rng.randrange(USERS)}" for _ in range(QUERIES)]
+    exclusions = [{f"user-{rng.randrange(USERS)}" for _ in range(20)} for _ in range(QUERIES)]
+
+    timings = []
+    for user_id, exclude in zip(users, exclusions):
+        started = time.perf_counter()
+        engine.query(user_id, k=K, exclude=exclude)
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentiles(timings)
+    print(f"settled          p50 {p50:.2f}ms  p99 {p99:.2f}ms")
+
+    timings = []
+    moods = list(MoodType)
+    for user_id, exclude in zip(users, exclusions):
+        # 50 analyses land between consecutive queries
+        for _ in range(50):
+            engine.record_analysis(EmotionAnalysis.model_construct(
+                user_id=f"user-{rng.randrange(USERS)}", text="", sentiment_label="", confidence=0.8,
+                mood=rng.choice(moods), platform="general", triggers=[rng.choice(TRIGGERS)],
+                requires_intervention=False, timestamp=datetime.utcnow()
+            ))
+        started = time.perf_counter()
+        engine.query(user_id, k=K, exclude=exclude)
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentiles(timings)
+    print(f"with ingest      p50 {p50:.2f}ms  p99 {p99:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Microbenchmark for keyword sentiment scoring.
+
+Compares the original per-category list scan against the compiled lexicon.
+
+Run from the backend directory:
+    python -m benchmarks.bench_sentiment
+"""
+import random
+import time
+
+from app.services.ai_service import AIService
+from app.services.lexicon import CompiledLexicon
+
+SAMPLE_WORDS = (
+    "i have an exam tomorrow and feel so overwhelmed with homework but my friends are amazing "
+    "honestly i can't sleep and everything feels terrible today what a wonderful weekend "
+    "the project deadline is due tomorrow and i am worried about finals week at the library"
+).split()
+
+
+def legacy_scores(emotion_keywords, text):
+    words = text.lower().split()
+    return {
+        'positive': sum(1 for word in words if word in emotion_keywords['positive']),
+        'negative': sum(1 for word in words if word in emotion_keywords['negative']),
+        'stress': sum(1 for word in words if word in emotion_keywords['stress'])
+    }
+
+
+def make_texts(count, words_per_text=40, seed=7):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(SAMPLE_WORDS) for _ in range(words_per_text)) for _ in range(count)]
+
+
+def run(label, score, texts):
+    token_count = sum(len(text.split()) for text in texts)
+    start = time.perf_counter()
+    for text in texts:
+        score(text)
+    report(label, token_count, time.perf_counter() - start)
+
+
+def report(label, token_count, elapsed):
+    print(f"{label:<18} {token_count / elapsed:>14,.0f} tokens/sec  ({elapsed * 1000:.1f} ms)")
+
+
+def main():
+    service = AIService()
+    lexicon = CompiledLexicon(service.emotion_keywords)
+    texts = make_texts(20000)
+    run("legacy list scan", lambda text: legacy_scores(service.emotion_keywords, text), texts)
+    run("compiled lexicon", lexicon.score, texts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Per-request auth overhead with and without the verified-token cache.
+
+Run from the backend directory:
+    python -m benchmarks.bench_verify_token
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from app.models.user import User
+from app.services.auth_service import AuthService
+
+REQUESTS = 50_000
+
+
+async def measure(label, service, token):
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        await service.verify_token(token)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {elapsed / REQUESTS * 1e6:>8.2f} us/request")
+
+
+async def main():
+    service = AuthService()
+    user = User(id="user-1", email="student@university.edu", name="Student", created_at=datetime.utcnow())
+    service.users_db[user.id] = {"user": user, "password_hash": ""}
+    token = service._create_access_token({"sub": user.id}, expires_delta=timedelta(minutes=30))
+
+    service.token_cache_size = 0
+    await measure("uncached", service, token)
+    service.token_cache_size = 50000
+    await measure("cached", service, token)
+    print(service.get_token_cache_stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
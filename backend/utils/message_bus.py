@@ -0,0 +1,201 @@
+import json
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Any, Optional, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CHANNEL = "mindfulcampus:broadcast"
+PRESENCE_KEY_PREFIX = "mindfulcampus:presence:"
+
+BusHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def worker_channel(worker_id: str) -> str:
+    return f"mindfulcampus:worker:{worker_id}"
+
+
+class MessageBus(ABC):
+    """Pub/sub transport and presence registry shared by all API workers.
+
+    Each worker subscribes to the broadcast channel and to its own worker
+    channel. The presence registry records which worker holds each user's
+    WebSocket, so direct messages are published only to that worker.
+    """
+
+    @abstractmethod
+    async def start(self, worker_id: str, handler: BusHandler):
+        ...
+
+    @abstractmethod
+    async def stop(self):
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, envelope: Dict[str, Any]) -> int:
+        """Publish an envelope; returns the number of workers that received it"""
+
+    @abstractmethod
+    async def set_presence(self, user_id: str, worker_id: str):
+        ...
+
+    async def refresh_presence(self, user_ids: List[str], worker_id: str):
+        """Re-register users still connected to `worker_id` (keeps expiring presence alive)"""
+        for user_id in user_ids:
+            await self.set_presence(user_id, worker_id)
+
+    @abstractmethod
+    async def clear_presence(self, user_id: str, worker_id: str):
+        ...
+
+    @abstractmethod
+    async def get_presence(self, user_ids: List[str]) -> Dict[str, str]:
+        """Map each online user id to the worker that owns their connection"""
+
+
+class InProcessHub:
+    """Shared state standing in for redis when all workers live in one process"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, List[BusHandler]] = {}
+        self.presence: Dict[str, str] = {}
+
+
+class InProcessMessageBus(MessageBus):
+    """Message bus over an InProcessHub, for tests and single-process setups.
+
+    Envelopes go through JSON like they would on the wire, and delivery is
+    asynchronous so ordering behaves like a real broker.
+    """
+
+    def __init__(self, hub: Optional[InProcessHub] = None):
+        self.hub = hub or InProcessHub()
+        self._channels: List[str] = []
+        self._handler: Optional[BusHandler] = None
+
+    async def start(self, worker_id: str, handler: BusHandler):
+        self._handler = handler
+        self._channels = [BROADCAST_CHANNEL, worker_channel(worker_id)]
+        for channel in self._channels:
+            self.hub.subscribers.setdefault(channel, []).append(handler)
+
+    async def stop(self):
+        for channel in self._channels:
+            handlers = self.hub.subscribers.get(channel, [])
+            if self._handler in handlers:
+                handlers.remove(self._handler)
+        self._channels = []
+
+    async def publish(self, channel: str, envelope: Dict[str, Any]) -> int:
+        data = json.dumps(envelope)
+        handlers = list(self.hub.subscribers.get(channel, []))
+        for handler in handlers:
+            asyncio.create_task(handler(json.loads(data)))
+        return len(handlers)
+
+    async def set_presence(self, user_id: str, worker_id: str):
+        self.hub.presence[user_id] = worker_id
+
+    async def clear_presence(self, user_id: str, worker_id: str):
+        if self.hub.presence.get(user_id) == worker_id:
+            del self.hub.presence[user_id]
+
+    async def get_presence(self, user_ids: List[str]) -> Dict[str, str]:
+        return {user_id: self.hub.presence[user_id] for user_id in user_ids if user_id in self.hub.presence}
+
+
+class RedisMessageBus(MessageBus):
+    """Message bus over redis pub/sub, with presence stored as expiring keys.
+
+    Presence keys expire after `presence_ttl` seconds unless refreshed (the
+    WebSocketManager refreshes its users well within that), so a crashed
+    worker's users stop being routed to it after a few minutes. The
+    subscription is re-established with backoff if the connection drops.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", presence_ttl: int = 300,
+                 max_reconnect_delay: float = 30.0):
+        self.url = url
+        self.presence_ttl = presence_ttl
+        self.max_reconnect_delay = max_reconnect_delay
+        self.client = None
+        self._pubsub = None
+        self._channels: List[str] = []
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, worker_id: str, handler: BusHandler):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(self.url, decode_responses=True)
+        self._channels = [BROADCAST_CHANNEL, worker_channel(worker_id)]
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(*self._channels)
+        self._listener = asyncio.create_task(self._listen(handler))
+        logger.info(f"Worker {worker_id} subscribed to redis message bus")
+
+    async def _listen(self, handler: BusHandler):
+        delay = 1.0
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    delay = 1.0
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        await handler(json.loads(message["data"]))
+                    except Exception as e:
+                        logger.error(f"Failed to handle message bus envelope: {e}")
+                raise ConnectionError("subscription closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lost message bus subscription ({e}); resubscribing in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+            try:
+                await self._pubsub.close()
+            except Exception:
+                pass
+            self._pubsub = self.client.pubsub()
+            try:
+                await self._pubsub.subscribe(*self._channels)
+                logger.info("Resubscribed to redis message bus")
+            except Exception as e:
+                logger.error(f"Failed to resubscribe to message bus: {e}")
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub:
+            await self._pubsub.unsubscribe()
+            await self._pubsub.close()
+            self._pubsub = None
+        if self.client:
+            await self.client.close()
+            self.client = None
+
+    async def publish(self, channel: str, envelope: Dict[str, Any]) -> int:
+        return await self.client.publish(channel, json.dumps(envelope))
+
+    async def set_presence(self, user_id: str, worker_id: str):
+        await self.client.set(PRESENCE_KEY_PREFIX + user_id, worker_id, ex=self.presence_ttl)
+
+    async def refresh_presence(self, user_ids: List[str], worker_id: str):
+        async with self.client.pipeline(transaction=False) as pipeline:
+            for user_id in user_ids:
+                pipeline.set(PRESENCE_KEY_PREFIX + user_id, worker_id, ex=self.presence_ttl)
+            await pipeline.execute()
+
+    async def clear_presence(self, user_id: str, worker_id: str):
+        key = PRESENCE_KEY_PREFIX + user_id
+        # Only clear our own registration; the user may have reconnected elsewhere
+        if await self.client.get(key) == worker_id:
+            await self.client.delete(key)
+
+    async def get_presence(self, user_ids: List[str]) -> Dict[str, str]:
+        if not user_ids:
+            return {}
+        owners = await self.client.mget([PRESENCE_KEY_PREFIX + user_id for user_id in user_ids])
+        return {user_id: owner for user_id, owner in zip(user_ids, owners) if owner is not None}
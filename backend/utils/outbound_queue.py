@@ -0,0 +1,228 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, Callable, Awaitable, Deque, Tuple, List
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Overflow policies, chosen per message type
+DROP_OLDEST = "drop_oldest"    # make room by discarding the oldest queued message of a droppable type
+DROP_NEWEST = "drop_newest"    # discard the incoming message when the queue is full
+NEVER_DROP = "never_drop"      # always queue, even past the bound
+
+DEFAULT_OVERFLOW_POLICY = {
+    "ping": DROP_OLDEST,
+    "pong": DROP_OLDEST,
+    "wellness_reminder": DROP_OLDEST,
+    "crisis_alert": NEVER_DROP,
+    # Counselor pushes of newly detected distress hotspots
+    "hotspot_alert": NEVER_DROP,
+    "intervention": NEVER_DROP,
+    "intervention_triggered": NEVER_DROP,
+    "peer_message": NEVER_DROP,
+    "peer_message_sent": NEVER_DROP,
+    "group_message": NEVER_DROP,
+    # Carries cumulative positions, so a newer one supersedes older ones
+    "peer_message_status": DROP_OLDEST,
+    # Member joined/left notices; the member list can always be re-read
+    "group_activity": DROP_OLDEST,
+    # Replies to malformed client frames; a client flooding them loses its own errors
+    "error": DROP_NEWEST
+}
+
+
+class OutboundConnection:
+    """A WebSocket with a bounded outbound queue drained by its own writer task.
+
+    Handlers call `enqueue` and return immediately; the writer sends queued
+    payloads in order. When the queue is full, the incoming message's overflow
+    policy decides what happens (see DEFAULT_OVERFLOW_POLICY). A connection is
+    evicted as a slow consumer after `max_slow_sends` consecutive send
+    timeouts, `max_overflows` consecutive overflows that dropped a message,
+    or when NEVER_DROP messages pile up past `max_backlog`. NEVER_DROP
+    messages still queued when the connection goes away are handed to
+    `on_undelivered` instead of being discarded.
+    """
+
+    def __init__(self, websocket: WebSocket, connection_id: str,
+                 on_close: Callable[["OutboundConnection"], Awaitable[None]],
+                 send_slots: Optional[asyncio.Semaphore] = None,
+                 max_queue_size: int = 256, send_timeout: float = 5.0,
+                 max_slow_sends: int = 3, max_overflows: int = 100,
+                 overflow_policy: Optional[Dict[str, str]] = None,
+                 default_policy: str = DROP_NEWEST, max_backlog: Optional[int] = None,
+                 on_undelivered: Optional[Callable[["OutboundConnection", List[Tuple[str, str]]], None]] = None):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.on_close = on_close
+        self.send_slots = send_slots
+        self.max_queue_size = max_queue_size
+        self.send_timeout = send_timeout
+        self.max_slow_sends = max_slow_sends
+        self.max_overflows = max_overflows
+        self.overflow_policy = overflow_policy or DEFAULT_OVERFLOW_POLICY
+        self.default_policy = default_policy
+        # Hard bound for NEVER_DROP messages queued past max_queue_size
+        self.max_backlog = max_backlog or max_queue_size * 4
+        self.on_undelivered = on_undelivered
+
+        # (message type, serialized payload)
+        self._queue: Deque[Tuple[str, str]] = deque()
+        self._ready = asyncio.Event()
+        # Set whenever the queue drops below max_queue_size (see wait_for_room)
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._writer: Optional[asyncio.Task] = None
+        self._shutdown_task: Optional[asyncio.Task] = None
+        self._consecutive_slow_sends = 0
+        self._consecutive_overflows = 0
+        self.closed = False
+        self._shut_down = False
+
+        self.stats = {
+            "sent": 0,
+            "dropped": 0,
+            "timed_out": 0
+        }
+
+    def start(self):
+        self._writer = asyncio.create_task(self._drain())
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, payload: str, message_type: str = "unknown") -> bool:
+        """Queue a serialized message; returns False if it was dropped"""
+        if self.closed:
+            return False
+
+        if len(self._queue) >= self.max_queue_size:
+            self._has_room.clear()
+            if self._drop_oldest():
+                queued = True
+            elif self.overflow_policy.get(message_type, self.default_policy) == NEVER_DROP:
+                # Queued past the bound without counting as an overflow; only
+                # a runaway backlog gets the connection evicted
+                self._queue.append((message_type, payload))
+                self._ready.set()
+                if len(self._queue) > self.max_backlog:
+                    logger.warning(f"Evicting slow consumer {self.connection_id}: {len(self._queue)} messages backlogged")
+                    self._evict()
+                    return False
+                return True
+            else:
+                self.stats["dropped"] += 1
+                queued = False
+
+            # Only overflows that dropped something count toward eviction
+            self._consecutive_overflows += 1
+            if self._consecutive_overflows >= self.max_overflows:
+                if queued:
+                    self._queue.append((message_type, payload))
+                logger.warning(f"Evicting slow consumer {self.connection_id}: outbound queue kept overflowing")
+                self._evict()
+                return False
+            if not queued:
+                return False
+        else:
+            self._consecutive_overflows = 0
+
+        self._queue.append((message_type, payload))
+        self._ready.set()
+        return True
+
+    def _drop_oldest(self) -> bool:
+        """Free a slot by discarding the oldest queued message of a droppable type"""
+        for index, (queued_type, _) in enumerate(self._queue):
+            if self.overflow_policy.get(queued_type, self.default_policy) == DROP_OLDEST:
+                del self._queue[index]
+                self.stats["dropped"] += 1
+                return True
+        return False
+
+    async def wait_for_room(self, slots: int = 1) -> bool:
+        """Wait until `slots` more messages fit under max_queue_size; False if the connection closed"""
+        while not self.closed and len(self._queue) + slots > self.max_queue_size:
+            self._has_room.clear()
+            await self._has_room.wait()
+        return not self.closed
+
+    async def _drain(self):
+        try:
+            while True:
+                while not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                message_type, payload = self._queue.popleft()
+                if len(self._queue) < self.max_queue_size:
+                    self._has_room.set()
+
+                try:
+                    if self.send_slots is not None:
+                        async with self.send_slots:
+                            await asyncio.wait_for(self.websocket.send_text(payload), self.send_timeout)
+                    else:
+                        await asyncio.wait_for(self.websocket.send_text(payload), self.send_timeout)
+                except asyncio.TimeoutError:
+                    self.stats["timed_out"] += 1
+                    self._consecutive_slow_sends += 1
+                    logger.warning(f"Send of {message_type} to {self.connection_id} timed out after {self.send_timeout}s")
+                    if self._consecutive_slow_sends >= self.max_slow_sends:
+                        logger.warning(f"Evicting slow consumer {self.connection_id}: {self._consecutive_slow_sends} sends timed out")
+                        break
+                    continue
+
+                self._consecutive_slow_sends = 0
+                self.stats["sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to send message to {self.connection_id}: {e}")
+
+        # The writer only gets here when the connection is dead or too slow
+        self._writer = None
+        await self._shutdown()
+
+    def _evict(self):
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        self._shutdown_task = asyncio.create_task(self._shutdown())
+
+    def _release_queue(self):
+        """Empty the queue, handing NEVER_DROP messages to on_undelivered"""
+        undelivered = [
+            (message_type, payload) for message_type, payload in self._queue
+            if self.overflow_policy.get(message_type, self.default_policy) == NEVER_DROP
+        ]
+        self._queue.clear()
+        self._has_room.set()
+        if undelivered:
+            logger.info(f"{len(undelivered)} undelivered messages left for {self.connection_id}")
+            if self.on_undelivered:
+                self.on_undelivered(self, undelivered)
+
+    async def _shutdown(self):
+        """Close the socket and tell the owner this connection is gone"""
+        if self._shut_down:
+            return
+        self._shut_down = True
+        self.closed = True
+        self._release_queue()
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+        await self.on_close(self)
+
+    async def close(self):
+        """Stop the writer without notifying the owner (used on normal disconnect)"""
+        self.closed = True
+        self._shut_down = True
+        self._release_queue()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
@@ -0,0 +1,394 @@
+import gc
+import os
+import re
+import zlib
+import time
+import struct
+import pickle
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; the directory is then not locked
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Record ops
+OP_SET = 1
+OP_DELETE = 2
+
+# WAL and snapshot files are sequences of frames: payload length, crc32 of
+# payload, payload. A WAL frame holds every record of one group commit, so a
+# commit is replayed entirely or (if torn by a crash) not at all. A snapshot
+# frame holds (store name, [(key, value), ...]) for a chunk of one store.
+_FRAME = struct.Struct(">II")
+_SEGMENT_PATTERN = re.compile(r"^wal-(\d{8})\.log$")
+_SNAPSHOT_PATTERN = re.compile(r"^snapshot-(\d{8})\.snap$")
+# Held (flock) while a log is open: two processes appending to the same
+# segments would interleave frames and delete each other's files
+_LOCK_NAME = "wal.lock"
+# Entries per snapshot frame; pickling holds the GIL, so small chunks keep the
+# event loop responsive while a snapshot is written from a worker thread
+SNAPSHOT_CHUNK_SIZE = 2000
+
+
+def _segment_name(number: int) -> str:
+    return f"wal-{number:08d}.log"
+
+
+def _snapshot_name(number: int) -> str:
+    return f"snapshot-{number:08d}.snap"
+
+
+def _frame(payload: bytes) -> bytes:
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(data: bytes) -> Tuple[List[bytes], int]:
+    """Split a buffer into frame payloads; stops at the first torn or corrupt frame.
+
+    Returns the payloads and the offset just past the last valid frame.
+    """
+    payloads = []
+    view = memoryview(data)
+    offset = 0
+    header_size = _FRAME.size
+    while offset + header_size <= len(data):
+        length, checksum = _FRAME.unpack_from(view, offset)
+        end = offset + header_size + length
+        if end > len(data):
+            break
+        payload = view[offset + header_size:end]
+        if zlib.crc32(payload) != checksum:
+            break
+        payloads.append(payload)
+        offset = end
+    return payloads, offset
+
+
+class WriteAheadLog:
+    """Append-only log of mutations to registered in-memory stores.
+
+    Stores are dicts (or dict-like) registered by name. Services record each
+    mutation with `log_set`/`log_delete` and `await commit()` when the change
+    must be durable before they return; concurrent commits share one write +
+    fsync (group commit), pickled together as one frame. `open` rebuilds the
+    stores from the newest snapshot plus the WAL segments written after it.
+    Every `snapshot_every` records a snapshot of all stores is written and
+    older segments are deleted.
+    """
+
+    def __init__(self, directory: str, group_commit_interval: float = 0.002,
+                 snapshot_every: int = 200000, fsync: bool = True):
+        self.directory = directory
+        self.group_commit_interval = group_commit_interval
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+
+        self.stores: Dict[str, Dict[Any, Any]] = {}
+        self._replay_hooks: List[Callable[[], None]] = []
+
+        self._segment_number = 0
+        self._segment = None
+        self._lock_file = None
+        # Records logged since the last flush: (store, op, key, value)
+        self._pending: List[Tuple[str, int, Any, Any]] = []
+        self._waiters: List[asyncio.Future] = []
+        self._dirty = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._committer: Optional[asyncio.Task] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._records_since_snapshot = 0
+        self._closing = False
+
+        self.stats = {
+            "records": 0,
+            "commits": 0,
+            "bytes_written": 0,
+            "snapshots": 0,
+            "replayed_records": 0,
+            "replay_seconds": 0.0
+        }
+
+    def register(self, name: str, store: Dict[Any, Any], on_replay: Optional[Callable[[], None]] = None):
+        """Make a store durable; `on_replay` runs after `open` restores it (e.g. to rebuild indexes).
+
+        A store is a dict or anything with the dict methods used here:
+        __setitem__, pop, update, copy and items.
+        """
+        if name in self.stores:
+            raise Exception(f"WAL store {name} already registered")
+        self.stores[name] = store
+        if on_replay:
+            self._replay_hooks.append(on_replay)
+
+    async def open(self):
+        """Restore registered stores from disk and start accepting records"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock()
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        last_segment = await loop.run_in_executor(None, self._replay)
+        self.stats["replay_seconds"] = time.perf_counter() - start
+        if self.stats["replayed_records"]:
+            logger.info(f"Replayed {self.stats['replayed_records']} WAL records in {self.stats['replay_seconds']:.2f}s")
+        # Always append to a fresh segment so a torn tail is never extended
+        self._open_segment(last_segment + 1)
+        gc.disable()
+        try:
+            for hook in self._replay_hooks:
+                hook()
+        finally:
+            gc.enable()
+        self._closing = False
+        self._committer = asyncio.create_task(self._commit_loop())
+
+    def _lock(self):
+        if fcntl is None:
+            return
+        lock_file = open(os.path.join(self.directory, _LOCK_NAME), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise Exception(f"WAL directory {self.directory} is in use by another process "
+                            f"(a WAL belongs to one process; several workers can't share it)")
+        self._lock_file = lock_file
+
+    def _unlock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _list_files(self, pattern) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _replay(self) -> int:
+        """Load the newest snapshot and apply later segments; returns the last segment number"""
+        snapshots = self._list_files(_SNAPSHOT_PATTERN)
+        first_segment = 0
+        if snapshots:
+            first_segment = snapshots[-1]
+            with open(os.path.join(self.directory, _snapshot_name(first_segment)), "rb") as f:
+                data = f.read()
+            payloads, valid_length = read_frames(data)
+            if valid_length != len(data):
+                raise Exception(f"Snapshot {_snapshot_name(first_segment)} is corrupt")
+            # Unpickling creates millions of objects; cyclic GC passes over
+            # the growing heap would otherwise dominate replay time
+            gc.disable()
+            try:
+                for payload in payloads:
+                    name, entries = pickle.loads(payload)
+                    if name in self.stores:
+                        self.stores[name].update(entries)
+            finally:
+                gc.enable()
+
+        segments = [number for number in self._list_files(_SEGMENT_PATTERN) if number >= first_segment]
+        stores = self.stores
+        replayed = 0
+        for number in segments:
+            path = os.path.join(self.directory, _segment_name(number))
+            with open(path, "rb") as f:
+                data = f.read()
+            payloads, valid_length = read_frames(data)
+            if valid_length < len(data):
+                logger.warning(f"Ignoring {len(data) - valid_length} torn bytes at the end of {path}")
+            gc.disable()
+            try:
+                for payload in payloads:
+                    records = pickle.loads(payload)
+                    for name, op, key, value in records:
+                        store = stores.get(name)
+                        if store is None:
+                            continue
+                        if op == OP_SET:
+                            store[key] = value
+                        else:
+                            store.pop(key, None)
+                    replayed += len(records)
+            finally:
+                gc.enable()
+
+        self.stats["replayed_records"] = replayed
+        self._records_since_snapshot = replayed
+        return max(segments + [first_segment])
+
+    def _open_segment(self, number: int):
+        self._segment_number = number
+        self._segment = open(os.path.join(self.directory, _segment_name(number)), "ab")
+
+    def log_set(self, store: str, key: Any, value: Any):
+        """Record that store[key] = value; the value is serialized at the next flush"""
+        self._append((store, OP_SET, key, value))
+
+    def log_delete(self, store: str, key: Any):
+        self._append((store, OP_DELETE, key, None))
+
+    def _append(self, record: Tuple[str, int, Any, Any]):
+        if self._segment is None:
+            raise Exception("Write-ahead log is not open")
+        self._pending.append(record)
+        self.stats["records"] += 1
+        self._records_since_snapshot += 1
+        self._dirty.set()
+
+    async def commit(self):
+        """Wait until every record logged so far is written and fsynced"""
+        if not self._pending:
+            # Records may still be in an in-progress flush; wait for it
+            async with self._flush_lock:
+                return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._dirty.set()
+        await waiter
+
+    async def _commit_loop(self):
+        while not self._closing:
+            await self._dirty.wait()
+            # Give concurrent writers a moment to join this commit
+            await asyncio.sleep(self.group_commit_interval)
+            self._dirty.clear()
+            await self._flush()
+            if self._records_since_snapshot >= self.snapshot_every and self._snapshot_task is None:
+                self._snapshot_task = asyncio.create_task(self._snapshot_in_background())
+
+    def _take_pending(self) -> Tuple[bytes, List[asyncio.Future]]:
+        """Serialize pending records into one frame and take their waiters"""
+        data = _frame(pickle.dumps(self._pending, protocol=pickle.HIGHEST_PROTOCOL))
+        waiters = self._waiters
+        self._pending = []
+        self._waiters = []
+        return data, waiters
+
+    async def _flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            data, waiters = self._take_pending()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, self._segment, data)
+            except Exception as e:
+                logger.error(f"WAL write failed: {e}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                return
+            self.stats["commits"] += 1
+            self.stats["bytes_written"] += len(data)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    def _write(self, segment, data: bytes):
+        segment.write(data)
+        segment.flush()
+        if self.fsync:
+            os.fsync(segment.fileno())
+
+    async def snapshot(self):
+        """Write a snapshot of all stores and drop the segments it covers"""
+        async with self._flush_lock:
+            loop = asyncio.get_running_loop()
+            # Everything logged so far goes to the old segment...
+            if self._pending:
+                data, waiters = self._take_pending()
+                await loop.run_in_executor(None, self._write, self._segment, data)
+                self.stats["commits"] += 1
+                self.stats["bytes_written"] += len(data)
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+            old_segment = self._segment
+            # ...and the stores are copied at the same instant the new segment
+            # starts (no await in between). Values are pickled from the copy on
+            # a worker thread; a value mutated meanwhile is also logged to the
+            # new segment, so replay still ends at the right state.
+            self._open_segment(self._segment_number + 1)
+            stores = {name: store.copy() for name, store in self.stores.items()}
+            self._records_since_snapshot = 0
+            number = self._segment_number
+            size = await loop.run_in_executor(None, self._write_snapshot, number, stores, old_segment)
+        self.stats["snapshots"] += 1
+        logger.info(f"Wrote WAL snapshot {_snapshot_name(number)} ({size} bytes)")
+
+    def _write_snapshot(self, number: int, stores: Dict[str, Dict[Any, Any]], old_segment) -> int:
+        old_segment.close()
+        path = os.path.join(self.directory, _snapshot_name(number))
+        temp_path = path + ".tmp"
+        size = 0
+        with open(temp_path, "wb") as f:
+            for name, store in stores.items():
+                items = list(store.items())
+                for offset in range(0, len(items), SNAPSHOT_CHUNK_SIZE):
+                    chunk = (name, items[offset:offset + SNAPSHOT_CHUNK_SIZE])
+                    frame = _frame(pickle.dumps(chunk, protocol=pickle.HIGHEST_PROTOCOL))
+                    f.write(frame)
+                    size += len(frame)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            directory_fd = os.open(self.directory, os.O_DIRECTORY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+
+        # The new snapshot supersedes older snapshots and segments
+        for old in self._list_files(_SNAPSHOT_PATTERN):
+            if old < number:
+                os.remove(os.path.join(self.directory, _snapshot_name(old)))
+        for old in self._list_files(_SEGMENT_PATTERN):
+            if old < number:
+                os.remove(os.path.join(self.directory, _segment_name(old)))
+        return size
+
+    async def _snapshot_in_background(self):
+        try:
+            await self.snapshot()
+        except Exception as e:
+            logger.error(f"WAL snapshot failed: {e}")
+        finally:
+            self._snapshot_task = None
+
+    async def close(self, snapshot: bool = True):
+        """Flush outstanding records and optionally snapshot so the next start replays little"""
+        if self._committer is None:
+            return
+        self._closing = True
+        self._dirty.set()
+        await self._committer
+        self._committer = None
+        if self._snapshot_task is not None:
+            await self._snapshot_task
+        if snapshot:
+            await self.snapshot()
+        else:
+            await self._flush()
+        self._segment.close()
+        self._segment = None
+        path = os.path.join(self.directory, _segment_name(self._segment_number))
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+        self._unlock()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "segment": self._segment_number,
+            "pending_records": len(self._pending),
+            "records_since_snapshot": self._records_since_snapshot,
+            **self.stats
+        }
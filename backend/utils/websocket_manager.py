@@ -1,72 +1,285 @@
 import json
+import uuid
+import asyncio
 import logging
-from typing import Dict, List, Any
+from collections import deque
+from typing import Dict, List, Any, Optional, Callable, Iterable, Deque, Tuple, Set
 from fastapi import WebSocket, WebSocketDisconnect
+from app.utils.outbound_queue import OutboundConnection
+from app.utils.message_bus import MessageBus, BROADCAST_CHANNEL, worker_channel
 
 logger = logging.getLogger(__name__)
 
+# NEVER_DROP messages kept per user/counselor when their connection goes away
+# with them still queued; they are queued again on the next connect
+MAX_UNDELIVERED = 1000
+# Re-sent from stored delivery positions on reconnect, so not kept here
+REPLAYED_TYPES = {"peer_message"}
+
 class WebSocketManager:
-    def __init__(self):
-        # Store active connections: user_id -> websocket
-        self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(self, max_concurrent_sends: int = 500, send_timeout: float = 5.0, max_queue_size: int = 256,
+                 message_bus: Optional[MessageBus] = None, worker_id: Optional[str] = None,
+                 on_presence: Optional[Callable[[str, bool], None]] = None,
+                 presence_refresh_interval: float = 60.0,
+                 on_event: Optional[Callable[[str, Any], None]] = None):
+        # Store active connections: user_id -> connection with its outbound queue
+        self.active_connections: Dict[str, OutboundConnection] = {}
         # Store counselor connections separately
-        self.counselor_connections: Dict[str, WebSocket] = {}
+        self.counselor_connections: Dict[str, OutboundConnection] = {}
+        # Writer limits. Counselors get their own send slots so crisis alerts
+        # never queue behind a large student broadcast.
+        self.send_timeout = send_timeout
+        self.max_queue_size = max_queue_size
+        self._send_slots = asyncio.Semaphore(max_concurrent_sends)
+        self._counselor_send_slots = asyncio.Semaphore(max_concurrent_sends)
+        self.dropped_connections = 0
+        # connection id -> undelivered (message type, payload), for users and counselors
+        self.undelivered: Dict[str, Deque[Tuple[str, str]]] = {}
+        self.undelivered_counselor: Dict[str, Deque[Tuple[str, str]]] = {}
+        self._redeliveries: Set[asyncio.Task] = set()
+        # Optional cross-worker delivery; without a bus only local sockets are reachable
+        self.message_bus = message_bus
+        self.worker_id = worker_id or str(uuid.uuid4())
+        # Presence expires on the bus unless refreshed, so it is re-registered
+        # periodically for as long as a user stays connected here
+        self.presence_refresh_interval = presence_refresh_interval
+        self._presence_task: Optional[asyncio.Task] = None
+        # Told (user_id, online) as user sockets on this worker come and go
+        self.on_presence = on_presence
+        # Told (name, data) of events other workers share through publish_event
+        self.on_event = on_event
+
+    async def start(self):
+        """Subscribe to the message bus, if one is configured"""
+        if self.message_bus is not None:
+            await self.message_bus.start(self.worker_id, self._handle_bus_message)
+            self._presence_task = asyncio.create_task(self._refresh_presence_periodically())
+
+    async def _refresh_presence(self):
+        if self.active_connections:
+            await self.message_bus.refresh_presence(list(self.active_connections), self.worker_id)
+
+    async def _refresh_presence_periodically(self):
+        while True:
+            await asyncio.sleep(self.presence_refresh_interval)
+            try:
+                await self._refresh_presence()
+            except Exception as e:
+                logger.error(f"Failed to refresh presence: {e}")
+
+    async def stop(self):
+        """Release presence for local users and leave the message bus"""
+        if self._presence_task is not None:
+            self._presence_task.cancel()
+            self._presence_task = None
+        if self.message_bus is not None:
+            for user_id in list(self.active_connections):
+                await self.message_bus.clear_presence(user_id, self.worker_id)
+            await self.message_bus.stop()
+
+    async def _publish(self, channel: str, kind: str, message_type: str, payload: str, **extra) -> int:
+        """Publish an already serialized message to other workers"""
+        envelope = {
+            "origin": self.worker_id,
+            "kind": kind,
+            "type": message_type,
+            "payload": payload,
+            **extra
+        }
+        try:
+            return await self.message_bus.publish(channel, envelope)
+        except Exception as e:
+            logger.error(f"Failed to publish {message_type} to {channel}: {e}")
+            return 0
+
+    async def _handle_bus_message(self, envelope: Dict[str, Any]):
+        """Deliver a message published by another worker to local sockets"""
+        if envelope.get("origin") == self.worker_id:
+            return
+        kind = envelope.get("kind")
+        payload = envelope["payload"]
+        message_type = envelope.get("type", "unknown")
+        if kind == "users":
+            self._fan_out_payload(self.active_connections, payload, message_type)
+        elif kind == "counselors":
+            self._fan_out_payload(self.counselor_connections, payload, message_type)
+        elif kind == "event":
+            if self.on_event:
+                self.on_event(message_type, json.loads(payload))
+        elif kind == "direct":
+            for user_id in envelope.get("user_ids", []):
+                connection = self.active_connections.get(user_id)
+                if connection is not None:
+                    connection.enqueue(payload, message_type)
+
+    async def publish_event(self, name: str, data: Any) -> None:
+        """Share a non-socket event with the other workers (no-op without a message bus)"""
+        if self.message_bus is not None:
+            await self._publish(BROADCAST_CHANNEL, "event", name, json.dumps(data))
+
+    async def _broadcast(self, connections: Dict[str, OutboundConnection], kind: str, message: Dict[str, Any]) -> Dict[str, int]:
+        """Fan out to local connections and publish once for every other worker"""
+        payload = json.dumps(message)
+        message_type = message.get('type', 'unknown')
+        result = self._fan_out_payload(connections, payload, message_type)
+        if self.message_bus is not None:
+            # The publishing worker is subscribed too, so don't count it
+            result['remote_workers'] = max(await self._publish(BROADCAST_CHANNEL, kind, message_type, payload) - 1, 0)
+        return result
+
+    async def _send_to_users(self, user_ids: List[str], message: Dict[str, Any]) -> Dict[str, int]:
+        """Queue message for the given users, routing remote ones to their worker"""
+        payload = json.dumps(message)
+        message_type = message.get('type', 'unknown')
+        local = {}
+        remote = []
+        for user_id in user_ids:
+            connection = self.active_connections.get(user_id)
+            if connection is not None:
+                local[user_id] = connection
+            else:
+                remote.append(user_id)
+
+        result = self._fan_out_payload(local, payload, message_type)
+        result['routed'] = 0
+        if remote and self.message_bus is not None:
+            owners = await self.message_bus.get_presence(remote)
+            by_worker: Dict[str, List[str]] = {}
+            for user_id, owner in owners.items():
+                if owner != self.worker_id:
+                    by_worker.setdefault(owner, []).append(user_id)
+            for owner, owned_user_ids in by_worker.items():
+                if await self._publish(worker_channel(owner), "direct", message_type, payload, user_ids=owned_user_ids):
+                    result['routed'] += len(owned_user_ids)
+        return result
+
+    async def _open_connection(self, websocket: WebSocket, connection_id: str, connections: Dict[str, OutboundConnection], slots: asyncio.Semaphore) -> OutboundConnection:
+        """Register a connection, start its writer task and queue what its predecessor left undelivered"""
+        undelivered = self.undelivered if connections is self.active_connections else self.undelivered_counselor
+
+        def on_undelivered(connection: OutboundConnection, messages: List[Tuple[str, str]]):
+            messages = [message for message in messages if message[0] not in REPLAYED_TYPES]
+            current = connections.get(connection_id)
+            if current is not None and current is not connection and not current.closed:
+                # Already reconnected
+                for message_type, payload in messages:
+                    current.enqueue(payload, message_type)
+            else:
+                undelivered.setdefault(connection_id, deque(maxlen=MAX_UNDELIVERED)).extend(messages)
+
+        async def on_close(connection: OutboundConnection):
+            # Dead or evicted: forget it unless the user has reconnected meanwhile
+            if connections.get(connection_id) is connection:
+                del connections[connection_id]
+                self.dropped_connections += 1
+                if connections is self.active_connections:
+                    if self.on_presence:
+                        self.on_presence(connection_id, False)
+                    # Otherwise other workers keep routing the user's messages here
+                    if self.message_bus is not None:
+                        try:
+                            await self.message_bus.clear_presence(connection_id, self.worker_id)
+                        except Exception as e:
+                            logger.error(f"Failed to clear presence of {connection_id}: {e}")
+                logger.info(f"Dropped WebSocket connection for {connection_id}")
+
+        connection = OutboundConnection(
+            websocket,
+            connection_id,
+            on_close,
+            send_slots=slots,
+            max_queue_size=self.max_queue_size,
+            send_timeout=self.send_timeout,
+            on_undelivered=on_undelivered
+        )
+        previous = connections.get(connection_id)
+        connections[connection_id] = connection
+        connection.start()
+        if previous is not None:
+            await previous.close()
+        held = undelivered.pop(connection_id, None)
+        if held:
+            task = asyncio.create_task(self._redeliver(connection, undelivered, held))
+            self._redeliveries.add(task)
+            task.add_done_callback(self._redeliveries.discard)
+        return connection
+
+    async def _redeliver(self, connection: OutboundConnection, undelivered: Dict[str, Deque[Tuple[str, str]]],
+                         held: Deque[Tuple[str, str]]):
+        """Queue held messages on a new connection as its queue has room"""
+        while held:
+            if not await connection.wait_for_room():
+                # Closed again: keep the rest for the next connect
+                undelivered.setdefault(connection.connection_id, deque(maxlen=MAX_UNDELIVERED)).extendleft(reversed(held))
+                return
+            message_type, payload = held.popleft()
+            connection.enqueue(payload, message_type)
+
+    async def _close_connection(self, connection_id: str, connections: Dict[str, OutboundConnection], websocket: Optional[WebSocket] = None) -> bool:
+        """Remove a connection, optionally only if it still belongs to `websocket`"""
+        connection = connections.get(connection_id)
+        if connection is None or (websocket is not None and connection.websocket is not websocket):
+            return False
+        del connections[connection_id]
+        await connection.close()
+        return True
+
+    def _fan_out(self, connections: Dict[str, OutboundConnection], message: Dict[str, Any]) -> Dict[str, int]:
+        """Serialize message once and queue it on every connection.
+
+        Each connection's writer task does the actual sending, so this never
+        waits on a client. Returns how many copies were queued or dropped.
+        """
+        return self._fan_out_payload(connections, json.dumps(message), message.get('type', 'unknown'))
+
+    def _fan_out_payload(self, connections: Dict[str, OutboundConnection], payload: str, message_type: str) -> Dict[str, int]:
+        result = {'queued': 0, 'dropped': 0}
+        for connection in list(connections.values()):
+            if connection.enqueue(payload, message_type):
+                result['queued'] += 1
+            else:
+                result['dropped'] += 1
+        return result
 
     async def connect(self, websocket: WebSocket, user_id: str):
         """Accept websocket connection and store it"""
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        await self._open_connection(websocket, user_id, self.active_connections, self._send_slots)
+        if self.on_presence:
+            self.on_presence(user_id, True)
+        if self.message_bus is not None:
+            await self.message_bus.set_presence(user_id, self.worker_id)
         logger.info(f"User {user_id} connected via WebSocket")
 
-    async def disconnect(self, user_id: str):
+    async def disconnect(self, user_id: str, websocket: Optional[WebSocket] = None):
         """Remove websocket connection"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+        if await self._close_connection(user_id, self.active_connections, websocket):
+            if self.on_presence:
+                self.on_presence(user_id, False)
+            if self.message_bus is not None:
+                await self.message_bus.clear_presence(user_id, self.worker_id)
             logger.info(f"User {user_id} disconnected from WebSocket")
 
-    async def send_to_user(self, user_id: str, message: Dict[str, Any]):
-        """Send message to specific user"""
-        if user_id in self.active_connections:
-            try:
-                websocket = self.active_connections[user_id]
-                await websocket.send_text(json.dumps(message))
-                logger.debug(f"Sent message to user {user_id}: {message.get('type', 'unknown')}")
-            except Exception as e:
-                logger.error(f"Failed to send message to user {user_id}: {e}")
-                # Remove dead connection
-                await self.disconnect(user_id)
+    async def wait_for_room(self, user_id: str, slots: int = 1) -> bool:
+        """Wait until the user's local outbound queue has room for `slots` messages; False if not connected here"""
+        connection = self.active_connections.get(user_id)
+        return connection is not None and await connection.wait_for_room(slots)
+
+    async def send_to_user(self, user_id: str, message: Dict[str, Any]) -> bool:
+        """Queue message for a specific user without waiting for delivery"""
+        result = await self._send_to_users([user_id], message)
+        logger.debug(f"Queued message for user {user_id}: {message.get('type', 'unknown')}")
+        return result['queued'] + result['routed'] > 0
 
-    async def broadcast_to_all(self, message: Dict[str, Any]):
+    async def broadcast_to_all(self, message: Dict[str, Any]) -> Dict[str, int]:
         """Broadcast message to all connected users"""
-        disconnected_users = []
-        
-        for user_id, websocket in self.active_connections.items():
-            try:
-                await websocket.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Failed to send broadcast to user {user_id}: {e}")
-                disconnected_users.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            await self.disconnect(user_id)
+        return await self._broadcast(self.active_connections, "users", message)
 
-    async def broadcast_to_counselors(self, message: Dict[str, Any]):
+    async def broadcast_to_counselors(self, message: Dict[str, Any]) -> Dict[str, int]:
         """Send message to all connected counselors"""
-        disconnected_counselors = []
-        
-        for counselor_id, websocket in self.counselor_connections.items():
-            try:
-                await websocket.send_text(json.dumps(message))
-                logger.info(f"Alert sent to counselor {counselor_id}")
-            except Exception as e:
-                logger.error(f"Failed to send alert to counselor {counselor_id}: {e}")
-                disconnected_counselors.append(counselor_id)
-        
-        # Clean up disconnected counselors
-        for counselor_id in disconnected_counselors:
-            if counselor_id in self.counselor_connections:
-                del self.counselor_connections[counselor_id]
+        result = await self._broadcast(self.counselor_connections, "counselors", message)
+        logger.info(f"Alert queued for {result['queued']} local counselors")
+        return result
 
     async def send_bulk_notification(self, message: str, target_group: str = "all") -> Dict[str, int]:
         """Send bulk notification to specified group"""
@@ -76,32 +289,28 @@ class WebSocketManager:
             "timestamp": "2024-01-01T00:00:00Z"  # Would use real timestamp
         }
         
-        count = 0
+        result = {'queued': 0, 'dropped': 0}
         
         if target_group == "all":
-            await self.broadcast_to_all(notification)
-            count = len(self.active_connections)
+            result = await self.broadcast_to_all(notification)
         elif target_group == "counselors":
-            await self.broadcast_to_counselors(notification)
-            count = len(self.counselor_connections)
+            result = await self.broadcast_to_counselors(notification)
         elif target_group == "at_risk":
             # Would implement logic to identify at-risk users
             # For now, send to all
-            await self.broadcast_to_all(notification)
-            count = len(self.active_connections)
+            result = await self.broadcast_to_all(notification)
         
-        return {"count": count}
+        return {"count": result["queued"], **result}
 
     async def connect_counselor(self, websocket: WebSocket, counselor_id: str):
         """Connect a counselor for crisis alerts"""
         await websocket.accept()
-        self.counselor_connections[counselor_id] = websocket
+        await self._open_connection(websocket, counselor_id, self.counselor_connections, self._counselor_send_slots)
         logger.info(f"Counselor {counselor_id} connected for crisis monitoring")
 
-    async def disconnect_counselor(self, counselor_id: str):
+    async def disconnect_counselor(self, counselor_id: str, websocket: Optional[WebSocket] = None):
         """Disconnect a counselor"""
-        if counselor_id in self.counselor_connections:
-            del self.counselor_connections[counselor_id]
+        if await self._close_connection(counselor_id, self.counselor_connections, websocket):
             logger.info(f"Counselor {counselor_id} disconnected")
 
     async def send_intervention_notification(self, user_id: str, intervention: Dict[str, Any]):
@@ -125,7 +334,7 @@ class WebSocketManager:
         }
         await self.send_to_user(recipient_id, message)
 
-    async def send_group_activity_notification(self, group_members: List[str], activity: Dict[str, Any]):
+    async def send_group_activity_notification(self, group_members: List[str], activity: Dict[str, Any]) -> Dict[str, int]:
         """Send notification about group activity"""
         message = {
             "type": "group_activity",
@@ -133,8 +342,17 @@ class WebSocketManager:
             "timestamp": "2024-01-01T00:00:00Z"
         }
         
-        for member_id in group_members:
-            await self.send_to_user(member_id, message)
+        return await self._send_to_users(group_members, message)
+
+    async def send_to_group(self, member_ids: Iterable[str], online_ids: Iterable[str], message: Dict[str, Any]) -> Dict[str, int]:
+        """Fan a message out to a group's online members.
+
+        Without a message bus every online member is local, so only they are
+        targeted. With one, `online_ids` only covers this worker; all members
+        are routed by presence and offline ones are skipped there.
+        """
+        targets = online_ids if self.message_bus is None else member_ids
+        return await self._send_to_users(list(targets), message)
 
     async def send_wellness_reminder(self, user_id: str, reminder_type: str, content: str):
         """Send wellness reminder to user"""
@@ -150,40 +368,34 @@ class WebSocketManager:
 
     async def get_connection_stats(self) -> Dict[str, int]:
         """Get statistics about active connections"""
+        connections = list(self.active_connections.values()) + list(self.counselor_connections.values())
         return {
             "total_connections": len(self.active_connections),
             "counselor_connections": len(self.counselor_connections),
             "active_users": len(self.active_connections),
-            "total_capacity": 1000  # Mock capacity limit
+            "total_capacity": 1000,  # Mock capacity limit
+            "queued_messages": sum(connection.queue_length for connection in connections),
+            "sent_messages": sum(connection.stats["sent"] for connection in connections),
+            "dropped_messages": sum(connection.stats["dropped"] for connection in connections),
+            "timed_out_sends": sum(connection.stats["timed_out"] for connection in connections),
+            "dropped_connections": self.dropped_connections,
+            "undelivered_messages": sum(len(held) for held in self.undelivered.values())
+                                    + sum(len(held) for held in self.undelivered_counselor.values())
         }
 
-    async def ping_all_connections(self):
+    async def ping_all_connections(self) -> Dict[str, Dict[str, int]]:
         """Send ping to all connections to check if they're still alive"""
         ping_message = {
             "type": "ping",
             "timestamp": "2024-01-01T00:00:00Z"
         }
         
-        # Ping regular users
-        disconnected_users = []
-        for user_id, websocket in self.active_connections.items():
-            try:
-                await websocket.send_text(json.dumps(ping_message))
-            except Exception:
-                disconnected_users.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            await self.disconnect(user_id)
+        # Refresh presence so long-lived connections keep routing to this worker
+        if self.message_bus is not None:
+            await self._refresh_presence()
         
-        # Ping counselors
-        disconnected_counselors = []
-        for counselor_id, websocket in self.counselor_connections.items():
-            try:
-                await websocket.send_text(json.dumps(ping_message))
-            except Exception:
-                disconnected_counselors.append(counselor_id)
-        
-        # Clean up disconnected counselors
-        for counselor_id in disconnected_counselors:
-            await self.disconnect_counselor(counselor_id)
\ No newline at end of file
+        # Queue pings on this worker's sockets; connections whose writer fails are dropped automatically
+        return {
+            "users": self._fan_out(self.active_connections, ping_message),
+            "counselors": self._fan_out(self.counselor_connections, ping_message)
+        }
\ No newline at end of file
@@ -17,6 +17,14 @@ class MindfulCampusMonitor {
       negative: ['sad', 'depressed', 'anxious', 'worried', 'stressed', 'hate', 'terrible', 'awful', 'horrible', 'devastated'],
       stress: ['overwhelmed', 'pressure', 'deadline', 'exam', 'finals', 'study', 'homework', 'project', 'assignment', 'busy']
     };
+    // Text snippets waiting to be sent to /emotions/analyze-batch
+    this.pendingTexts = [];
+    this.analysisBatchSize = 20;
+    this.analysisFlushDelay = 3000;
+    this.analysisFlushTimer = null;
+    // Last known settings, so the flush on page unload can send without
+    // waiting on chrome.storage
+    this.settings = null;
     
     this.init();
   }
@@ -24,6 +32,10 @@ class MindfulCampusMonitor {
   async init() {
     // Check if user is logged in and extension is enabled
     const settings = await this.getSettings();
+    this.settings = settings;
+    chrome.storage.onChanged.addListener(async () => {
+      this.settings = await this.getSettings();
+    });
     if (!settings.enabled) return;
 
     this.setupEventListeners();
@@ -166,28 +178,43 @@ class MindfulCampusMonitor {
     return { label, confidence };
   }
 
-  async sendTextForAnalysis(text, sentiment) {
-    const settings = await this.getSettings();
-    if (!settings.apiToken) return;
+  sendTextForAnalysis(text, sentiment) {
+    // Queue snippets and send them together to cut per-request overhead
+    this.pendingTexts.push(text);
 
-    try {
-      await fetch(`${this.apiUrl}/emotions/analyze`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${settings.apiToken}`
-        },
-        body: JSON.stringify({
-          text: text,
-          platform: this.detectPlatform(),
-          timestamp: new Date().toISOString()
-        })
-      });
-    } catch (error) {
-      console.error('Failed to send analysis:', error);
+    if (this.pendingTexts.length >= this.analysisBatchSize) {
+      this.flushTextAnalysis();
+    } else if (!this.analysisFlushTimer) {
+      this.analysisFlushTimer = setTimeout(() => this.flushTextAnalysis(), this.analysisFlushDelay);
     }
   }
 
+  flushTextAnalysis() {
+    clearTimeout(this.analysisFlushTimer);
+    this.analysisFlushTimer = null;
+
+    const texts = this.pendingTexts.splice(0, this.pendingTexts.length);
+    if (texts.length === 0) return;
+
+    // Uses the cached settings and sends synchronously: on beforeunload
+    // nothing runs after an await. keepalive lets the request outlive the page.
+    const settings = this.settings;
+    if (!settings || !settings.apiToken) return;
+
+    const platform = encodeURIComponent(this.detectPlatform());
+    fetch(`${this.apiUrl}/emotions/analyze-batch?platform=${platform}`, {
+      method: 'POST',
+      keepalive: true,
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${settings.apiToken}`
+      },
+      body: JSON.stringify(texts)
+    }).catch((error) => {
+      console.error('Failed to send analysis:', error);
+    });
+  }
+
   detectPlatform() {
     const hostname = window.location.hostname.toLowerCase();
     if (hostname.includes('facebook')) return 'facebook';
@@ -748,4 +775,5 @@ const dataCollector = new DataCollector();
 // Send session data when user leaves page
 window.addEventListener('beforeunload', () => {
   dataCollector.sendSessionData();
+  window.mindfulCampusMonitor.flushTextAnalysis();
 });